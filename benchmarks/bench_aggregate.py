@@ -0,0 +1,67 @@
+#!/bin/python
+# bench_aggregate.py
+# Vergelijkt travel_aggregate met de oude get_field_total / fiets_dagen
+# (een volledige doorloop per veld) op synthetische tours. 'kolom' doet
+# hetzelfde werk als de oude code (totalen en fietsdagen, een doorloop in
+# from_db), 'summary' ook min/max, gemiddelden en de eerste en laatste dag.
+# Het stats pad (print_stats, get_field_total, fiets_dagen) leest de
+# lopende totalen uit de header, die staan er naast als 'header'.
+#
+# gebruik: python benchmarks/bench_aggregate.py [aantal dagen ...]
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import travel_stats
+import travel_aggregate
+from generate import synthetic_tour
+
+
+def legacy_stats(db):
+    # Zoals print_stats het deed: vier keer get_field_total en fiets_dagen.
+    totals = {}
+    for field in ('afstand', 'eten', 'hotel', 'anders'):
+        total = 0
+        for rec in db:
+            total += db[rec].get(field, 0)
+        totals[field] = total
+    dagen = 0
+    for rec in db:
+        if db[rec].get('afstand'):
+            dagen += 1
+    totals['fietsdagen'] = dagen
+    return totals
+
+
+def column_stats(db):
+    cols = travel_aggregate.Columns.from_db(db)
+    totals = {field: cols.total(field) for field, typecode in travel_aggregate.COLUMNS}
+    totals['fietsdagen'] = cols.fietsdagen()
+    return totals
+
+
+def column_summary(db):
+    return travel_aggregate.Columns.from_db(db).summary()
+
+
+def header_stats(db):
+    return travel_stats.get_totals(db)
+
+
+if __name__ == '__main__':
+    sizes = [int(x) for x in sys.argv[1:]] or [10 ** 4, 10 ** 5, 10 ** 6]
+    print('{:>10} {:>12} {:>12} {:>8} {:>12} {:>12}'.format(
+        'dagen', 'oud (s)', 'kolom (s)', 'factor', 'summary (s)', 'header (s)'))
+    for size in sizes:
+        db = synthetic_tour(size)
+        number = max(1, 10 ** 5 // size)
+
+        def best(func):
+            return min(timeit.repeat(lambda: func(db), number=number, repeat=3)) / number
+        old, new, summary = best(legacy_stats), best(column_stats), best(column_summary)
+        travel_stats.get_totals(db)
+        header = best(header_stats)
+        print('{:>10} {:12.4f} {:12.4f} {:8.2f} {:12.4f} {:12.6f}'.format(
+            size, old, new, old / new, summary, header))
@@ -0,0 +1,66 @@
+#!/bin/python
+# bench_archive.py
+# Schijfruimte en laadtijd van een tour als json, gzip en xz.
+# De laadtijd is gemeten uit de page cache, dus zonder de tijd om de bytes
+# van de schijf te lezen. 'break-even' is de leessnelheid van de schijf
+# (MB/s) waaronder het gecomprimeerde bestand sneller geladen is: de tijd
+# die het decomprimeren extra kost tegen de bytes die niet gelezen hoeven.
+#
+# gebruik: python benchmarks/bench_archive.py [aantal dagen ...]
+
+import os
+import sys
+import time
+import tempfile
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import travel_storage
+from generate import synthetic_tour
+
+REPEAT = 5
+BACKENDS = ('json', 'gzip', 'xz')
+
+
+def load_time(storage):
+    # mediaan van REPEAT keer laden, in seconden
+    times = []
+    for i in range(REPEAT):
+        start = time.perf_counter()
+        storage.load()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def bench(size, traveldir):
+    ''' Grootte en laadtijd per backend.
+
+    returns dict: backend: (bytes, seconden laden, seconden opslaan)
+    '''
+    db = synthetic_tour(size)
+    results = {}
+    for backend in BACKENDS:
+        storage = travel_storage.BACKENDS[backend]('bench', traveldir)
+        start = time.perf_counter()
+        storage.save(db)
+        save = time.perf_counter() - start
+        results[backend] = (os.path.getsize(storage.path), load_time(storage), save)
+        os.remove(storage.path)
+    return results
+
+
+if __name__ == '__main__':
+    sizes = [int(x) for x in sys.argv[1:]] or [10 ** 4, 10 ** 5]
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as traveldir:
+            results = bench(size, traveldir)
+        plain, plainLoad, plainSave = results['json']
+        print('{} dagen (laden: mediaan van {})'.format(size, REPEAT))
+        print('{:6} {:>10} {:>8} {:>10} {:>10} {:>14}'.format(
+            '', 'kB', 'ratio', 'ms laden', 'ms opslaan', 'break-even MB/s'))
+        for backend, (nbytes, load, save) in results.items():
+            extra = load - plainLoad
+            even = (plain - nbytes) / extra / 1e6 if extra > 0 else float('inf')
+            print('{:6} {:10} {:8.2f} {:10.1f} {:10.1f} {:>14}'.format(
+                backend, nbytes // 1024, plain / nbytes, load * 1000, save * 1000,
+                '-' if backend == 'json' else '{:.0f}'.format(even)))
@@ -0,0 +1,44 @@
+#!/bin/python
+# bench_decode.py
+# Laadtijd van een tour: json.load met object_hook=from_json (oud)
+# tegenover een gewone json.load en decode_tour (alleen de header).
+#
+# gebruik: python benchmarks/bench_decode.py [aantal dagen ...]
+
+import os
+import sys
+import json
+import timeit
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import json_serializer
+from generate import synthetic_tour
+
+
+def load_hook(path):
+    with open(path, 'r', encoding='utf-8') as infile:
+        return json.load(infile, object_hook=json_serializer.from_json)
+
+
+def load_schema(path):
+    with open(path, 'r', encoding='utf-8') as infile:
+        return json_serializer.decode_tour(json.load(infile))
+
+
+if __name__ == '__main__':
+    sizes = [int(x) for x in sys.argv[1:]] or [10 ** 4, 10 ** 5, 10 ** 6]
+    print('{:>10} {:>12} {:>12} {:>8}'.format('dagen', 'hook (s)', 'schema (s)', 'factor'))
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.json')
+        for size in sizes:
+            db = synthetic_tour(size)
+            with open(path, 'w', encoding='utf-8') as outfile:
+                json.dump(db, outfile, default=json_serializer.to_json)
+            assert load_hook(path) == load_schema(path)
+            del db
+            number = max(1, 10 ** 5 // size)
+            old = min(timeit.repeat(lambda: load_hook(path), number=number, repeat=3))
+            new = min(timeit.repeat(lambda: load_schema(path), number=number, repeat=3))
+            print('{:>10} {:12.4f} {:12.4f} {:8.2f}'.format(
+                size, old / number, new / number, old / new))
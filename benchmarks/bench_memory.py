@@ -0,0 +1,74 @@
+#!/bin/python
+# bench_memory.py
+# Geheugen van een geladen tour: record dicts tegenover travel_model (Day met
+# __slots__). Meet het geheugen na laden (tracemalloc), de piek tijdens het
+# laden, het aantal garbage collections tijdens het laden en de duur van een
+# volledige gc.collect() met de tour in het geheugen. Day objecten blijven
+# in de gc (dicts met alleen getallen en strings niet), daarom ook de meting
+# met gc.freeze() na het laden, zoals de daemon doet.
+# De travel_model cijfers gelden voor de daemon (en TravelDB). De CLI laadt
+# met travel.open_tour record dicts, daarvoor geldt de regel 'dict'.
+#
+# gebruik: python benchmarks/bench_memory.py [aantal dagen ...]
+
+import gc
+import os
+import sys
+import time
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import travel_model
+import travel_storage
+from generate import synthetic_tour
+
+
+def measure(load, freeze=False):
+    ''' Geheugen en gc bij het laden van een tour.
+
+    keyword arguments:
+    load: functie(): laadt de tour
+    freeze: bool: gc.freeze() na het laden
+
+    returns tuple: (KB na laden, KB piek, aantal collections, ms gc.collect)
+    '''
+    gc.collect()
+    before = sum(stat['collections'] for stat in gc.get_stats())
+    tracemalloc.start()
+    tour = load()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    collections = sum(stat['collections'] for stat in gc.get_stats()) - before
+    if freeze:
+        gc.freeze()
+    start = time.perf_counter()
+    gc.collect()
+    seconds = time.perf_counter() - start
+    gc.unfreeze()
+    del tour
+    return current // 1024, peak // 1024, collections, seconds * 1000
+
+
+def bench(size, traveldir):
+    db = synthetic_tour(size)
+    travel_storage.get_storage('bench', traveldir).save(db)
+    del db
+    return {'dict': measure(
+                lambda: travel_storage.get_storage('bench', traveldir).load()),
+            'travel_model': measure(
+                lambda: travel_model.Tour.load('bench', traveldir)),
+            'model + freeze': measure(
+                lambda: travel_model.Tour.load('bench', traveldir), True)}
+
+
+if __name__ == '__main__':
+    sizes = [int(x) for x in sys.argv[1:]] or [10 ** 4, 10 ** 5]
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as traveldir:
+            results = bench(size, traveldir)
+        print('{} dagen'.format(size))
+        print('{:14} {:>12} {:>12} {:>12} {:>12}'.format(
+            '', 'KB geladen', 'KB piek', 'gc runs', 'ms collect'))
+        for name, result in results.items():
+            print('{:14} {:12} {:12} {:12} {:12.2f}'.format(name, *result))
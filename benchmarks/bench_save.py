@@ -0,0 +1,80 @@
+#!/bin/python
+# bench_save.py
+# Prompt tot prompt latency van opslaan op grote tours.
+# Meet hoe lang save_tour de prompt vasthoudt bij een dag toevoegen (journal)
+# en bij het schrijven van de hele tour, direct en met write-behind, met en
+# zonder fsync. Bij write-behind staat ook de tijd die daarna nog op de
+# worker gewacht wordt (bij het afsluiten).
+#
+# gebruik: python benchmarks/bench_save.py [aantal dagen ...]
+
+import os
+import sys
+import time
+import datetime
+import tempfile
+import statistics
+import contextlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import travel
+import travel_io
+import travel_stats
+from generate import synthetic_tour
+
+REPEAT = 5
+MODES = (('direct', False, False), ('direct fsync', False, True),
+         ('write-behind', True, False), ('write-behind fsync', True, True))
+
+
+def latency(db, traveldir, changed):
+    ''' Mediaan van de tijd tot save_tour terugkomt en van het wachten
+    op de worker daarna.
+
+    returns tuple: (seconden prompt, seconden wachten)
+    '''
+    prompt = []
+    waits = []
+    day = datetime.date.fromisoformat(max(k for k in db if k != 'tour'))
+    for i in range(REPEAT):
+        key = None
+        if changed:
+            day += datetime.timedelta(days=1)
+            key = day.isoformat()
+            db[key] = {'naar': 'extra', 'afstand': 50, 'eten': 9.5}
+            travel_stats.update_totals(db, None, db[key])
+        start = time.perf_counter()
+        travel.save_tour(db, traveldir, False, [key] if key else None)
+        prompt.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        travel_io.wait()
+        waits.append(time.perf_counter() - start)
+    return statistics.median(prompt), statistics.median(waits)
+
+
+def bench(size, traveldir):
+    db = synthetic_tour(size)
+    db['tour']['naam'] = 'bench'
+    results = {}
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        travel.save_tour(db, traveldir, False)
+        for name, writeBehind, fsync in MODES:
+            travel_io.WRITE_BEHIND = writeBehind
+            travel_io.FSYNC = fsync
+            results[name] = {'dag': latency(db, traveldir, True),
+                             'hele tour': latency(db, traveldir, False)}
+    travel_io.WRITE_BEHIND = travel_io.FSYNC = False
+    return results
+
+
+if __name__ == '__main__':
+    sizes = [int(x) for x in sys.argv[1:]] or [10 ** 4, 10 ** 5]
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as traveldir:
+            results = bench(size, traveldir)
+        print('{} dagen (ms, mediaan van {})'.format(size, REPEAT))
+        print('{:20} {:>10} {:>10} {:>12} {:>12}'.format(
+            '', 'dag', 'wachten', 'hele tour', 'wachten'))
+        for name, result in results.items():
+            print('{:20} {:10.2f} {:10.2f} {:12.2f} {:12.2f}'.format(
+                name, *[ms * 1000 for ms in result['dag'] + result['hele tour']]))
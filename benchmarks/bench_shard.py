@@ -0,0 +1,70 @@
+#!/bin/python
+# bench_shard.py
+# Latency van een dag toevoegen (openen, toevoegen, opslaan) bij een groeiende
+# tour zonder eind: de hele tour als json (met journal) tegenover shards per
+# jaar en per maand (travel_shard), die alleen de nieuwste shard laden.
+#
+# gebruik: python benchmarks/bench_shard.py [aantal dagen ...]
+
+import os
+import sys
+import time
+import datetime
+import tempfile
+import statistics
+import contextlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import travel
+import travel_shard
+import travel_stats
+import travel_storage
+from generate import synthetic_tour
+
+REPEAT = 5
+MODES = (('json', 'json', None), ('shards per jaar', 'sharded', 'year'),
+         ('shards per maand', 'sharded', 'month'))
+
+
+def add_latency(traveldir, backend):
+    ''' Mediaan van openen + een dag toevoegen + opslaan, zoals travel zonder
+    opties dat doet.
+
+    returns float: seconden
+    '''
+    times = []
+    for i in range(REPEAT):
+        start = time.perf_counter()
+        db = travel.open_tour('bench', traveldir, backend, days=[])
+        key = db['tour']['nieuw_record']
+        db[key.isoformat()] = {'naar': 'extra', 'afstand': 50, 'eten': 9.5}
+        travel_stats.update_totals(db, None, db[key.isoformat()])
+        db['tour']['nieuw_record'] = key + datetime.timedelta(days=1)
+        travel.save_tour(db, traveldir, False, [key.isoformat()], backend,
+                         {key.isoformat(): None})
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def bench(size):
+    results = {}
+    db = synthetic_tour(size)
+    db['tour']['eind_datum'] = datetime.date(9999, 12, 31)
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for name, backend, period in MODES:
+            with tempfile.TemporaryDirectory() as traveldir:
+                travel_shard.PERIOD = period or 'year'
+                travel_storage.BACKENDS[backend]('bench', traveldir).save(dict(db))
+                travel.save_tour(travel.open_tour('bench', traveldir), traveldir, False)
+                results[name] = add_latency(traveldir, backend)
+    return results
+
+
+if __name__ == '__main__':
+    sizes = [int(x) for x in sys.argv[1:]] or [10 ** 3, 10 ** 4, 10 ** 5]
+    print('{:>8} '.format('dagen') + ' '.join('{:>18}'.format(name)
+                                           for name, backend, period in MODES))
+    for size in sizes:
+        results = bench(size)
+        print('{:8} '.format(size) + ' '.join('{:15.2f} ms'.format(results[name] * 1000)
+                                            for name, backend, period in MODES))
@@ -0,0 +1,94 @@
+#!/bin/python
+# bench_startup.py
+# Bewaakt de opstarttijd van travel.py met python -X importtime.
+# Meet per commando de totale import tijd en controleert dat zware
+# modules niet geladen worden door goedkope commando's.
+#
+# gebruik: python benchmarks/bench_startup.py [factor voor het budget]
+# exit code 1 als een commando over het budget gaat of een verboden
+# module laadt.
+
+import os
+import sys
+import subprocess
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TRAVEL = os.path.join(ROOT, 'travel.py')
+
+# import budget in milliseconden per commando (alleen modules van travel
+# zelf en de stdlib modules die ze laden, zonder de interpreter start)
+BUDGET_MS = {'--version': 25.0, '--help': 25.0, '--show-tours': 40.0}
+# aantal metingen per commando, de snelste telt
+REPEAT = 5
+
+# commando en modules die het niet mag laden.
+# locale zelf wordt door argparse (gettext) geladen, setlocale wordt pas
+# aangeroepen als er datums geformatteerd worden.
+COMMANDS = (
+    (['--version'], ('json', 'sqlite3', 'concurrent.futures',
+                     'travel_storage', 'json_serializer')),
+    (['--help'], ('json', 'sqlite3', 'concurrent.futures', 'travel_storage')),
+    (['--show-tours'], ('sqlite3', 'concurrent.futures', 'travel_catalog')),
+)
+
+
+def import_times(args, home):
+    ''' Draait travel.py met -X importtime.
+
+    keyword arguments:
+    args: list: argumenten voor travel.py
+    home: string: HOME voor het proces (lege config)
+
+    returns dict: module: cumulatieve import tijd in microseconden.
+                  Geneste imports houden hun inspringing in de naam.
+    '''
+    env = dict(os.environ, HOME=home)
+    proc = subprocess.run([sys.executable, '-X', 'importtime', TRAVEL] + args,
+                          env=env, capture_output=True, text=True)
+    times = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative, name = line[len('import time:'):].split('|')
+        times[name.rstrip()[1:]] = int(cumulative)
+    return times
+
+
+def baseline(home):
+    # modules die de interpreter zelf al laadt (python -c pass)
+    env = dict(os.environ, HOME=home)
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'pass'],
+                          env=env, capture_output=True, text=True)
+    return {line.split('|')[-1].strip() for line in proc.stderr.splitlines()
+            if line.startswith('import time:') and 'cumulative' not in line}
+
+
+def toplevel(times):
+    # importtime springt in per niveau, alleen de bovenste tellen
+    return {name: us for name, us in times.items() if not name.startswith(' ')}
+
+
+if __name__ == '__main__':
+    factor = float(sys.argv[1]) if len(sys.argv) > 1 else 1.0
+    failed = False
+    with tempfile.TemporaryDirectory() as home:
+        os.makedirs(os.path.join(home, '.config'))
+        startup = baseline(home)
+        for args, forbidden in COMMANDS:
+            budget = BUDGET_MS[args[0]] * factor
+            total = None
+            for i in range(REPEAT):
+                times = import_times(args, home)
+                ms = sum(us for name, us in toplevel(times).items()
+                         if name not in startup) / 1000
+                total = ms if total is None else min(total, ms)
+            loaded = {name.strip() for name in times}
+            bad = sorted(set(forbidden) & loaded)
+            status = 'ok'
+            if total > budget or bad:
+                status = 'TE TRAAG' if total > budget else 'FOUT'
+                failed = True
+            print('{:15} {:8.1f} ms  {:8}{}'.format(' '.join(args), total, status,
+                  '  laadt: ' + ', '.join(bad) if bad else ''))
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,61 @@
+#!/bin/python
+# bench_storage.py
+# Vergelijkt de backends van travel_storage (json, sqlite, binary):
+# grootte, laden, header lezen, een dag toevoegen, een week lezen en
+# totalen berekenen.
+#
+# gebruik: python benchmarks/bench_storage.py [aantal dagen ...]
+
+import os
+import sys
+import time
+import datetime
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import travel_storage
+from generate import synthetic_tour
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    if hasattr(result, '__next__'):
+        # generators leeglezen
+        result = list(result)
+    return time.perf_counter() - start
+
+
+def bench(size, traveldir):
+    db = synthetic_tour(size)
+    db['tour']['naam'] = 'bench'
+    last = datetime.date.fromisoformat(max(k for k in db if k != 'tour'))
+    week = (last - datetime.timedelta(days=6), last)
+    results = {}
+    for name, backend in travel_storage.BACKENDS.items():
+        storage = backend('bench', traveldir)
+        storage.save(db)
+        new = (last + datetime.timedelta(days=1)).isoformat()
+        db[new] = {'naar': 'extra', 'afstand': 50}
+        results[name] = {
+            'schijf (MB)': os.path.getsize(storage.path) / 2 ** 20,
+            'laden (s)': timed(storage.load),
+            'header (s)': timed(storage.header),
+            'dag toevoegen (s)': timed(storage.save, db, [new]),
+            'week lezen (s)': timed(storage.records, *week),
+            'totalen (s)': timed(storage.totals),
+        }
+        del db[new]
+    return results
+
+
+if __name__ == '__main__':
+    sizes = [int(x) for x in sys.argv[1:]] or [10 ** 4, 10 ** 5]
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as traveldir:
+            results = bench(size, traveldir)
+        print('{} dagen'.format(size))
+        print('{:>20}'.format('') + ''.join('{:>12}'.format(n) for n in results))
+        for metric in results['json']:
+            print('{:>20}'.format(metric) +
+                  ''.join('{:12.4f}'.format(r[metric]) for r in results.values()))
@@ -0,0 +1,74 @@
+#!/bin/python
+# bench_sync.py
+# Tijd van travel --sync tussen twee datadirs met dezelfde tour: zonder
+# verschil, en met een gewijzigde dag aan een kant. Daarnaast de grootte van
+# de tour, wat zonder sync gekopieerd moet worden, en het aantal overgezette
+# dagen. Gemeten als json en als shards per jaar; een json tour wordt voor
+# het overzetten aan beide kanten helemaal geladen.
+#
+# gebruik: python benchmarks/bench_sync.py [aantal dagen ...]
+
+import os
+import sys
+import time
+import tempfile
+import statistics
+import contextlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import travel
+import travel_sync
+import travel_stats
+import travel_storage
+from generate import synthetic_tour
+
+REPEAT = 5
+BACKENDS = ('json', 'sharded')
+
+
+def edit(traveldir, key, i):
+    # een dag wijzigen zoals travel -e dat doet
+    db = travel.open_tour('bench', traveldir, days=[key])
+    old = db[key]
+    new = dict(old, opmerkingen='wijziging {}'.format(i))
+    travel_stats.update_totals(db, old, new)
+    db[key] = new
+    travel.write_tour(db, traveldir, [key], bases={key: old.get('versie', 0)})
+
+
+def bench(size, backend):
+    ''' Mediaan van sync zonder verschil en sync met een gewijzigde dag.
+
+    returns tuple: (seconden, seconden, bytes van de tour, overgezette dagen)
+    '''
+    db = synthetic_tour(size)
+    travel_stats.get_totals(db)
+    with tempfile.TemporaryDirectory() as here, tempfile.TemporaryDirectory() as there:
+        travel_storage.BACKENDS[backend]('bench', here).save(dict(db))
+        travel.write_tour(travel.open_tour('bench', here), here)
+        travel_sync.sync(here, there, travel.write_tour)
+        travel_sync.sync(here, there, travel.write_tour)
+        key = max(k for k in db if k != 'tour')
+        same, one = [], []
+        for i in range(REPEAT):
+            start = time.perf_counter()
+            travel_sync.sync(here, there, travel.write_tour)
+            same.append(time.perf_counter() - start)
+            edit(here, key, i)
+            start = time.perf_counter()
+            days = len(travel_sync.sync(here, there, travel.write_tour))
+            one.append(time.perf_counter() - start)
+        nbytes = travel_storage.files_size(travel_storage.get_storage('bench', here))
+    return statistics.median(same), statistics.median(one), nbytes, days
+
+
+if __name__ == '__main__':
+    sizes = [int(x) for x in sys.argv[1:]] or [3650, 36500]
+    print('{:>8} {:>8} {:>14} {:>14} {:>10} {:>8}'.format(
+        'dagen', 'opslag', 'geen verschil', 'een dag', 'kB tour', 'over'))
+    for size in sizes:
+        for backend in BACKENDS:
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                same, one, nbytes, days = bench(size, backend)
+            print('{:8} {:>8} {:11.2f} ms {:11.2f} ms {:10} {:8}'.format(
+                size, backend, same * 1000, one * 1000, nbytes // 1024, days))
@@ -0,0 +1,76 @@
+#!/bin/python
+# generate.py
+# Deterministische generator van synthetische tours.
+# Schrijft tours in het echte formaat op disk: een header met de
+# json_serializer datum wrappers en een record per dag met een iso datum
+# als key. Zo lezen de benchmarks ook het oude header formaat.
+#
+# gebruik: python benchmarks/generate.py DATADIR [--days N] [--tours N] [--seed N]
+
+import os
+import sys
+import json
+import random
+import argparse
+import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import json_serializer
+
+START = datetime.date(2000, 1, 1)
+PLAATSEN = ['plaats{}'.format(i) for i in range(1000)]
+
+
+def synthetic_tour(dagen, seed=1, name='bench', start=START):
+    ''' Maakt een tour met een record per dag.
+
+    keyword arguments:
+    dagen: int: aantal records
+    seed: int: seed voor de random generator, zelfde seed = zelfde tour
+    name: string: naam vd tour
+    start: date: eerste dag
+
+    returns dict
+    '''
+    rnd = random.Random(seed)
+    eind = start + datetime.timedelta(days=dagen + 29)
+    db = {'tour': {'naam': name, 'version': '2.5', 'omschrijving': 'synthetisch',
+                   'start_datum': start, 'eind_datum': eind,
+                   'nieuw_record': start + datetime.timedelta(days=dagen),
+                   'budget': 50.0 * dagen}}
+    for i in range(dagen):
+        rec = {'naar': rnd.choice(PLAATSEN),
+               'eten': round(rnd.uniform(5, 40), 2)}
+        if rnd.random() < 0.8:
+            rec['afstand'] = rnd.randrange(20, 150)
+            rec['hotel'] = round(rnd.uniform(20, 80), 2)
+        if rnd.random() < 0.3:
+            rec['anders'] = round(rnd.uniform(0, 20), 2)
+        if rnd.random() < 0.1:
+            rec['opmerkingen'] = 'regen en tegenwind'
+        db[(start + datetime.timedelta(days=i)).isoformat()] = rec
+    return db
+
+
+def write_tour(traveldir, name, dagen, seed=1):
+    ''' Schrijft een synthetische tour als <traveldir>/<name>.json.
+
+    returns string: pad van het bestand
+    '''
+    db = synthetic_tour(dagen, seed, name)
+    path = os.path.join(traveldir, name + '.json')
+    with open(path, 'w', encoding='utf-8') as outfile:
+        json.dump(db, outfile, default=json_serializer.to_json)
+    return path
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Schrijf synthetische tours.')
+    parser.add_argument('datadir')
+    parser.add_argument('--days', type=int, default=1000)
+    parser.add_argument('--tours', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    os.makedirs(args.datadir, exist_ok=True)
+    for i in range(args.tours):
+        print(write_tour(args.datadir, 'tour{:04}'.format(i), args.days, args.seed + i))
@@ -0,0 +1,179 @@
+#!/bin/python
+# run.py
+# Benchmark suite voor de hot paths van travel.
+# Genereert tours met generate.py en meet open_tour, save_tour (hele tour
+# en een dag via het journal), print_stats, view_record, get_field_total
+# en --show-tours (met en zonder catalogus) over veel bestanden.
+# De resultaten gaan naar een json bestand dat met een eerdere meting
+# vergeleken kan worden.
+#
+# gebruik:
+#   python benchmarks/run.py [--sizes 1000 10000 ...] [--output result.json]
+#   python benchmarks/run.py --compare oud.json [--threshold 0.2] [--repeat 5]
+# Met --compare is de exit code 1 als een meting meer dan threshold
+# langzamer is dan in oud.json.
+
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import datetime
+import subprocess
+import contextlib
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+import travel
+import travel_catalog
+from generate import write_tour
+
+SIZES = [10 ** 3, 10 ** 4, 10 ** 5]
+# aantal tours voor --show-tours
+TOURS = 200
+TOUR_DAYS = 365
+# aantal metingen per meting, de snelste telt
+REPEAT = 5
+
+
+def best(func, repeat=None):
+    ''' Snelste van een aantal metingen, stdout wordt weggegooid.
+
+    keyword arguments:
+    func: functie zonder argumenten
+    repeat: int: aantal metingen
+
+    returns float: seconden
+    '''
+    times = []
+    repeat = repeat or REPEAT
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for i in range(repeat):
+            start = time.perf_counter()
+            func()
+            times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def bench_size(size, traveldir):
+    ''' Metingen op een tour van size dagen.
+
+    returns dict: meting: seconden
+    '''
+    write_tour(traveldir, 'bench', size)
+    db = travel.open_tour('bench', traveldir)
+    nieuw = db['tour']['nieuw_record']
+
+    def add_day():
+        key = nieuw.isoformat()
+        db[key] = {'naar': 'extra', 'afstand': 50}
+        travel.save_tour(db, traveldir, False, changed=[key])
+
+    results = {
+        'open_tour': best(lambda: travel.open_tour('bench', traveldir)),
+        'save_tour': best(lambda: travel.save_tour(db, traveldir, False)),
+        'save_tour_dag': best(add_day),
+        'print_stats': best(lambda: travel.print_stats(db)),
+        'view_record': best(lambda: travel.view_record(db)),
+        'get_field_total': best(lambda: travel.get_field_total(db, 'eten')),
+    }
+    return results
+
+
+def bench_show_tours(traveldir, tours=TOURS):
+    ''' --show-tours over veel tours, met en zonder catalogus.
+
+    returns dict: meting: seconden
+    '''
+    for i in range(tours):
+        write_tour(traveldir, 'tour{:04}'.format(i), TOUR_DAYS, i)
+
+    def cold():
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(travel_catalog.catalog_file(traveldir))
+        travel.show_tours(traveldir, '', True)
+
+    return {
+        'show_tours': best(lambda: travel.show_tours(traveldir, '')),
+        'show_tours_long_koud': best(cold, 1),
+        'show_tours_long': best(lambda: travel.show_tours(traveldir, '', True)),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                              capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return ''
+
+
+def run(sizes):
+    ''' Draait alle metingen.
+
+    returns dict: meta en results {meting: {dagen: seconden}}
+    '''
+    results = {}
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as traveldir:
+            for name, seconds in bench_size(size, traveldir).items():
+                results.setdefault(name, {})[str(size)] = seconds
+        print(':: {} dagen klaar'.format(size), file=sys.stderr)
+    with tempfile.TemporaryDirectory() as traveldir:
+        for name, seconds in bench_show_tours(traveldir).items():
+            results[name] = {str(TOURS): seconds}
+    return {'meta': {'revision': git_revision(),
+                     'python': platform.python_version(),
+                     'datum': datetime.datetime.now().isoformat(timespec='seconds')},
+            'results': results}
+
+
+def compare(old, new, threshold):
+    ''' Print de verhouding nieuw / oud per meting.
+
+    returns list: metingen die meer dan threshold langzamer zijn
+    '''
+    regressions = []
+    print('{:22} {:>8} {:>11} {:>11} {:>7}'.format('meting', 'n', 'oud (s)',
+                                                   'nieuw (s)', 'factor'))
+    for name, sizes in sorted(new['results'].items()):
+        for size, seconds in sizes.items():
+            before = old['results'].get(name, {}).get(size)
+            if before is None:
+                continue
+            ratio = seconds / before if before else float('inf')
+            flag = ''
+            if ratio > 1 + threshold:
+                flag = '  << langzamer'
+                regressions.append((name, size))
+            print('{:22} {:>8} {:11.5f} {:11.5f} {:7.2f}{}'.format(
+                name, size, before, seconds, ratio, flag))
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarks voor travel.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES)
+    parser.add_argument('--output', default='bench_output.json')
+    parser.add_argument('--compare', metavar='OUD',
+                        help='Vergelijk met een eerdere meting.')
+    parser.add_argument('--threshold', type=float, default=0.2)
+    parser.add_argument('--repeat', type=int, default=REPEAT)
+    args = parser.parse_args()
+    REPEAT = args.repeat
+
+    result = run(args.sizes)
+    with open(args.output, 'w', encoding='utf-8') as outfile:
+        json.dump(result, outfile, indent=2)
+    print(':: Resultaten in {}'.format(args.output), file=sys.stderr)
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as infile:
+            old = json.load(infile)
+        print('vergelijking met {} ({})'.format(args.compare, old['meta'].get('revision')))
+        sys.exit(1 if compare(old, result, args.threshold) else 0)
+    else:
+        for name, sizes in sorted(result['results'].items()):
+            print('{:22} '.format(name) + '  '.join(
+                '{}: {:.5f}'.format(size, s) for size, s in sizes.items()))
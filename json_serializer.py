@@ -3,6 +3,10 @@
 
 import datetime
 
+# Velden van de tour header die een datum bevatten. Andere velden en de
+# dag records bevatten nooit datums.
+DATE_FIELDS = ('start_datum', 'eind_datum', 'nieuw_record')
+
 
 def to_json(python_object):
     ''' Change objects not serializable by json to serializable.
@@ -32,6 +36,71 @@ def from_json(json_object):
     return json_object
 
 
+def to_iso(python_object):
+    ''' Lean alternative for to_json: dates are written as ISO strings.
+    Only valid for fields listed in DATE_FIELDS, see decode_header.
+
+    keyword arguments:
+    python_object: object
+
+    returns str
+    '''
+    if isinstance(python_object, datetime.date):
+        return python_object.isoformat()
+    if hasattr(python_object, 'to_dict'):
+        # Day and Header of travel_model
+        return python_object.to_dict()
+    raise TypeError(repr(python_object) + 'is not JSON serializable!')
+
+
+def decode_date(value):
+    ''' Convert a stored date field back to a date.
+    Accepts ISO strings (to_iso), to_json wrappers and plain ordinals.
+
+    keyword arguments:
+    value: str, dict, int or None
+
+    returns date or None
+    '''
+    if isinstance(value, str):
+        return datetime.date.fromisoformat(value)
+    if isinstance(value, dict):
+        return from_json(value)
+    if isinstance(value, int):
+        # 0 = geen datum (nieuw_record van een oude tour)
+        return datetime.date.fromordinal(value) if value else None
+    return value
+
+
+def decode_header(header):
+    ''' Convert the date fields of a tour header in place.
+    Use after a plain json.load instead of object_hook=from_json, so the
+    daily records are not passed through a hook.
+
+    keyword arguments:
+    header: dict: tour header
+
+    returns dict: the same header
+    '''
+    for field in DATE_FIELDS:
+        if field in header:
+            header[field] = decode_date(header[field])
+    return header
+
+
+def decode_tour(db):
+    ''' Convert the header of a decoded tour document, see decode_header.
+
+    keyword arguments:
+    db: dict: tour as decoded by json.load
+
+    returns dict: the same tour
+    '''
+    if 'tour' in db:
+        decode_header(db['tour'])
+    return db
+
+
 if __name__ == '__main__':
     import json
 
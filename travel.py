@@ -4,16 +4,27 @@
 # database is een dict met datums als key
 # en record dicts als values
 
+# Alleen goedkope modules op module niveau. De rest wordt geimporteerd
+# in de functie die het nodig heeft, zodat --version en andere eenvoudige
+# commando's snel starten. Zie benchmarks/bench_startup.py.
 import os
-import glob
-import json
 import datetime
-import argparse
-import json_serializer
-import locale
-locale.setlocale(locale.LC_ALL, '')
 
-__version__ = '2.5'
+__version__ = '2.6'
+
+_localeSet = False
+
+
+def setup_locale():
+    ''' Zet de locale voor datum formattering, alleen de eerste keer.
+
+    returns None
+    '''
+    global _localeSet
+    if not _localeSet:
+        import locale
+        locale.setlocale(locale.LC_ALL, '')
+        _localeSet = True
 
 
 def open_config(cFile):
@@ -24,8 +35,11 @@ def open_config(cFile):
 
     returns dict
     '''
+    import json
+    import travel_trace
     try:
-        with open(cFile, 'r', encoding='utf-8') as outfile:
+        with travel_trace.span('config'), \
+                open(cFile, 'r', encoding='utf-8') as outfile:
             return json.load(outfile)
     except FileNotFoundError:
         # geen configfile, dus first run
@@ -38,26 +52,33 @@ def open_config(cFile):
                 }
 
 
-def save_config(confData, confFile):
+def save_config(confData, confFile, verbose=True):
     ''' Save het configuratiebestand.
 
     keyword arguments:
     confFile: string: pad en naam van configuratie bestand.
     confData : dict: config data
+    verbose: bool: meld dat de configuratie is opgeslagen.
 
     returns None
     '''
-    with open(confFile, 'w', encoding='utf-8') as outfile:
+    import json
+    import travel_io
+    import travel_trace
+    with travel_trace.span('config opslaan'), \
+            travel_io.AtomicFile(confFile) as outfile:
         json.dump(confData, outfile, indent=4)
-    print(':: Configuratie opgeslagen.')
+        travel_trace.count('bytes geschreven', outfile.tell())
+    if verbose:
+        print(':: Configuratie opgeslagen.')
 
 
-class DatumError(Exception):
+class DatumError(ValueError):
     def __init__(self, value):
         self.value = value
 
     def __str__(self):
-        repr(self.value)
+        return repr(self.value)
 
 
 def validate_datum(datum):
@@ -87,6 +108,25 @@ def validate_datum(datum):
                 Correcte input is: YYYY-[M]M-[D]D, [M]M-[]DD, [D]D')
 
 
+def positive_int(value):
+    '''argparse type voor een aantal van minstens 1.
+
+    keyword arguments:
+    value: string: de waarde van de optie
+
+    returns int
+    raises argparse.ArgumentTypeError als het geen getal >= 1 is.
+    '''
+    import argparse
+    try:
+        n = int(value)
+    except ValueError:
+        n = 0
+    if n < 1:
+        raise argparse.ArgumentTypeError('{} is geen getal >= 1'.format(value))
+    return n
+
+
 def new_tour(name):
     ''' Creeert een nieuwe database.
  
@@ -99,7 +139,7 @@ def new_tour(name):
     omschrijving: str
     budget: float
     nieuw_record: date  datum van volgend record.
-    version: str        versie van travel die db maakt.
+    version: str        versie van travel die db het laatst heeft opgeslagen.
 
     return: dict: tourinfo
     '''
@@ -138,27 +178,49 @@ def new_tour(name):
     return tourData
  
 
-def open_tour(name, traveldir):
+def open_tour(name, traveldir, backend='json', days=None, period=None):
     ''' Open de tour database.
  
     keyword arguments:
     name: string: naam vd tour
     traveldir: string: dir waar db's zijn opgeslagen.
+    backend: string: opslag voor een nieuwe tour (zie travel_storage).
+    days: list: iso datums die nodig zijn. Shards, sqlite en binary laden
+          dan alleen die dagen (of hun shards) en die voor toevoegen,
+          json laadt altijd alles. None = hele tour.
+    period: tuple: (van, tot) datums van de records die nodig zijn, voor
+            --print van een periode. Alleen voor backends met load_range,
+            de andere laden alles. None = hele tour.
  
     returns: dict: de tour data of None als er geen data is.
     '''
-    min_db_version = 2.3
+    import travel_lock
+    import travel_storage
+    import travel_trace
+    import travel_migrate
+    import travel_catalog
     while not name:
         name = input('Geef een naam voor de nieuwe tour: ')
-    # creeer filenaam waar db in opgeslagen is.
-    fname = os.path.join(traveldir, name + '.json')
     try:
-        with open(fname, 'r', encoding='utf-8') as infile:
-            tourData = json.load(infile, object_hook=json_serializer.from_json)
-            if float(tourData['tour']['version']) < min_db_version:
-                print(':: Database versie: {}. Vereist: {}' \
-                        .format(tourData['tour']['version'], min_db_version))
-                return None
+        storage = travel_storage.get_storage(name, traveldir)
+        with travel_trace.span('laden'), travel_lock.TourLock(traveldir, name, True):
+            if days is not None and hasattr(storage, 'load_days'):
+                tourData = storage.load_days(days)
+            elif period is not None and hasattr(storage, 'load_range'):
+                tourData = storage.load_range(*period)
+            else:
+                tourData = storage.load()
+            # om bij opslaan te zien of een ander proces de tour heeft geschreven
+            travel_lock.remember(storage, tourData)
+            # buiten travel om veranderd: get_totals telt opnieuw
+            travel_catalog.check_totals(storage, tourData)
+        travel_trace.count('records gelezen', len(tourData) - 1)
+        if travel_migrate.needs_upgrade(tourData['tour']):
+            old = tourData['tour'].get('version')
+            travel_migrate.upgrade(tourData)
+            print(':: Tour: {} is bijgewerkt van versie {} naar {}.' \
+                    .format(name, old, tourData['tour']['version']))
+            save_tour(tourData, traveldir, False)
     except FileNotFoundError:
         # tour bestaat niet
         jn = input('Tour < {} > Nieuw aanmaken? J/n'.format(name))
@@ -166,68 +228,177 @@ def open_tour(name, traveldir):
             if not os.path.exists(traveldir):
                 os.mkdir(traveldir)
             tourData = {'tour': new_tour(name)}
-            save_tour(tourData, conf['data_dir'], False)
+            save_tour(tourData, traveldir, False, backend=backend)
         else:
             return None
     return tourData
  
 
-def save_tour(db, traveldir, ask=True):
+def save_tour(db, traveldir, ask=True, changed=None, backend='json', bases=None):
     '''Schrijft de database naar disk.
  
     keyword arguments:
     db; dict: De tour database
     traveldir: string: datadir
     ask: bool: Vraag om bevestiging.
+    changed: list: keys van gewijzigde records. Deze worden aan het journal
+             toegevoegd i.p.v. de hele tour te herschrijven.
+             None = hele tour schrijven.
+    backend: string: opslag als de tour nog geen bestand heeft.
+    bases: dict: key: versie van het record voor de wijziging
+           (travel_lock.version). Als de tour intussen door een ander proces
+           is geschreven, wordt hij samengevoegd. None = niet samenvoegen.
+
+    Met write-behind (travel_io.WRITE_BEHIND) wordt een kopie van de tour
+    door de worker thread geschreven en komt de prompt meteen terug. Wat het
+    schrijven aan de kopie verandert komt bij travel_io.wait() in db.
 
     returns None
     '''
+    import travel_io
+    import travel_stats
     if ask:
         if input(':: Wijzigingen opslaan. J/n: ') in ('j', 'J', ''):
-            save_tour(db, traveldir, False)
+            save_tour(db, traveldir, False, changed, backend, bases)
         else:
             print(':: Wijzigingen zijn niet opgeslagen!')
     else:
-        fn = os.path.join(traveldir, db['tour']['naam'] + '.json')
-        with open(fn, 'w', encoding='utf-8') as outfile:
-            json.dump(db, outfile, default=json_serializer.to_json)
-        print(':: Tour: {} is opgeslagen.'.format(db['tour']['naam']))
+        # een vorige schrijfactie kan de journal generatie nog ophogen
+        travel_io.wait()
+        # totalen in de header, voor de catalogus
+        travel_stats.get_totals(db)
+        if travel_io.WRITE_BEHIND:
+            import copy
+            # copy i.p.v. dict: een gedeeltelijk geladen tour blijft dat
+            snapshot = copy.copy(db)
+            snapshot['tour'] = copy.deepcopy(db['tour'])
+
+            records = dict(snapshot)
+            header = copy.deepcopy(snapshot['tour'])
+
+            def done():
+                # samengevoegde records en de header (journal generatie,
+                # totalen, nieuw_record) terug in de tour zelf, behalve wat
+                # daar intussen weer gewijzigd is. Dit gebeurt in
+                # travel_io.wait(), de worker komt niet aan de tour zelf.
+                for key, record in snapshot.items():
+                    if key != 'tour' and record is not records.get(key) and \
+                            db.get(key) is records.get(key):
+                        db[key] = record
+                for field, value in snapshot['tour'].items():
+                    if db['tour'].get(field) == header.get(field):
+                        db['tour'][field] = value
+
+            travel_io.writer().submit(write_tour, snapshot, traveldir, changed,
+                                      backend, bases, db, done=done)
+            print(':: Tour: {} wordt opgeslagen.'.format(db['tour']['naam']))
+        else:
+            write_tour(db, traveldir, changed, backend, bases)
+            print(':: Tour: {} is opgeslagen.'.format(db['tour']['naam']))
+
+
+def write_tour(db, traveldir, changed=None, backend='json', bases=None, owner=None):
+    '''Schrijft de tour, de index en de catalogus, zonder vragen.
+    Alles gebeurt onder de lock van de tour (travel_lock).
+
+    keyword arguments:
+    db; dict: De tour database, met bijgewerkte totalen.
+    traveldir: string: datadir
+    changed: list: keys van gewijzigde records, None = hele tour.
+    backend: string: opslag als de tour nog geen bestand heeft.
+    bases: dict: key: versie van het record voor de wijziging, zie save_tour.
+    owner: dict: de tour waarvan db een kopie is (write-behind). De staat op
+           disk (travel_lock.remember) hoort bij owner. None = db zelf.
+
+    returns list: keys met een conflict, die zijn niet opgeslagen.
+    '''
+    import travel_lock
+    import travel_storage
+    import travel_index
+    import travel_window
+    import travel_search
+    import travel_catalog
+    import travel_sync
+    import travel_trace
+    import travel_migrate
+    name = db['tour']['naam']
+    storage = travel_storage.get_storage(name, traveldir, backend)
+    conflicts = []
+    with travel_trace.span('opslaan'), travel_lock.TourLock(traveldir, name):
+        if bases is not None and changed:
+            if storage.exists() and travel_lock.changed_on_disk(storage, owner or db):
+                with travel_trace.span('samenvoegen'):
+                    conflicts = travel_lock.merge(db, storage.load(), changed, bases)
+                changed = [key for key in changed if key not in conflicts]
+            travel_lock.stamp(db, changed, bases)
+        # versie van travel die de tour het laatst heeft opgeslagen. Een tour
+        # die nog een migratie nodig heeft houdt zijn versie, een nieuwere ook.
+        if not travel_migrate.needs_upgrade(db['tour']):
+            db['tour']['version'] = max(db['tour'].get('version', '0'), __version__,
+                                        key=travel_migrate.parse_version)
+        # de digest hoort bij de bestanden van voor het opslaan
+        before = travel_catalog.signature(storage)
+        with travel_trace.span('opslag'):
+            storage.save(db, changed)
+        with travel_trace.span('index'):
+            travel_index.update_index(db, traveldir, changed)
+        with travel_trace.span('sommen'):
+            travel_window.update_sums(db, traveldir, changed)
+        with travel_trace.span('woorden'):
+            travel_search.update_words(db, traveldir, changed)
+        with travel_trace.span('digest'):
+            travel_sync.update_digest(db, traveldir, changed, before)
+        with travel_trace.span('catalogus'):
+            travel_catalog.update(db, traveldir)
+        travel_lock.remember(storage, owner or db)
+    for key in conflicts:
+        print(':: {} is intussen door een ander gewijzigd, de wijziging is ' \
+                'niet opgeslagen.'.format(key))
+    return conflicts
  
 
-def geld(waarde):
+def geld(waarde, datum=None):
     ''' Rekent geld waarden om naar euro als waarde eindigt met 
-        3 letter geld aanduiding.
+        3 letter geld aanduiding, met de koers op datum (travel_rates).
 
     keyword arguments:
     waarde: string: geld hoeveelheid
-    conf: dict: configuratie waar omreken waardes in staan
+    datum: string: iso datum van het record, None = de laatste koers
 
     returns float: de waarde in euro's
     '''
-    if waarde[-1].isalpha():
-        return conf[waarde[-3:].upper()] * float(waarde[:-3])
-    else:
-        return float(waarde)
+    import travel_rates
+    return travel_rates.geld(waarde, datum)
 
 
-def new_record(default={}):
+# velden van een record en de functie die de invoer omzet
+RECORD_FIELDS = (('naar', str), ('afstand', int), ('eten', geld), \
+        ('hotel', geld), ('anders', geld), ('opmerkingen', str))
+
+
+def new_record(default={}, datum=None):
     ''' Maakt een nieuw record aan.
+    Geld velden in een andere valuta bewaren ook het originele bedrag
+    (travel_rates.set_amount).
  
     keyword arguments.
     default: dict: record met default waarden
+    datum: string: iso datum van het record, voor de wisselkoers.
 
     returns: dict
     '''
+    import travel_rates
     record = {}
-    fields = (('naar', str), ('afstand', int), ('eten', geld), \
-            ('hotel', geld), ('anders', geld), ('opmerkingen', str))
-    for label, validate in fields:
+    originals = default.get('valuta') or {}
+    for label, validate in RECORD_FIELDS:
         fieldValue = input('{} [{}]: '.format(label, default.get(label)))
         if fieldValue == '' and default.get(label):
             record[label] = default[label]
+            if label in originals:
+                record.setdefault('valuta', {})[label] = originals[label]
         elif fieldValue:
-            if validate == geld and fieldValue[0] == '+':
-                record[label] = validate(fieldValue[1:]) + default.get(label, 0.0)
+            if validate == geld:
+                travel_rates.set_amount(record, label, fieldValue, datum, default)
             else:
                 record[label] = validate(fieldValue)
     return record
@@ -242,21 +413,30 @@ def get_field_total(db, field):
 
     returns float:
     '''
-    total = 0
-    for rec in db:
-        total += db[rec].get(field, 0)
-    return total
+    import travel_stats
+    import travel_aggregate
+    if field in travel_stats.FIELDS:
+        if 'tour' in db:
+            # lopende totalen uit de header, geen doorloop over de records
+            return travel_stats.get_totals(db)[field]
+        return travel_aggregate.Columns.from_db(db).total(field)
+    # geen kolom, de tour header telt niet mee
+    return sum(db[rec].get(field, 0) for rec in db if rec != 'tour')
 
 
-def view_record(db, recordKey=None):
+def view_record(db, recordKey=None, keys=None):
     ''' Print een record, of alle, op het scherm.
 
     keyword_arguments:
     db: dict: de open database.
     record_key: date: datum van te printen record. None = alle records.
+    keys: list: iso datums van de te printen records, in volgorde.
+          None = alle records. Het totaal is over deze records.
 
     returns None
     '''
+    import travel_stats
+    import travel_aggregate
     # print header
     labels = ['Datum', 'Naar', 'Afstand', 'Eten', 'Hotel', 'Anders', 'Opmerkingen']
     print('{0[0]:-^10} {0[1]:-<28} {0[2]:->11}- {0[3]:->10}- {0[4]:->10}- '
@@ -270,8 +450,13 @@ def view_record(db, recordKey=None):
                                            db[recordKey].get('anders', 0),
                                            db[recordKey].get('opmerkingen', '')))
     else:
-        # laatse key (tour) is geen record
-        for key in sorted(db.keys())[:-1]:
+        if keys is None:
+            totals = travel_stats.get_totals(db)
+            keys = sorted(key for key in db if key != 'tour')
+        else:
+            cols = travel_aggregate.Columns.from_db(db, keys)
+            totals = {field: cols.total(field) for field in travel_stats.FIELDS}
+        for key in keys:
             print(recordLine.format(key, db[key].get('naar', ''),
                                          db[key].get('afstand', 0),
                                          db[key].get('eten', 0),
@@ -280,9 +465,8 @@ def view_record(db, recordKey=None):
                                          db[key].get('opmerkingen', '')))
         totalLine = '{:40}{:9} km{:10.2f} €{:10.2f} €{:10.2f} € '
         print('{0:39} {0:-<12} {0:-<12} {0:-<11} {0:-<11}'.format(''))
-        print(totalLine.format('', get_field_total(db, 'afstand'), \
-                get_field_total(db, 'eten'), get_field_total(db, 'hotel'), \
-                get_field_total(db, 'anders'), ''))
+        print(totalLine.format('', totals['afstand'], totals['eten'], \
+                totals['hotel'], totals['anders'], ''))
         print('{0:39} {0:-<49}'.format(''))
 
 
@@ -294,12 +478,11 @@ def fiets_dagen(db):
 
     returns int
     '''
-    dagen = 0
-    for rec in db:
-        if db[rec].get('afstand'):
-            # alle dagen die een afstand hebben.
-            dagen += 1
-    return dagen
+    import travel_stats
+    import travel_aggregate
+    if 'tour' in db:
+        return travel_stats.get_totals(db)['fietsdagen']
+    return travel_aggregate.Columns.from_db(db).fietsdagen()
 
 
 def print_stats(data):
@@ -310,9 +493,13 @@ def print_stats(data):
 
     returns None
     '''
+    import travel_stats
+    import travel_trace
     info = data['tour']
-    tourDagen = len(data) - 1
-    fietsDagen = fiets_dagen(data)
+    with travel_trace.span('totalen'):
+        totals = travel_stats.get_totals(data)
+    tourDagen = totals['records']
+    fietsDagen = totals['fietsdagen']
     if info.get('eind_datum'):
         maxDagen = (info['eind_datum'] - info['start_datum']).days + 1
     else:
@@ -320,9 +507,8 @@ def print_stats(data):
     restDagen = (maxDagen - tourDagen)
     if restDagen < 1:
         restDagen = 1
-    afstandTotal = get_field_total(data, 'afstand')
-    kosten = [get_field_total(data, 'eten'), get_field_total(data, 'hotel'), \
-            get_field_total(data, 'anders')]
+    afstandTotal = totals['afstand']
+    kosten = [totals['eten'], totals['hotel'], totals['anders']]
     if info.get('budget'):
         restBudget = info['budget'] - sum(kosten)
     else:
@@ -354,10 +540,204 @@ def print_stats(data):
             .format(info.get('budget', 0.0), restBudget, restBudget / restDagen))
 
 
+def show_tours(traveldir, lastUsed, long=False):
+    ''' Print alle tour databases.
+
+    keyword arguments:
+    traveldir: string: datadir
+    lastUsed: string: naam van de laatst gebruikte tour
+    long: bool: print ook de samenvatting uit de catalogus.
+
+    returns None
+    '''
+    import travel_storage
+    if not long:
+        for e in travel_storage.tour_names(traveldir):
+            print('{} {}'.format('*' if e == lastUsed else ' ', e))
+        return
+    print('  {:20} {:>10} {:>10} {:>6} {:>8} {:>12}'.format('Tour', 'Start', \
+            'Eind', 'Dagen', 'Km', 'Rest budget'))
+    import travel_catalog
+    for name, info in travel_catalog.refresh(traveldir).items():
+        totals = info['totalen']
+        eind = info.get('eind_datum')
+        if not eind or eind == datetime.date.max:
+            eind = 'open'
+        restBudget = info.get('budget', 0.0) - totals['eten'] - totals['hotel'] \
+                - totals['anders']
+        print('{} {:20} {:>10} {:>10} {:6} {:8} {:12.2f}'.format( \
+                '*' if name == lastUsed else ' ', name, str(info['start_datum']), \
+                str(eind), totals['records'], totals['afstand'], restBudget))
+
+
+def print_banner(info):
+    ''' Print de naam, versie en datums van de tour.
+
+    keyword arguments:
+    info: dict: de tour header
+
+    returns None
+    '''
+    setup_locale()
+    if info.get('eind_datum'):
+        eindDatum = info['eind_datum'].strftime("%d %B %Y")
+    else:
+        eindDatum = 'geen einddatum'
+    print('Tour: {} (v.{}) | {} - {}'.format(info['naam'], info['version'], \
+            info['start_datum'].strftime("%d %B %Y"), eindDatum))
+
+
+def next_record(info, key):
+    ''' Datum van het volgende nieuwe record na key.
+
+    keyword arguments:
+    info: dict: de tour header
+    key: date: datum van het toegevoegde record
+
+    returns date, of None als de laatste dag van de tour voorbij is.
+    '''
+    if info.get('eind_datum') and key == info['eind_datum']:
+        return None
+    return key + datetime.timedelta(days=1)
+
+
+def remote_tour(client, name, args):
+    ''' Print, toevoegen en bewerken via de tour daemon (travel_daemon).
+    De vragen worden hier gesteld, de tour zelf blijft in de daemon.
+
+    keyword arguments:
+    client: travel_daemon.Client
+    name: string: naam vd tour
+    args: argparse.Namespace: de argumenten van de CLI
+
+    returns dict: de tour header, of None als de daemon de tour niet kent.
+    '''
+    import sys
+    import json_serializer
+    reply = client.request('header', tour=name)
+    if not reply['ok']:
+        return None
+    info = json_serializer.decode_header(reply['header'])
+    print_banner(info)
+    if args.print:
+        reply = client.request('print', tour=name, van=args.van, tot=args.tot, \
+                last=args.last)
+        sys.stdout.write(reply['output'])
+        return info
+    if args.edit:
+        datum = validate_datum(args.edit)
+        print('Bewerk record voor {}'.format(datum.strftime('%A %d %B %Y')))
+        if not info['start_datum'] <= datum <= info['eind_datum']:
+            raise DatumError('Deze dag is niet in de database!')
+        key = datum.isoformat()
+        record = new_record(client.request('get', tour=name, key=key)['record'] or {},
+                            key)
+        print(':: {}, Deze dag is gewijzigd...'.format(datum.strftime('%d %B')))
+        update = {}
+    elif info['nieuw_record']:
+        datum = info['nieuw_record']
+        print('Nieuw record voor {}'.format(datum.strftime('%A %d %B %Y')))
+        if input('Record toevoegen ? J/n ') not in ('j', 'J', ''):
+            return info
+        key = datum.isoformat()
+        record = new_record(datum=key)
+        print(':: Deze dag wordt toegevoegd...')
+        update = {'nieuw_record': next_record(info, datum)}
+    else:
+        print(':: Helaas is deze tour al klaar. \
+                Je kunt nog wel bewrken met --edit.')
+        return info
+    view_record({key: record}, key)
+    print()
+    if input(':: Wijzigingen opslaan. J/n: ') in ('j', 'J', ''):
+        reply = client.request('put', tour=name, key=key, record=record, **update)
+        print(':: Tour: {} is opgeslagen.'.format(info['naam']))
+        print()
+        print(reply['output'], end='')
+    else:
+        print(':: Wijzigingen zijn niet opgeslagen!')
+    return info
+
+
+def flush_daemon(conf):
+    ''' Laat een draaiende daemon zijn wijzigingen wegschrijven, voor
+    commando's die de bestanden zelf lezen.
+
+    keyword arguments:
+    conf: dict: configuratie
+
+    returns None
+    '''
+    import travel_daemon
+    client = travel_daemon.connect(travel_daemon.socket_path(conf))
+    if client:
+        with client:
+            client.request('flush')
+
+
+def release_daemon(path, names):
+    ''' Laat een draaiende daemon tours wegschrijven en vergeten, zodat hij
+    niet met een oude kopie verder gaat als een ander de bestanden schrijft.
+
+    keyword arguments:
+    path: string: pad van de socket van de daemon
+    names: list: namen van de tours
+
+    returns None
+    '''
+    import travel_daemon
+    client = travel_daemon.connect(path)
+    if client:
+        with client:
+            for name in names:
+                client.request('release', tour=name)
+
+
+def sync_dirs(conf, other):
+    ''' Maakt de tours in de datadir en een andere dir gelijk (--sync).
+
+    keyword arguments:
+    conf: dict: configuratie
+    other: string: de andere datadir
+
+    returns None
+    '''
+    import travel_daemon
+    import travel_storage
+    import travel_sync
+    if not os.path.isdir(other):
+        print(':: {} is geen directory.'.format(other))
+        return
+    names = set(travel_storage.tour_names(conf['data_dir'])) | \
+            set(travel_storage.tour_names(other))
+    release_daemon(travel_daemon.socket_path(conf), names)
+    release_daemon(os.path.join(other, travel_daemon.SOCKET), names)
+    travel_sync.print_sync(travel_sync.sync(conf['data_dir'], other, write_tour))
+
+
+def archive_tours(traveldir, backend):
+    ''' Comprimeert de tours die klaar zijn en print wat het scheelt.
+
+    keyword arguments:
+    traveldir: string: datadir
+    backend: string: gzip of xz
+
+    returns None
+    '''
+    import travel_storage
+    archived = travel_storage.archive(traveldir, backend)
+    for name, before, after in archived:
+        print(':: Tour: {} is gearchiveerd ({} kB -> {} kB).'.format( \
+                name, before // 1024, after // 1024))
+    print(':: {} tours gearchiveerd.'.format(len(archived)))
+
+
 if __name__ == '__main__':
-    confFile = os.path.join(os.path.expanduser('~'), '.config', 'travel.conf')
-    conf = open_config(confFile)
+    import argparse
     data = None
+    info = None
+    # alleen melden dat er geen tour is als er een tour nodig was
+    tourGevraagd = False
 
     parser = argparse.ArgumentParser( \
             description='beheer tour databases. Tours hebben per dag een record.')
@@ -365,55 +745,242 @@ if __name__ == '__main__':
             help='Voegt een nieuwe 3-letter afkorting aan conf toe.')
     parser.add_argument('--show-tours', dest='show_tours', action='store_true', \
             help='Toon alle tour databases.')
+    parser.add_argument('-l', '--long', action='store_true', \
+            help='Toon bij --show-tours ook datums, dagen, afstand en budget.')
+    parser.add_argument('--report-all', dest='report_all', action='store_true', \
+            help='Rapport over alle tours in de datadir.')
+    parser.add_argument('--group', choices=('year', 'month', 'week'), \
+            help='Groepeer --report-all of --stats per jaar, maand of week.')
+    parser.add_argument('--stats', action='store_true', \
+            help='Print de statistieken, met --window en --group per periode.')
+    parser.add_argument('--window', type=positive_int, metavar='N', \
+            help='Print bij --stats de sommen over de laatste N dagen.')
+    parser.add_argument('--reprice', action='store_true', \
+            help='Reken de bedragen in andere valuta opnieuw om met de koersen \
+                  uit de config.')
     parser.add_argument('--edit-tour', dest='edit_tour', action='store_true', \
             help='Edit de tour informatie.')
+    parser.add_argument('--search', metavar='QUERY', \
+            help='Zoek dagen waarop alle woorden (of het begin ervan) in naar \
+                  of opmerkingen staan. Met --from/--to binnen een periode.')
+    parser.add_argument('--all', action='store_true', \
+            help='Zoek met --search in alle tours.')
+    parser.add_argument('--serve', action='store_true', \
+            help='Start de tour daemon, die tours in het geheugen houdt.')
+    parser.add_argument('--convert', metavar='BACKEND', \
+            help='Zet de tour om naar een andere opslag (json, gzip, xz, sqlite, \
+                  binary, sharded).')
+    parser.add_argument('--archive', nargs='?', const='gzip', choices=('gzip', 'xz'), \
+            help='Comprimeer alle tours die klaar zijn (standaard gzip).')
+    parser.add_argument('--sync', metavar='DIR', \
+            help='Maak de tours in de datadir en DIR (bijv. een kopie van een \
+                  ander apparaat) gelijk. Alleen dagen die verschillen worden \
+                  overgezet, aan beide kanten gewijzigde dagen worden gemeld.')
+    parser.add_argument('--migrate-all', dest='migrate_all', action='store_true', \
+            help='Werk alle tours in de datadir bij naar de huidige versie.')
     parser.add_argument('-p', '--print', action='store_true', \
             help='Print de database op het scherm')
+    parser.add_argument('--format', choices=('csv', 'tsv', 'jsonl'), \
+            help='Print de records als csv, tsv of JSON Lines (met --print).')
+    parser.add_argument('--totals', action='store_true', \
+            help='Voeg bij --format een totaal record toe.')
+    parser.add_argument('--from', dest='van', type=validate_datum, \
+            help='Print vanaf datum VAN.')
+    parser.add_argument('--to', dest='tot', type=validate_datum, \
+            help='Print tot en met datum TOT.')
+    parser.add_argument('--last', type=int, \
+            help='Print de laatste LAST dagen.')
+    parser.add_argument('--import', dest='import_file', metavar='FILE', \
+            help='Importeer dagen uit een .csv, .tsv of .jsonl bestand.')
     parser.add_argument('-e', '--edit', nargs='?', const='', \
             help='Bewerk een record met datum EDIT.')
-    parser.add_argument('tour', nargs='?', default=conf['last-used'], \
+    parser.add_argument('tour', nargs='?', \
             help='Naam van de tour die gebruikt moet worden. \
                   default laatst gebruikt.')
+    parser.add_argument('--profile', nargs='?', const='', metavar='FILE', \
+            help='Print de tijd per fase op stderr, met FILE ook een cProfile \
+                  dump. Ook aan te zetten met TRAVEL_TRACE=1 of TRAVEL_TRACE=FILE.')
     parser.add_argument('--version', action='version', version='%(prog)s '+__version__)
     args = parser.parse_args()
 
+    import travel_trace
+    if args.profile is not None:
+        travel_trace.enable(args.profile or None)
+    else:
+        travel_trace.from_env()
+
+    # config pas na het parsen lezen, --version en --help hebben hem niet nodig
+    confFile = os.path.join(os.path.expanduser('~'), '.config', 'travel.conf')
+    conf = open_config(confFile)
+    import travel_io
+    import travel_rates
+    travel_io.configure(conf)
+    travel_rates.configure(conf)
+    if args.tour is None:
+        args.tour = conf['last-used']
+
     # Arguments not requiring an open database
     if args.add_currency:
         curr = input('Geef 3-letter afkorting voor de buitenlandse munt: ')
         if curr.isalpha() and len(curr) == 3:
-            conf[curr.upper()] = float(input('Wat is de omrekenfactor naar euro? '))
+            factor = float(input('Wat is de omrekenfactor naar euro? '))
+            vanaf = input('Geldig vanaf YYYY-MM-DD [altijd]: ')
+            travel_rates.add_rate(conf, curr.upper(), \
+                    validate_datum(vanaf).isoformat() if vanaf else '', factor)
             save_config(conf, confFile)
         else:
             print(':: error: geef precies 3 letters voor de geld afkorting.')
     elif args.show_tours:
-        tourdbs = [os.path.splitext(os.path.split(file)[1])[0] for file in \
-                glob.glob(os.path.join(conf['data_dir'], '*.json'))]
-        for e in sorted(tourdbs):
-            if e == conf['last-used']:
-                print('* {}'.format(e))
-            else:
-                print('  {}'.format(e))
+        show_tours(conf['data_dir'], conf['last-used'], args.long)
+    elif args.report_all:
+        import travel_report
+        travel_report.print_report(conf['data_dir'], args.group)
+    elif args.search:
+        import travel_search
+        # wijzigingen die de daemon nog vasthoudt eerst wegschrijven
+        flush_daemon(conf)
+        travel_search.print_results(travel_search.search(conf['data_dir'], \
+                args.search, None if args.all else [args.tour], args.van, args.tot), \
+                args.all)
+    elif args.archive:
+        flush_daemon(conf)
+        archive_tours(conf['data_dir'], args.archive)
+    elif args.sync:
+        sync_dirs(conf, args.sync)
+    elif args.migrate_all:
+        import travel_migrate
+        flush_daemon(conf)
+        done = travel_migrate.migrate_all(conf['data_dir'])
+        print(':: {} tours bijgewerkt naar versie {}.'.format( \
+                len(done), travel_migrate.current()))
+    elif args.serve:
+        import travel_daemon
+        travel_daemon.serve(conf, view_record, print_stats, write_tour)
     else:
-        data = open_tour(args.tour, conf['data_dir'])
+        tourGevraagd = True
+        import travel_daemon
+        client = travel_daemon.connect(travel_daemon.socket_path(conf))
+        if client:
+            with client:
+                # een export streamt uit de bestanden, niet via de socket
+                if not (args.convert or args.import_file or args.edit_tour or \
+                        args.stats or args.reprice or (args.print and args.format)):
+                    info = remote_tour(client, args.tour, args)
+                if info is None:
+                    # direct naar de bestanden, de daemon schrijft eerst weg
+                    client.request('release', tour=args.tour)
+        if info is not None:
+            if conf['last-used'] != info['naam']:
+                conf['last-used'] = info['naam']
+                save_config(conf, confFile)
+        else:
+            days = None
+            period = None
+            if not (args.convert or args.print or args.import_file or args.edit_tour \
+                    or args.reprice):
+                # toevoegen, bewerken en --stats hebben niet de hele tour nodig
+                days = [validate_datum(args.edit).isoformat()] if args.edit else []
+            elif args.print and (args.van or args.tot):
+                period = (args.van, args.tot)
+            elif args.print and args.last is not None and args.tour:
+                # de eerste van de laatste N dagen staat in de index
+                import travel_index
+                index = travel_index.DatumIndex.read(conf['data_dir'], args.tour)
+                keys = index.last(args.last) if index is not None else []
+                if keys:
+                    period = (datetime.date.fromisoformat(keys[0]), None)
+            if conf.get('shard'):
+                import travel_shard
+                travel_shard.PERIOD = conf['shard']
+            data = open_tour(args.tour, conf['data_dir'], conf.get('storage', 'json'), \
+                    days, period)
 
     if data:
-        if data['tour'].get('eind_datum'):
-            eindDatum = data['tour']['eind_datum'].strftime("%d %B %Y")
-        else:
-            eindDatum = 'geen einddatum'
-        print('Tour: {} (v.{}) | {} - {}'.format(data['tour']['naam'], \
-                data['tour']['version'], data['tour']['start_datum'] \
-                .strftime("%d %B %Y"), eindDatum))
+        import travel_lock
+        import travel_stats
+        # bij --format alleen de records op stdout
+        export = args.print and args.format
+        if not export:
+            print_banner(data['tour'])
         # set last used tour in config file
         if conf['last-used'] != data['tour']['naam']:
             conf['last-used'] = data['tour']['naam']
-            save_config(conf, confFile)
+            save_config(conf, confFile, not export)
         # print the database
-        if args.print:
-            print('* {} *'.format(data['tour']['omschrijving']))
-            print()
-            view_record(data)
+        if args.convert:
+            import travel_storage
+            if args.convert in travel_storage.BACKENDS:
+                travel_storage.convert(data['tour']['naam'], conf['data_dir'], \
+                        args.convert)
+                print(':: Tour: {} is omgezet naar {}.'.format(data['tour']['naam'], \
+                        args.convert))
+            else:
+                print(':: error: onbekende opslag {}. Kies uit: {}'.format( \
+                        args.convert, ', '.join(sorted(travel_storage.BACKENDS))))
+        elif args.stats:
+            import travel_window
             print_stats(data)
+            if args.window or args.group:
+                with travel_window.PrefixSums.open(data, conf['data_dir']) as sums:
+                    if args.window:
+                        print()
+                        travel_window.print_window(data['tour'], sums, args.window)
+                    if args.group:
+                        print()
+                        travel_window.print_periods(sums, args.group)
+        elif args.print:
+            keys = None
+            if args.last is not None or args.van or args.tot:
+                import travel_index
+                index = travel_index.DatumIndex.open(data, conf['data_dir'])
+                if args.last is not None:
+                    keys = index.last(args.last)
+                else:
+                    keys = index.keys(args.van, args.tot)
+            if export:
+                import travel_export
+                if keys is None:
+                    keys = sorted(key for key in data if key != 'tour')
+                with travel_trace.span('export'):
+                    travel_export.export(data, keys, args.format, args.totals)
+            else:
+                with travel_trace.span('weergave'):
+                    print('* {} *'.format(data['tour']['omschrijving']))
+                    print()
+                    view_record(data, keys=keys)
+                    print_stats(data)
+        elif args.import_file:
+            import travel_lock
+            import travel_import
+            versions = {key: travel_lock.version(rec) for key, rec in data.items() \
+                        if key != 'tour'}
+            try:
+                with travel_trace.span('import'):
+                    keys, errors = travel_import.import_file(data, args.import_file, \
+                            RECORD_FIELDS, validate_datum)
+            except (OSError, ValueError) as e:
+                # het hele bestand is onleesbaar, er wordt niets opgeslagen
+                print(':: Import mislukt: {}'.format(e))
+                keys, errors = None, []
+            for rowNr, error in errors:
+                print(':: rij {}: {}'.format(rowNr, error))
+            if keys is not None:
+                print(':: {} dagen geimporteerd, {} fouten.'.format(len(keys), len(errors)))
+            if keys:
+                save_tour(data, conf['data_dir'], False, changed=keys, \
+                        bases={key: versions.get(key) for key in keys})
+                print_stats(data)
+        elif args.reprice:
+            bases = {key: travel_lock.version(rec) for key, rec in data.items() \
+                     if key != 'tour'}
+            with travel_trace.span('omrekenen'):
+                keys = travel_rates.reprice(data)
+            print(':: {} dagen opnieuw omgerekend.'.format(len(keys)))
+            if keys:
+                travel_stats.rebuild_totals(data)
+                save_tour(data, conf['data_dir'], False, changed=keys, \
+                        bases={key: bases[key] for key in keys})
+                print_stats(data)
         elif args.edit_tour:
             print(':: Tour informatie aanpassen...')
             edit_tour(data['tour'])
@@ -426,19 +993,18 @@ if __name__ == '__main__':
                             .strftime('%A %d %B %Y')))
                     if (input('Record toevoegen ? J/n ') in ('j', 'J', '')):
                         key = data['tour']['nieuw_record']
-                        data[key.isoformat()] = new_record()
+                        old = data.get(key.isoformat())
+                        data[key.isoformat()] = new_record(datum=key.isoformat())
+                        travel_stats.update_totals(data, old, data[key.isoformat()])
                         # Zet key voor nieuw record, 
                         # None als laatste dag in tour voorbij is.
-                        if data['tour'].get('eind_datum') and \
-                                key == data['tour']['eind_datum']:
-                            data['tour']['nieuw_record'] = None
-                        else:
-                            data['tour']['nieuw_record'] = key + datetime.timedelta(days=1)
+                        data['tour']['nieuw_record'] = next_record(data['tour'], key)
                         print(':: Deze dag wordt toegevoegd...')
                         view_record(data, key.isoformat())
                         print()
                         # Save de data
-                        save_tour(data, conf['data_dir'])
+                        save_tour(data, conf['data_dir'], changed=[key.isoformat()], \
+                                bases={key.isoformat(): travel_lock.version(old)})
                         print()
                         print_stats(data)
                 else:
@@ -449,14 +1015,17 @@ if __name__ == '__main__':
                 datum = validate_datum(args.edit)
                 print('Bewerk record voor {}'.format(datum.strftime('%A %d %B %Y')))
                 if data['tour']['start_datum'] <= datum <= data['tour']['eind_datum']:
-                    data[datum.isoformat()] = new_record(data[datum.isoformat()])
+                    old = data.get(datum.isoformat())
+                    data[datum.isoformat()] = new_record(old or {}, datum.isoformat())
+                    travel_stats.update_totals(data, old, data[datum.isoformat()])
                     print(':: {}, Deze dag is gewijzigd...' \
                             .format(datum.strftime('%d %B')))
                     view_record(data, datum.isoformat())
                     # Save de data
-                    save_tour(data, conf['data_dir'])
+                    save_tour(data, conf['data_dir'], changed=[datum.isoformat()], \
+                            bases={datum.isoformat(): travel_lock.version(old)})
                     print_stats(data)
                 else:
                     raise DatumError('Deze dag is niet in de database!')
-    else:
+    elif info is None and tourGevraagd:
         print(':: Geen tour database geopend...')
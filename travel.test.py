@@ -2,8 +2,43 @@
 # travel.test.py
 # Testcases tbv travel.py
 
+import io
+import os
+import sys
+import subprocess
+import datetime
+import tempfile
+import contextlib
+import threading
+import asyncio
+import socket
+import time
 import unittest
+import json
+import array
 import travel
+import json_serializer
+import travel_journal
+import travel_stats
+import travel_aggregate
+import travel_storage
+import travel_binary
+import travel_index
+import travel_catalog
+import travel_report
+import travel_import
+import travel_export
+import travel_trace
+import travel_io
+import travel_daemon
+import travel_lock
+import travel_window
+import travel_search
+import travel_model
+import travel_shard
+import travel_rates
+import travel_migrate
+import travel_sync
 
 class TestTravel(unittest.TestCase):
     # fietsdagen: 3
@@ -45,6 +80,1311 @@ class TestTravel(unittest.TestCase):
         self.assertAlmostEqual(31.55, result)
 
 
+class TestAggregate(unittest.TestCase):
+    data = {'tour': {'naam': 'test'},
+            '2015-01-01': {'naar': 'amsterdam', 'afstand': 100, 'eten': 10},
+            '2015-01-02': {'afstand': 50, 'hotel': 25, 'anders': 10, 'opmerkingen': 'xxx'},
+            '2015-01-03': {'naar': 'Bangkok', 'eten': 10, 'anders': 1.55},
+            '2015-01-04': {'naar': 'huis', 'afstand': 100, 'eten': 10, 'anders': 20}
+            }
+
+    def setUp(self):
+        self.cols = travel_aggregate.Columns.from_db(self.data)
+
+    def test_header_overgeslagen(self):
+        self.assertEqual(4, len(self.cols))
+
+    def test_totalen(self):
+        self.assertEqual(250, self.cols.total('afstand'))
+        self.assertAlmostEqual(31.55, self.cols.total('anders'))
+        self.assertEqual(3, self.cols.fietsdagen())
+
+    def test_summary(self):
+        summary = self.cols.summary()
+        self.assertEqual(datetime.date(2015, 1, 1), summary['eerste'])
+        self.assertEqual(datetime.date(2015, 1, 4), summary['laatste'])
+        self.assertEqual(0, summary['afstand']['min'])
+        self.assertEqual(100, summary['afstand']['max'])
+        self.assertEqual(62.5, summary['afstand']['per_dag'])
+        self.assertAlmostEqual(250 / 3, summary['afstand']['per_fietsdag'])
+
+    def test_selectie(self):
+        cols = travel_aggregate.Columns.from_db(self.data, ['2015-01-02', '2015-01-03'])
+        self.assertEqual(50, cols.total('afstand'))
+        self.assertEqual(1, cols.fietsdagen())
+
+    def test_leeg(self):
+        summary = travel_aggregate.Columns.from_db({'tour': {}}).summary()
+        self.assertEqual(0, summary['records'])
+        self.assertEqual(0, summary['eten']['per_dag'])
+
+
+class TestTotals(unittest.TestCase):
+
+    def setUp(self):
+        self.db = {'tour': {'naam': 'test'},
+                   '2015-01-01': {'naar': 'amsterdam', 'afstand': 100, 'eten': 10},
+                   '2015-01-02': {'afstand': 50, 'hotel': 25, 'anders': 10}}
+
+    def test_rebuild(self):
+        totals = travel_stats.get_totals(self.db)
+        self.assertEqual(150, totals['afstand'])
+        self.assertEqual(2, totals['fietsdagen'])
+        self.assertEqual(2, totals['records'])
+        self.assertIs(totals, self.db['tour']['totalen'])
+
+    def test_update_toevoegen(self):
+        travel_stats.get_totals(self.db)
+        self.db['2015-01-03'] = {'naar': 'Bangkok', 'eten': 10, 'anders': 1.55}
+        travel_stats.update_totals(self.db, None, self.db['2015-01-03'])
+        totals = self.db['tour']['totalen']
+        self.assertEqual(3, totals['records'])
+        self.assertEqual(2, totals['fietsdagen'])
+        self.assertAlmostEqual(11.55, totals['anders'])
+
+    def test_update_bewerken(self):
+        travel_stats.get_totals(self.db)
+        old = self.db['2015-01-02']
+        self.db['2015-01-02'] = {'hotel': 30}
+        travel_stats.update_totals(self.db, old, self.db['2015-01-02'])
+        totals = self.db['tour']['totalen']
+        self.assertEqual(100, totals['afstand'])
+        self.assertEqual(1, totals['fietsdagen'])
+        self.assertEqual(30, totals['hotel'])
+        self.assertEqual(0, totals['anders'])
+
+    def test_verouderd(self):
+        travel_stats.get_totals(self.db)
+        self.db['2015-01-03'] = {'afstand': 10}
+        self.assertEqual(160, travel_stats.get_totals(self.db)['afstand'])
+
+
+class TestDecode(unittest.TestCase):
+
+    def test_decode_header(self):
+        d = datetime.date(2015, 1, 1)
+        header = {'naam': 'test', 'start_datum': json_serializer.to_json(d),
+                  'eind_datum': '2015-01-01', 'nieuw_record': None}
+        json_serializer.decode_header(header)
+        self.assertEqual(d, header['start_datum'])
+        self.assertEqual(d, header['eind_datum'])
+        self.assertIsNone(header['nieuw_record'])
+
+    def test_oud_formaat(self):
+        db = {'tour': {'naam': 'test', 'start_datum': datetime.date(2015, 1, 1)},
+              '2015-01-01': {'naar': 'amsterdam'}}
+        old = json.loads(json.dumps(db, default=json_serializer.to_json),
+                         object_hook=json_serializer.from_json)
+        new = json_serializer.decode_tour(
+            json.loads(json.dumps(db, default=json_serializer.to_iso)))
+        self.assertEqual(old, new)
+
+
+class TestJournal(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = self.tmp.name
+        self.db = {'tour': {'naam': 'test', 'version': '2.5',
+                            'start_datum': datetime.date(2015, 1, 1),
+                            'eind_datum': datetime.date(2015, 1, 31),
+                            'nieuw_record': datetime.date(2015, 1, 1)}}
+        travel.save_tour(self.db, self.dir, False)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_replay(self):
+        self.db['2015-01-01'] = {'naar': 'amsterdam', 'afstand': 100}
+        self.db['tour']['nieuw_record'] = datetime.date(2015, 1, 2)
+        travel.save_tour(self.db, self.dir, False, ['2015-01-01'])
+        self.assertTrue(os.path.exists(travel_journal.journal_file(self.dir, 'test')))
+        db = travel.open_tour('test', self.dir)
+        self.assertEqual(self.db, db)
+
+    def test_compactie(self):
+        self.db['2015-01-01'] = {'naar': 'amsterdam', 'afstand': 100}
+        travel.save_tour(self.db, self.dir, False, ['2015-01-01'])
+        travel.save_tour(self.db, self.dir, False)
+        self.assertFalse(os.path.exists(travel_journal.journal_file(self.dir, 'test')))
+        self.assertEqual(self.db, travel.open_tour('test', self.dir))
+
+    def test_oud_journal_genegeerd(self):
+        # journal van een vorige generatie mag een nieuwe snapshot niet overschrijven
+        self.db['2015-01-01'] = {'naar': 'amsterdam'}
+        travel.save_tour(self.db, self.dir, False, ['2015-01-01'])
+        self.db['2015-01-01'] = {'naar': 'utrecht'}
+        travel_journal.start_generation(self.db)
+        with open(os.path.join(self.dir, 'test.json'), 'w', encoding='utf-8') as f:
+            json.dump(self.db, f, default=json_serializer.to_json)
+        db = travel.open_tour('test', self.dir)
+        self.assertEqual('utrecht', db['2015-01-01']['naar'])
+
+
+class TestStorage(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = self.tmp.name
+        self.db = {'tour': {'naam': 'test', 'version': '2.5',
+                            'start_datum': datetime.date(2015, 1, 1),
+                            'eind_datum': datetime.date(2015, 1, 31),
+                            'nieuw_record': datetime.date(2015, 1, 4)},
+                   '2015-01-01': {'naar': 'amsterdam', 'afstand': 100, 'eten': 10},
+                   '2015-01-02': {'afstand': 50, 'hotel': 25, 'opmerkingen': 'xxx'},
+                   '2015-01-03': {'naar': 'Bangkok', 'eten': 10, 'anders': 1.55}}
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_sqlite(self):
+        storage = travel_storage.SqliteStorage('test', self.dir)
+        storage.save(self.db)
+        self.assertEqual(self.db, storage.load())
+        self.db['2015-01-02']['naar'] = 'utrecht'
+        storage.save(self.db, ['2015-01-02'])
+        self.assertEqual('utrecht', storage.load()['2015-01-02']['naar'])
+
+    def test_sqlite_periode(self):
+        storage = travel_storage.SqliteStorage('test', self.dir)
+        storage.save(self.db)
+        van, tot = datetime.date(2015, 1, 2), datetime.date(2015, 1, 3)
+        self.assertEqual(['2015-01-02', '2015-01-03'],
+                         [key for key, rec in storage.records(van, tot)])
+        totals = storage.totals(van, tot)
+        self.assertEqual(50, totals['afstand']['totaal'])
+        self.assertEqual(1, totals['fietsdagen'])
+        self.assertAlmostEqual(1.55, totals['anders']['totaal'])
+
+    def test_binary(self):
+        self.db['2015-01-03']['_v'] = 2
+        storage = travel_storage.BinaryStorage('test', self.dir)
+        storage.save(self.db)
+        self.assertEqual(self.db, storage.load())
+        self.assertEqual(self.db['tour'], storage.header())
+        van, tot = datetime.date(2015, 1, 2), datetime.date(2015, 1, 3)
+        self.assertEqual(['2015-01-02', '2015-01-03'],
+                         [key for key, rec in storage.records(van, tot)])
+        self.assertEqual(50, storage.totals(van, tot)['afstand']['totaal'])
+
+    def test_aantal(self):
+        storage = travel_storage.BinaryStorage('test', self.dir)
+        storage.save(self.db)
+        self.assertEqual(3, storage.record_count())
+        sqlite = travel_storage.SqliteStorage('test', self.dir)
+        sqlite.save(self.db)
+        self.assertEqual(3, sqlite.record_count())
+        # formaat 1 heeft geen aantal in de kop, dan wordt er geteld
+        with open(storage.path, 'rb') as infile:
+            data = infile.read()
+        head = list(travel_binary.HEAD.unpack_from(data))
+        head[1] = 1
+        head[-1] -= travel_binary.COUNT.size
+        with open(storage.path, 'wb') as outfile:
+            outfile.write(travel_binary.HEAD.pack(*head) +
+                          data[travel_binary.HEAD.size + travel_binary.COUNT.size:])
+        self.assertEqual(self.db, storage.load())
+        self.assertEqual(3, storage.record_count())
+
+    def test_periode_laden(self):
+        travel_stats.get_totals(self.db)
+        for backend in ('sqlite', 'binary'):
+            with self.subTest(backend=backend):
+                travel_storage.BACKENDS[backend]('test', self.dir).save(self.db)
+                db = travel.open_tour('test', self.dir,
+                                      period=(datetime.date(2015, 1, 2), None))
+                self.assertEqual(['2015-01-02', '2015-01-03'],
+                                 sorted(key for key in db if key != 'tour'))
+                self.assertEqual(3, travel_stats.record_count(db))
+                # --stats: alleen de header
+                db = travel.open_tour('test', self.dir, days=[])
+                self.assertEqual(['tour'], list(db))
+                self.assertEqual(3, travel_stats.get_totals(db)['records'])
+                # toevoegen en opslaan houdt de andere dagen
+                new = {'naar': 'utrecht', 'afstand': 20}
+                travel_stats.update_totals(db, None, new)
+                db['2015-01-04'] = new
+                travel.write_tour(db, self.dir, ['2015-01-04'])
+                self.assertEqual(4, len(travel_storage.BACKENDS[backend](
+                    'test', self.dir).load()) - 1)
+                for path in travel_storage.BACKENDS[backend]('test', self.dir).files():
+                    os.remove(path)
+
+    def test_convert(self):
+        travel_storage.JsonStorage('test', self.dir).save(self.db)
+        storage = travel_storage.convert('test', self.dir, 'sqlite')
+        self.assertIs(storage.__class__, travel_storage.SqliteStorage)
+        self.assertIs(travel_storage.get_storage('test', self.dir).__class__,
+                      travel_storage.SqliteStorage)
+        storage = travel_storage.convert('test', self.dir, 'json')
+        db = storage.load()
+        del db['tour']['journal'], self.db['tour']['journal']
+        self.assertEqual(self.db, db)
+
+    def test_gecomprimeerd(self):
+        for backend in ('gzip', 'xz'):
+            storage = travel_storage.BACKENDS[backend]('test', self.dir)
+            storage.save(self.db)
+            with open(storage.path, 'rb') as infile:
+                self.assertNotIn(b'amsterdam', infile.read())
+            self.db['2015-01-02']['naar'] = backend
+            storage.save(self.db, ['2015-01-02'])
+            db = travel_storage.get_storage('test', self.dir).load()
+            self.assertEqual(backend, db['2015-01-02']['naar'])
+            self.assertEqual(['test'], travel_storage.tour_names(self.dir))
+            os.remove(storage.path)
+
+    def test_archive(self):
+        travel_storage.JsonStorage('test', self.dir).save(self.db)
+        klaar = dict(self.db, tour=dict(self.db['tour'], naam='klaar', nieuw_record=None))
+        travel_storage.JsonStorage('klaar', self.dir).save(klaar)
+        travel_storage.JsonStorage('klaar', self.dir).save(klaar, ['2015-01-03'])
+        result = travel_storage.archive(self.dir, 'xz')
+        self.assertEqual(['klaar'], [name for name, before, after in result])
+        self.assertEqual(['klaar.json.xz', 'test.json'],
+                         sorted(fn for fn in os.listdir(self.dir)
+                                if fn.startswith(('klaar.', 'test.'))
+                                and not fn.endswith('.lock')))
+        storage = travel_storage.get_storage('klaar', self.dir)
+        self.assertIs(storage.__class__, travel_storage.XzStorage)
+        self.assertEqual(self.db['2015-01-03'], storage.load()['2015-01-03'])
+        self.assertEqual([], travel_storage.archive(self.dir, 'gzip'))
+
+
+class TestIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = self.tmp.name
+        self.db = {'tour': {'naam': 'test'},
+                   '2015-01-03': {}, '2015-01-01': {}, '2015-01-04': {}}
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_periode(self):
+        index = travel_index.DatumIndex.from_db(self.db)
+        self.assertEqual(['2015-01-03', '2015-01-04'],
+                         index.keys(datetime.date(2015, 1, 2), datetime.date(2015, 1, 5)))
+        self.assertEqual(['2015-01-01'], index.keys(tot=datetime.date(2015, 1, 2)))
+        self.assertEqual(['2015-01-03', '2015-01-04'], index.last(2))
+        self.assertEqual([], index.last(0))
+
+    def test_update(self):
+        travel_index.update_index(self.db, self.dir)
+        self.db['2015-01-05'] = {}
+        travel_index.update_index(self.db, self.dir, ['2015-01-05'])
+        self.db['2015-01-02'] = {}
+        travel_index.update_index(self.db, self.dir, ['2015-01-02', '2015-01-04'])
+        index = travel_index.DatumIndex.read(self.dir, 'test')
+        self.assertEqual(['2015-01-01', '2015-01-02', '2015-01-03', '2015-01-04',
+                          '2015-01-05'], index.keys())
+
+    def test_verouderd(self):
+        travel_index.update_index(self.db, self.dir)
+        self.db['2015-01-05'] = {}
+        index = travel_index.DatumIndex.open(self.db, self.dir)
+        self.assertEqual(4, len(index))
+
+
+class TestCatalog(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = self.tmp.name
+        self.db = {'tour': {'naam': 'test', 'start_datum': datetime.date(2015, 1, 1)},
+                   '2015-01-01': {'afstand': 100, 'eten': 10}}
+        travel_storage.JsonStorage('test', self.dir).save(self.db)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_refresh(self):
+        tours = travel_catalog.refresh(self.dir)
+        self.assertEqual(['test'], list(tours))
+        self.assertEqual(100, tours['test']['totalen']['afstand'])
+        self.assertEqual(datetime.date(2015, 1, 1), tours['test']['start_datum'])
+
+    def test_gewijzigd(self):
+        travel_catalog.refresh(self.dir)
+        self.db['2015-01-02'] = {'afstand': 50}
+        travel_storage.JsonStorage('test', self.dir).save(self.db, ['2015-01-02'])
+        self.assertEqual(150, travel_catalog.refresh(self.dir)['test']['totalen']['afstand'])
+
+    def test_update(self):
+        travel_catalog.refresh(self.dir)
+        with open(travel_catalog.catalog_file(self.dir), 'rb') as infile:
+            before = infile.read()
+        self.db['2015-01-02'] = {'afstand': 50}
+        travel_stats.rebuild_totals(self.db)
+        travel_storage.JsonStorage('test', self.dir).save(self.db, ['2015-01-02'])
+        travel_catalog.update(self.db, self.dir)
+        # alleen de log groeit, de catalogus blijft staan
+        with open(travel_catalog.catalog_file(self.dir), 'rb') as infile:
+            self.assertEqual(before, infile.read())
+        self.assertEqual(150, travel_catalog.read_catalog(self.dir)['test']
+                         ['header']['totalen']['afstand'])
+        self.assertEqual(150, travel_catalog.refresh(self.dir)['test']['totalen']['afstand'])
+        self.assertFalse(os.path.exists(travel_catalog.log_file(self.dir)))
+
+    def test_buiten_travel(self):
+        # opgeslagen door travel, daarna buiten travel om een dag veranderd
+        # met hetzelfde aantal records: de totalen in de header kloppen niet
+        self.db['tour']['version'] = travel.__version__
+        with io.StringIO() as out, contextlib.redirect_stdout(out):
+            travel.save_tour(self.db, self.dir, False)
+        self.assertEqual(100, travel.open_tour('test', self.dir)['tour']['totalen']['afstand'])
+        self.db['2015-01-01'] = {'afstand': 70}
+        travel_storage.JsonStorage('test', self.dir).save(self.db)
+        db = travel.open_tour('test', self.dir)
+        self.assertEqual(100, self.db['tour']['totalen']['afstand'])
+        self.assertEqual(70, travel_stats.get_totals(db)['afstand'])
+        self.assertEqual(70, travel_catalog.refresh(self.dir)['test']['totalen']['afstand'])
+        # weer door travel opgeslagen: de totalen worden vertrouwd
+        with io.StringIO() as out, contextlib.redirect_stdout(out):
+            travel.save_tour(db, self.dir, False)
+        storage = travel_storage.get_storage('test', self.dir)
+        self.assertFalse(travel_catalog.check_totals(storage, storage.load()))
+
+    def test_verwijderd(self):
+        travel_catalog.refresh(self.dir)
+        os.remove(os.path.join(self.dir, 'test.json'))
+        self.assertEqual({}, travel_catalog.refresh(self.dir))
+
+
+class TestReport(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = self.tmp.name
+        for name in ('a', 'b'):
+            travel_storage.JsonStorage(name, self.dir).save(
+                {'tour': {'naam': name, 'budget': 100.0},
+                 '2015-01-31': {'afstand': 100, 'eten': 10},
+                 '2015-02-01': {'hotel': 25}})
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_summarize(self):
+        summary = travel_report.summarize('a', self.dir, 'month')
+        self.assertEqual(['2015-01', '2015-02'], sorted(summary['groups']))
+        self.assertEqual(1, summary['groups']['2015-01']['fietsdagen'])
+        self.assertEqual(25, summary['groups']['2015-02']['hotel'])
+
+    def test_collect(self):
+        rows, budget = travel_report.collect(self.dir, 'year', workers=2)
+        self.assertEqual(200.0, budget)
+        self.assertEqual(4, rows['2015']['records'])
+        self.assertEqual(200, rows['2015']['afstand'])
+
+    def test_collect_kapot(self):
+        # een beschadigde tour wordt gemeld en overgeslagen
+        with open(os.path.join(self.dir, 'kapot.tour'), 'wb') as outfile:
+            outfile.write(b'TRVB')
+        with contextlib.redirect_stdout(io.StringIO()) as out:
+            rows, budget = travel_report.collect(self.dir, workers=2)
+        self.assertIn('Tour kapot kan niet gelezen worden', out.getvalue())
+        self.assertEqual(['a', 'b'], sorted(rows))
+
+
+class TestStartup(unittest.TestCase):
+
+    def test_version_imports(self):
+        # --version mag geen json, sqlite of tour modules laden
+        travel_py = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'travel.py')
+        with tempfile.TemporaryDirectory() as home:
+            proc = subprocess.run([sys.executable, '-X', 'importtime', travel_py,
+                                   '--version'], env=dict(os.environ, HOME=home),
+                                  capture_output=True, text=True)
+        self.assertIn(travel.__version__, proc.stdout)
+        loaded = {line.split('|')[-1].strip() for line in proc.stderr.splitlines()}
+        for module in ('json', 'sqlite3', 'travel_storage', 'concurrent.futures'):
+            self.assertNotIn(module, loaded)
+
+
+class TestImport(unittest.TestCase):
+    fields = (('naar', str), ('afstand', int), ('eten', float), ('hotel', float),
+              ('anders', float), ('opmerkingen', str))
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = {'tour': {'naam': 'test', 'start_datum': datetime.date(2015, 1, 1),
+                            'eind_datum': datetime.date(2015, 1, 3),
+                            'nieuw_record': datetime.date(2015, 1, 1)}}
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write(self, name, text):
+        path = os.path.join(self.tmp.name, name)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        return path
+
+    def test_csv(self):
+        path = self.write('in.csv', 'datum;naar;afstand;eten\n'
+                                    '2015-01-01;amsterdam;100;10.5\n'
+                                    '2015-01-02;utrecht;x;1\n'
+                                    '2015-01-02;utrecht;50;\n')
+        keys, errors = travel_import.import_file(self.db, path, self.fields,
+                                                 travel.validate_datum)
+        self.assertEqual(['2015-01-01', '2015-01-02'], keys)
+        self.assertEqual([2], [rowNr for rowNr, error in errors])
+        self.assertEqual({'naar': 'utrecht', 'afstand': 50}, self.db['2015-01-02'])
+        self.assertEqual(150, self.db['tour']['totalen']['afstand'])
+        self.assertEqual(datetime.date(2015, 1, 3), self.db['tour']['nieuw_record'])
+
+    def test_jsonl(self):
+        path = self.write('in.jsonl', '{"datum": "2015-01-03", "afstand": 10}\n'
+                                      '{kapot\n'
+                                      '{"datum": "2015-02-01"}\n')
+        keys, errors = travel_import.import_file(self.db, path, self.fields,
+                                                 travel.validate_datum)
+        self.assertEqual(['2015-01-03'], keys)
+        self.assertEqual([2, 3], [rowNr for rowNr, error in errors])
+        self.assertIsNone(self.db['tour']['nieuw_record'])
+
+    def test_tsv(self):
+        path = self.write('in.tsv', 'datum\tnaar\teten\n'
+                                    '2015-01-01\tgouda, zh\t1,5\n'
+                                    '2015-01-02\tdelft\t2 USD\n'
+                                    '\tdelft\t2\n')
+        keys, errors = travel_import.import_file(self.db, path, self.fields,
+                                                 travel.validate_datum)
+        self.assertEqual([], keys)
+        # foute waarde, onbekende valuta (zonder quotes) en geen datum
+        self.assertEqual([1, 2, 3], [rowNr for rowNr, error in errors])
+        self.assertEqual('onbekende valuta: USD', errors[1][1])
+        self.assertEqual('datum ontbreekt', errors[2][1])
+
+    def test_bestand(self):
+        # het type volgt uit de extensie, een onleesbaar bestand is een fout
+        # voor het hele bestand
+        for name, text in (('in.txt', '{"datum": "2015-01-01"}\n'),
+                           ('in.csv', '')):
+            path = self.write(name, text)
+            with self.assertRaises(ValueError):
+                travel_import.import_file(self.db, path, self.fields,
+                                          travel.validate_datum)
+        self.assertEqual(['tour'], list(self.db))
+
+
+class TestExport(unittest.TestCase):
+    data = {'tour': {'naam': 'test'},
+            '2015-01-01': {'naar': 'amsterdam', 'afstand': 100, 'eten': 10},
+            '2015-01-02': {'afstand': 50, 'hotel': 25, 'opmerkingen': 'a, b',
+                           'versie': 3, 'valuta': 'EUR'}}
+    keys = ['2015-01-01', '2015-01-02']
+
+    def export(self, fmt, totals=False):
+        out = io.StringIO()
+        travel_export.export(self.data, self.keys, fmt, totals, out)
+        return out.getvalue().splitlines()
+
+    def test_csv(self):
+        lines = self.export('csv', True)
+        self.assertEqual(','.join(travel_export.COLUMNS), lines[0])
+        self.assertEqual('2015-01-02,,50,0,25,0,"a, b"', lines[2])
+        self.assertEqual('totaal,,150,10,25,0,', lines[3])
+
+    def test_tsv(self):
+        self.assertEqual('2015-01-01\tamsterdam\t100\t10\t0\t0\t', self.export('tsv')[1])
+
+    def test_jsonl(self):
+        lines = [json.loads(line) for line in self.export('jsonl', True)]
+        self.assertEqual(dict(self.data['2015-01-01'], datum='2015-01-01'), lines[0])
+        # interne velden gaan niet mee
+        self.assertEqual({'datum': '2015-01-02', 'afstand': 50, 'hotel': 25,
+                          'opmerkingen': 'a, b'}, lines[1])
+        self.assertEqual({'datum': 'totaal', 'afstand': 150, 'eten': 10, 'hotel': 25,
+                          'anders': 0}, lines[2])
+
+
+class TestAtomic(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = {'tour': {'naam': 'test', 'version': '2.5',
+                            'start_datum': datetime.date(2015, 1, 1),
+                            'nieuw_record': datetime.date(2015, 1, 2)},
+                   '2015-01-01': {'naar': 'amsterdam', 'afstand': 100}}
+
+    def tearDown(self):
+        travel_io.WRITE_BEHIND = False
+        travel_io.FSYNC = False
+        self.tmp.cleanup()
+
+    def test_afgebroken(self):
+        path = os.path.join(self.tmp.name, 'test.json')
+        with travel_io.AtomicFile(path) as f:
+            f.write('oud')
+        with self.assertRaises(KeyboardInterrupt):
+            with travel_io.AtomicFile(path) as f:
+                f.write('half')
+                raise KeyboardInterrupt
+        with open(path, encoding='utf-8') as f:
+            self.assertEqual('oud', f.read())
+        self.assertEqual(['test.json'], os.listdir(self.tmp.name))
+
+    def test_write_behind(self):
+        travel_io.WRITE_BEHIND = True
+        travel_io.FSYNC = True
+        with io.StringIO() as out, contextlib.redirect_stdout(out):
+            travel.save_tour(self.db, self.tmp.name, False)
+            self.db['2015-01-02'] = {'naar': 'utrecht', 'afstand': 50}
+            travel.save_tour(self.db, self.tmp.name, False, ['2015-01-02'])
+            # de kopie is al gemaakt, latere wijzigingen gaan niet mee
+            self.db['2015-01-03'] = {'naar': 'gouda'}
+            self.assertTrue(travel_io.wait())
+        del self.db['2015-01-03']
+        self.assertEqual(1, self.db['tour']['journal'])
+        self.assertEqual(self.db, travel.open_tour('test', self.tmp.name))
+
+    def test_write_behind_samenvoegen(self):
+        with io.StringIO() as out, contextlib.redirect_stdout(out):
+            travel.save_tour(self.db, self.tmp.name, False)
+            db = travel.open_tour('test', self.tmp.name)
+            # een ander proces voegt intussen een dag toe
+            other = travel.open_tour('test', self.tmp.name)
+            other['2015-01-05'] = {'naar': 'delft'}
+            travel.save_tour(other, self.tmp.name, False, ['2015-01-05'],
+                             bases={'2015-01-05': None})
+            travel_io.WRITE_BEHIND = True
+            db['2015-01-02'] = {'naar': 'utrecht'}
+            travel.save_tour(db, self.tmp.name, False, ['2015-01-02'],
+                             bases={'2015-01-02': None})
+            # de worker schrijft alleen de kopie, de tour zelf blijft van
+            # de main thread
+            travel_io.writer().queue.join()
+            self.assertNotIn('2015-01-05', db)
+            self.assertTrue(travel_io.wait())
+        # de dag van de ander staat nu ook in de tour zelf
+        self.assertEqual('delft', db['2015-01-05']['naar'])
+        storage = travel_storage.get_storage('test', self.tmp.name)
+        self.assertFalse(travel_lock.changed_on_disk(storage, db))
+        self.assertEqual(['2015-01-01', '2015-01-02', '2015-01-05'],
+                         sorted(k for k in storage.load() if k != 'tour'))
+
+
+@unittest.skipUnless(hasattr(socket, 'AF_UNIX'), 'geen unix sockets')
+class TestDaemon(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = self.tmp.name
+        self.db = {'tour': {'naam': 'test', 'version': '2.5', 'omschrijving': '',
+                            'start_datum': datetime.date(2015, 1, 1),
+                            'eind_datum': datetime.date(2015, 1, 31),
+                            'nieuw_record': datetime.date(2015, 1, 2)},
+                   '2015-01-01': {'naar': 'amsterdam', 'afstand': 100}}
+        with io.StringIO() as out, contextlib.redirect_stdout(out):
+            travel.save_tour(self.db, self.dir, False)
+        self.path = os.path.join(self.dir, travel_daemon.SOCKET)
+        self.server = travel_daemon.Server(self.dir, travel.view_record,
+                                           travel.print_stats, travel.write_tour, 60)
+        self.thread = threading.Thread(target=asyncio.run,
+                                       args=(self.server.run(self.path),))
+        self.thread.start()
+        for i in range(100):
+            self.client = travel_daemon.connect(self.path)
+            if self.client:
+                break
+            time.sleep(0.01)
+
+    def tearDown(self):
+        self.client.request('shutdown')
+        self.client.close()
+        self.thread.join()
+        self.tmp.cleanup()
+
+    def test_geen_daemon(self):
+        self.assertIsNone(travel_daemon.connect(os.path.join(self.dir, 'geen.sock')))
+
+    def test_put_print(self):
+        reply = self.client.request('put', tour='test', key='2015-01-02',
+                                    record={'naar': 'utrecht', 'afstand': 50},
+                                    nieuw_record=datetime.date(2015, 1, 3))
+        self.assertTrue(reply['ok'])
+        self.assertIn('150 km', reply['output'])
+        reply = self.client.request('print', tour='test', last=1)
+        self.assertIn('2015-01-02 utrecht', reply['output'])
+        # debounce van 60 s: nog niet op disk, release schrijft weg
+        self.assertNotIn('2015-01-02', travel.open_tour('test', self.dir))
+        self.client.request('release', tour='test')
+        db = travel.open_tour('test', self.dir)
+        self.assertEqual({'naar': 'utrecht', 'afstand': 50, 'versie': 1},
+                         db['2015-01-02'])
+        self.assertEqual(datetime.date(2015, 1, 3), db['tour']['nieuw_record'])
+
+    def test_samenvoegen(self):
+        # de daemon houdt de tour vast terwijl een ander de bestanden schrijft
+        self.client.request('put', tour='test', key='2015-01-02',
+                            record={'naar': 'utrecht'})
+        self.client.request('put', tour='test', key='2015-01-01',
+                            record={'naar': 'daemon'})
+        other = travel.open_tour('test', self.dir)
+        other['2015-01-03'] = {'naar': 'gouda'}
+        old = other['2015-01-01']
+        other['2015-01-01'] = {'naar': 'cli'}
+        with io.StringIO() as out, contextlib.redirect_stdout(out):
+            travel.save_tour(other, self.dir, False, ['2015-01-01', '2015-01-03'],
+                             bases={'2015-01-01': travel_lock.version(old),
+                                    '2015-01-03': None})
+        with contextlib.redirect_stdout(io.StringIO()) as out:
+            self.client.request('flush')
+        self.assertIn('2015-01-01 is intussen', out.getvalue())
+        db = travel.open_tour('test', self.dir)
+        self.assertEqual('utrecht', db['2015-01-02']['naar'])
+        self.assertEqual('gouda', db['2015-01-03']['naar'])
+        # de wijziging van de ander wordt niet overschreven
+        self.assertEqual('cli', db['2015-01-01']['naar'])
+        reply = self.client.request('print', tour='test', last=3)
+        for key in ('2015-01-01', '2015-01-02', '2015-01-03'):
+            self.assertIn(key, reply['output'])
+
+    def test_onbekende_tour(self):
+        reply = self.client.request('header', tour='geen')
+        self.assertFalse(reply['ok'])
+        self.assertTrue(reply['missing'])
+
+
+STRESS_WORKER = '''
+import sys, datetime, contextlib, io
+sys.path.insert(0, sys.argv[1])
+import travel, travel_lock, travel_stats
+traveldir, worker, days = sys.argv[2], int(sys.argv[3]), int(sys.argv[4])
+for day in range(days):
+    db = travel.open_tour('test', traveldir)
+    key = (datetime.date(2015, 1, 1) + datetime.timedelta(days=worker * days + day)) \\
+            .isoformat()
+    old = db.get(key)
+    db[key] = {'naar': 'w{}'.format(worker), 'afstand': 10}
+    travel_stats.update_totals(db, old, db[key])
+    with contextlib.redirect_stdout(io.StringIO()):
+        travel.save_tour(db, traveldir, False, [key], bases={key: travel_lock.version(old)})
+'''
+
+
+class TestLock(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = self.tmp.name
+        db = {'tour': {'naam': 'test', 'version': '2.5',
+                       'start_datum': datetime.date(2015, 1, 1),
+                       'eind_datum': datetime.date(2015, 12, 31),
+                       'nieuw_record': datetime.date(2015, 1, 2)},
+              '2015-01-01': {'naar': 'amsterdam', 'afstand': 100}}
+        self.save(db)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def save(self, db, key=None, old=None):
+        with io.StringIO() as out, contextlib.redirect_stdout(out):
+            if key is None:
+                travel.save_tour(db, self.dir, False)
+                return
+            travel.save_tour(db, self.dir, False, [key],
+                             bases={key: travel_lock.version(old)})
+            return out.getvalue()
+
+    def test_samenvoegen(self):
+        # twee sessies: de een voegt een dag toe, de ander bewerkt een andere dag
+        one = travel.open_tour('test', self.dir)
+        two = travel.open_tour('test', self.dir)
+        one['2015-01-02'] = {'naar': 'utrecht', 'afstand': 50}
+        one['tour']['nieuw_record'] = datetime.date(2015, 1, 3)
+        self.save(one, '2015-01-02')
+        old = two['2015-01-01']
+        two['2015-01-01'] = {'naar': 'haarlem', 'afstand': 20}
+        self.save(two, '2015-01-01', old)
+        db = travel.open_tour('test', self.dir)
+        self.assertEqual('utrecht', db['2015-01-02']['naar'])
+        self.assertEqual({'naar': 'haarlem', 'afstand': 20, 'versie': 1}, db['2015-01-01'])
+        self.assertEqual(datetime.date(2015, 1, 3), db['tour']['nieuw_record'])
+        self.assertEqual(70, travel_stats.get_totals(db)['afstand'])
+
+    def test_conflict(self):
+        one = travel.open_tour('test', self.dir)
+        two = travel.open_tour('test', self.dir)
+        old = one['2015-01-01']
+        one['2015-01-01'] = {'naar': 'haarlem'}
+        self.save(one, '2015-01-01', old)
+        two['2015-01-01'] = {'naar': 'leiden'}
+        self.assertIn('2015-01-01 is intussen', self.save(two, '2015-01-01', old))
+        db = travel.open_tour('test', self.dir)
+        self.assertEqual('haarlem', db['2015-01-01']['naar'])
+
+    @unittest.skipIf(travel_lock.fcntl is None, 'geen fcntl')
+    def test_stress(self):
+        # N processen voegen tegelijk dagen toe aan dezelfde tour
+        workers, days = 4, 10
+        root = os.path.dirname(os.path.abspath(__file__))
+        procs = [subprocess.Popen([sys.executable, '-c', STRESS_WORKER, root, self.dir,
+                                   str(worker + 1), str(days)])
+                 for worker in range(workers)]
+        for proc in procs:
+            self.assertEqual(0, proc.wait())
+        db = travel.open_tour('test', self.dir)
+        self.assertEqual(workers * days + 1, len(db) - 1)
+        self.assertEqual(100 + workers * days * 10, travel_stats.get_totals(db)['afstand'])
+
+
+class TestWindow(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = self.tmp.name
+        self.db = {'tour': {'naam': 'test', 'start_datum': datetime.date(2015, 1, 1)}}
+        for day in range(1, 41):
+            key = datetime.date(2015, 1, 1) + datetime.timedelta(days=day - 1)
+            self.db[key.isoformat()] = {'afstand': day % 3 * 10, 'eten': day * 1.1}
+        self.save()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def save(self, changed=None):
+        with io.StringIO() as out, contextlib.redirect_stdout(out):
+            travel.save_tour(self.db, self.dir, False, changed)
+
+    def expected(self, van, tot):
+        keys = [key for key in self.db if key != 'tour'
+                and van.isoformat() <= key <= tot.isoformat()]
+        return (len(keys), sum(self.db[key].get('afstand', 0) for key in keys),
+                round(sum(self.db[key].get('eten', 0) for key in keys), 2))
+
+    def window(self, van, tot):
+        with travel_window.PrefixSums.open(self.db, self.dir) as sums:
+            w = sums.window(van, tot)
+        return w['records'], w['afstand'], w['eten']
+
+    def test_window(self):
+        van, tot = datetime.date(2015, 1, 10), datetime.date(2015, 1, 16)
+        self.assertEqual(self.expected(van, tot), self.window(van, tot))
+        with travel_window.PrefixSums.open(self.db, self.dir) as sums:
+            van, tot, w = sums.last_days(7)
+            self.assertEqual(datetime.date(2015, 2, 9), tot)
+            months = dict(sums.periods('month'))
+        self.assertEqual(31, months['2015-01']['records'])
+        self.assertEqual(9, months['2015-02']['records'])
+
+    def test_window_kort(self):
+        # een venster langer dan de tour deelt door de dagen van de tour
+        self.db['tour']['budget'] = 1000
+        with travel_window.PrefixSums.open(self.db, self.dir) as sums, \
+                io.StringIO() as out, contextlib.redirect_stdout(out):
+            travel_window.print_window(self.db['tour'], sums, 100)
+            lines = out.getvalue().splitlines()
+        kosten = round(sum(day * 1.1 for day in range(1, 41)), 2)
+        self.assertEqual('Laatste 40 dagen (2015-01-01 - 2015-02-09):', lines[0])
+        self.assertIn('(€ {:.2f} per dag)'.format(kosten / 40), lines[2])
+        self.assertIn('op na {:.0f} dagen'.format((1000 - kosten) / (kosten / 40)),
+                      lines[3])
+
+    def test_window_ongeldig(self):
+        self.assertEqual(7, travel.positive_int('7'))
+        travel_py = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'travel.py')
+        for value in ('0', '-3', 'x'):
+            with self.subTest(value=value):
+                proc = subprocess.run([sys.executable, travel_py, '--stats',
+                                       '--window', value],
+                                      env=dict(os.environ, HOME=self.dir),
+                                      capture_output=True, text=True)
+                self.assertEqual(2, proc.returncode)
+                self.assertIn('--window', proc.stderr)
+
+    def test_bijwerken(self):
+        # toevoegen na het eind (met een gat) en bewerken in het midden
+        self.db['2015-02-12'] = {'afstand': 70, 'eten': 3}
+        self.db['2015-01-05'] = {'afstand': 1000}
+        travel_stats.rebuild_totals(self.db)
+        self.save(['2015-01-05', '2015-02-12'])
+        base, rows = travel_window.build(self.db)
+        with open(travel_window.sums_file(self.dir, 'test'), 'rb') as f:
+            f.seek(travel_window.HEAD.size)
+            stored = array.array('d', f.read())
+        self.assertEqual(len(rows), len(stored))
+        for a, b in zip(rows, stored):
+            self.assertAlmostEqual(a, b)
+        van, tot = datetime.date(2015, 1, 1), datetime.date(2015, 2, 12)
+        self.assertEqual(self.expected(van, tot), self.window(van, tot))
+
+    def test_verouderd(self):
+        # sommen die niet met de totalen kloppen worden opnieuw opgebouwd
+        self.db['2015-01-02']['afstand'] = 500
+        travel_stats.rebuild_totals(self.db)
+        van, tot = datetime.date(2015, 1, 1), datetime.date(2015, 1, 3)
+        self.assertEqual(self.expected(van, tot), self.window(van, tot))
+
+
+class TestSearch(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = self.tmp.name
+        self.db = {'tour': {'naam': 'test', 'start_datum': datetime.date(2015, 1, 1)},
+                   '2015-01-01': {'naar': 'Amsterdam', 'opmerkingen': 'Regen, tegenwind'},
+                   '2015-01-02': {'naar': 'Utrecht', 'opmerkingen': 'zon'},
+                   '2015-01-03': {'naar': 'Amersfoort', 'opmerkingen': 'café gesloten'}}
+        self.save(self.db)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def save(self, db, changed=None):
+        with io.StringIO() as out, contextlib.redirect_stdout(out):
+            travel.save_tour(db, self.dir, False, changed)
+
+    def keys(self, query, **kwargs):
+        return [r[1] for r in travel_search.search(self.dir, query, **kwargs)]
+
+    def test_prefix(self):
+        self.assertEqual(['2015-01-01', '2015-01-03'], self.keys('am'))
+        self.assertEqual(['2015-01-01'], self.keys('am regen'))
+        self.assertEqual(['2015-01-03'], self.keys('CAFE'))
+        self.assertEqual(['2015-01-03'], self.keys('am', van=datetime.date(2015, 1, 2)))
+        self.assertEqual([], self.keys('amx'))
+
+    def test_bijwerken(self):
+        self.db['2015-01-02'] = {'naar': 'Gouda'}
+        self.db['2015-01-04'] = {'naar': 'Utrecht'}
+        self.save(self.db, ['2015-01-02', '2015-01-04'])
+        self.assertEqual(['2015-01-04'], self.keys('utrecht'))
+        self.assertEqual([], self.keys('zon'))
+        self.assertEqual(['2015-01-02'], self.keys('gou'))
+
+    def test_alle_tours(self):
+        other = {'tour': {'naam': 'ander', 'start_datum': datetime.date(2016, 1, 1)},
+                 '2016-01-01': {'naar': 'Amstelveen'}}
+        self.save(other)
+        os.remove(travel_search.words_file(self.dir, 'ander'))
+        results = travel_search.search(self.dir, 'amst')
+        self.assertEqual([('ander', '2016-01-01'), ('test', '2015-01-01')],
+                         [r[:2] for r in results])
+        self.assertEqual(['2016-01-01'], self.keys('amst', names=['ander']))
+
+
+class TestTrace(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = {'tour': {'naam': 'test', 'version': '2.5',
+                            'start_datum': datetime.date(2015, 1, 1),
+                            'nieuw_record': datetime.date(2015, 1, 2)},
+                   '2015-01-01': {'naar': 'amsterdam', 'afstand': 100}}
+
+    def tearDown(self):
+        travel_trace.reset()
+        self.tmp.cleanup()
+
+    def test_uit(self):
+        with travel_trace.span('laden'):
+            travel_trace.count('records gelezen')
+        travel_trace.enable()
+        out = io.StringIO()
+        travel_trace.report(out)
+        self.assertNotIn('laden', out.getvalue())
+        self.assertNotIn('records gelezen', out.getvalue())
+
+    def test_fases(self):
+        profile = os.path.join(self.tmp.name, 'run.prof')
+        travel_trace.enable(profile)
+        with io.StringIO() as devnull, contextlib.redirect_stdout(devnull):
+            travel.save_tour(self.db, self.tmp.name, False)
+            travel.open_tour('test', self.tmp.name)
+        out = io.StringIO()
+        travel_trace.report(out)
+        lines = out.getvalue().splitlines()
+        names = [line.split()[0] for line in lines[2:]]
+        self.assertLess(names.index('opslaan'), names.index('opslag'))
+        self.assertIn('  opslag', '\n'.join(lines))
+        self.assertIn('journal', names)
+        self.assertTrue([line for line in lines if line.startswith('records gelezen')
+                         and line.split()[-1] == '1'])
+        self.assertTrue(os.path.exists(profile))
+        self.assertFalse(travel_trace.enabled())
+
+
+class TestModel(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = {'tour': {'naam': 'test', 'version': '2.5',
+                            'start_datum': datetime.date(2015, 1, 1),
+                            'nieuw_record': datetime.date(2015, 1, 4)},
+                   '2015-01-03': {'naar': 'Utrecht', 'afstand': 40, 'eten': 7.5},
+                   '2015-01-01': {'naar': 'Amsterdam', 'afstand': 100, 'foto': 'a.jpg'},
+                   '2015-01-02': {'naar': 'Amsterdam'}}
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_day(self):
+        day = travel_model.Day({'naar': 'Gouda', 'afstand': 30, 'foto': 'b.jpg'})
+        self.assertFalse(hasattr(day, '__dict__'))
+        self.assertEqual(30, day['afstand'])
+        self.assertEqual(0, day.get('eten', 0))
+        self.assertNotIn('eten', day)
+        self.assertIn('foto', day)
+        self.assertRaises(KeyError, day.__getitem__, 'hotel')
+        day['versie'] = 2
+        self.assertEqual({'naar': 'Gouda', 'afstand': 30, 'versie': 2, 'foto': 'b.jpg'},
+                         day.to_dict())
+        self.assertEqual(day, day.to_dict())
+
+    def test_tour(self):
+        tour = travel_model.Tour.from_db(self.db)
+        self.assertEqual(['2015-01-01', '2015-01-02', '2015-01-03'], list(tour))
+        self.assertNotIn('tour', tour)
+        self.assertEqual('test', tour.header['naam'])
+        # plaatsnamen staan maar een keer in het geheugen
+        self.assertIs(tour['2015-01-01'].naar, tour['2015-01-02'].naar)
+        tour['2014-12-31'] = {'naar': 'Haarlem'}
+        self.assertEqual('2014-12-31', next(iter(tour)))
+        self.assertEqual(4, len(tour))
+
+    def test_opslaan(self):
+        # de view van een Tour gaat door dezelfde opslag en stats als een dict
+        tour = travel_model.Tour.from_db(self.db)
+        db = tour.to_db()
+        travel_stats.update_totals(db, None, db['2015-01-03'])
+        with io.StringIO() as out, contextlib.redirect_stdout(out):
+            travel.save_tour(db, self.tmp.name, False)
+        self.assertEqual(140, tour.header['totalen']['afstand'])
+        loaded = travel_model.Tour.load('test', self.tmp.name)
+        self.assertEqual(tour.header['totalen'], loaded.header['totalen'])
+        for key in tour:
+            self.assertEqual(tour[key].to_dict(), loaded[key].to_dict())
+        with open(os.path.join(self.tmp.name, 'test.json'), encoding='utf-8') as infile:
+            self.assertEqual({'naar': 'Amsterdam', 'afstand': 100, 'foto': 'a.jpg'},
+                             json.load(infile)['2015-01-01'])
+
+
+class TestShard(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = self.tmp.name
+        self.db = {'tour': {'naam': 'lang', 'version': '2.5',
+                            'start_datum': datetime.date(2014, 12, 30),
+                            'eind_datum': datetime.date(9999, 12, 31),
+                            'nieuw_record': datetime.date(2015, 3, 2)}}
+        day = datetime.date(2014, 12, 30)
+        while day < datetime.date(2015, 3, 2):
+            self.db[day.isoformat()] = {'naar': 'x', 'afstand': day.day, 'eten': 1.5}
+            day += datetime.timedelta(days=1)
+        travel_shard.PERIOD = 'month'
+        self.save(self.db)
+
+    def tearDown(self):
+        travel_shard.PERIOD = 'year'
+        self.tmp.cleanup()
+
+    def save(self, db, changed=None, bases=None):
+        with io.StringIO() as out, contextlib.redirect_stdout(out):
+            travel.save_tour(db, self.dir, False, changed, 'sharded', bases)
+
+    def test_shards(self):
+        storage = travel_storage.get_storage('lang', self.dir)
+        self.assertIs(storage.__class__, travel_shard.ShardedStorage)
+        self.assertEqual(['2014-12', '2015-01', '2015-02', '2015-03'], storage.shards())
+        self.assertEqual(['lang'], travel_storage.tour_names(self.dir))
+        db = storage.load()
+        self.assertEqual(len(self.db), len(db))
+        self.assertEqual(self.db['2015-01-05'], db['2015-01-05'])
+        self.assertEqual(['2015-02-27', '2015-02-28', '2015-03-01'],
+                         [key for key, rec in storage.records(
+                             datetime.date(2015, 2, 27), datetime.date(2015, 3, 31))])
+
+    def test_toevoegen(self):
+        db = travel.open_tour('lang', self.dir, days=[])
+        # alleen de shard van nieuw_record (en de nieuwste)
+        self.assertEqual({'tour', '2015-03-01'}, set(db))
+        self.assertEqual(len(self.db) - 1, travel_stats.record_count(db))
+        db['2015-03-02'] = {'naar': 'y', 'afstand': 10}
+        travel_stats.update_totals(db, None, db['2015-03-02'])
+        self.save(db, ['2015-03-02'], {'2015-03-02': None})
+        storage = travel_storage.get_storage('lang', self.dir)
+        self.assertEqual(['2014-12', '2015-01', '2015-02', '2015-03'], storage.shards())
+        full = storage.load()
+        totals = dict(full['tour']['totalen'])
+        self.assertEqual(totals, travel_stats.rebuild_totals(full))
+        self.assertEqual(len(self.db), totals['records'])
+        self.assertEqual(len(full) - 1, len(travel_index.DatumIndex.read(self.dir, 'lang')))
+        self.assertEqual(['2015-03-02'], [r[1] for r in travel_search.search(self.dir, 'y')])
+
+    def test_bewerken(self):
+        db = travel.open_tour('lang', self.dir, days=['2015-01-10'])
+        # januari, de nieuwste shard (maart) en de header
+        self.assertEqual(31 + 1 + 1, len(db))
+        old = db['2015-01-10']
+        db['2015-01-10'] = dict(old, eten=11.5)
+        travel_stats.update_totals(db, old, db['2015-01-10'])
+        # write-behind schrijft een kopie, die moet ook gedeeltelijk blijven
+        snapshot = __import__('copy').copy(db)
+        self.assertEqual(travel_stats.record_count(db), travel_stats.record_count(snapshot))
+        self.save(db, ['2015-01-10'], {'2015-01-10': travel_lock.version(old)})
+        full = travel_storage.get_storage('lang', self.dir).load()
+        self.assertEqual(11.5, full['2015-01-10']['eten'])
+        self.assertEqual(len(self.db) - 1, len(full) - 1)
+        totals = dict(full['tour']['totalen'])
+        self.assertEqual(totals, travel_stats.rebuild_totals(full))
+        # opnieuw opbouwen laadt de rest van de shards
+        travel_stats.whole(db)
+        self.assertEqual(len(full), len(db))
+
+    def test_convert(self):
+        # heen en terug: de backups zijn geen tours
+        travel_storage.convert('lang', self.dir, 'json')
+        self.assertEqual(['lang'], travel_storage.tour_names(self.dir))
+        travel_storage.convert('lang', self.dir, 'sharded')
+        travel_storage.convert('lang', self.dir, 'json')
+        self.assertEqual(['lang'], travel_storage.tour_names(self.dir))
+        self.assertTrue(os.path.isdir(os.path.join(self.dir, 'lang.sharded.old')))
+        self.assertEqual(len(self.db), len(travel_storage.get_storage('lang', self.dir).load()))
+
+
+class TestRates(unittest.TestCase):
+
+    def setUp(self):
+        self.conf = {'last-used': '', 'USD': 0.5,
+                     'koersen': {'THB': [['', 0.025], ['2015-01-03', 0.03]]}}
+        travel_rates.configure(self.conf)
+
+    def tearDown(self):
+        travel_rates.configure({})
+
+    def test_koers(self):
+        rates = travel_rates.RATES
+        self.assertEqual(0.025, rates.rate('THB', '2015-01-02'))
+        self.assertEqual(0.03, rates.rate('THB', '2015-01-03'))
+        self.assertEqual(0.03, rates.rate('THB'))
+        self.assertEqual(0.5, rates.rate('USD', '2015-01-01'))
+        self.assertEqual(10.0, travel.geld('20usd', '2015-01-01'))
+        self.assertEqual(7.5, travel.geld('7.5'))
+        self.assertRaises(KeyError, travel.geld, '1GBP')
+        travel_rates.add_rate(self.conf, 'USD', '2015-01-02', 0.8)
+        self.assertNotIn('USD', self.conf)
+        self.assertEqual([['', 0.5], ['2015-01-02', 0.8]], self.conf['koersen']['USD'])
+        self.assertEqual(8.0, travel.geld('10USD', '2015-01-05'))
+
+    def test_origineel(self):
+        record = {}
+        travel_rates.set_amount(record, 'eten', '400thb', '2015-01-03')
+        self.assertEqual({'eten': 12.0, 'valuta': {'eten': [[400.0, 'THB']]}}, record)
+        new = {}
+        travel_rates.set_amount(new, 'eten', '+2', '2015-01-03', record)
+        self.assertEqual(14.0, new['eten'])
+        self.assertEqual([[400.0, 'THB'], [2.0, 'EUR']], new['valuta']['eten'])
+        euro = {}
+        travel_rates.set_amount(euro, 'hotel', '+2', '2015-01-03', {'hotel': 3.0})
+        self.assertEqual({'hotel': 5.0}, euro)
+
+    def test_reprice(self):
+        db = {'tour': {'naam': 'test'}, '2015-01-01': {'eten': 4.0},
+              '2015-01-02': {}, '2015-01-03': {}}
+        travel_rates.set_amount(db['2015-01-02'], 'eten', '400thb', '2015-01-02')
+        travel_rates.set_amount(db['2015-01-03'], 'hotel', '1000thb', '2015-01-03')
+        travel_rates.set_amount(db['2015-01-03'], 'hotel', '+5', '2015-01-03',
+                                dict(db['2015-01-03']))
+        self.assertEqual([], travel_rates.reprice(db))
+        travel_rates.add_rate(self.conf, 'THB', '2015-01-03', 0.02)
+        self.assertEqual(['2015-01-03'], travel_rates.reprice(db))
+        self.assertEqual(25.0, db['2015-01-03']['hotel'])
+        self.assertEqual(10.0, db['2015-01-02']['eten'])
+        self.assertEqual(4.0, db['2015-01-01']['eten'])
+
+    def test_import(self):
+        datum, record = travel_import.convert_row(
+                {'datum': '2015-01-03', 'eten': '100 thb', 'naar': 'x'},
+                travel.RECORD_FIELDS, travel.validate_datum)
+        self.assertEqual(3.0, record['eten'])
+        self.assertEqual({'eten': [[100.0, 'THB']]}, record['valuta'])
+
+
+class TestMigrate(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = self.tmp.name
+        start = datetime.date(2015, 1, 1).toordinal()
+        # tour van voor 2.3: datums als ordinal, geen totalen
+        self.old = {'tour': {'naam': 'oud', 'version': '2.2', 'budget': 10.0,
+                             'start_datum': start, 'eind_datum': start + 9,
+                             'nieuw_record': 0},
+                    '2015-01-01': {'naar': 'a', 'afstand': 50, 'eten': 4.0},
+                    '2015-01-02': {'naar': 'b', 'afstand': 0, 'hotel': 6.0}}
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write_old(self, name='oud'):
+        with open(os.path.join(self.dir, name + '.json'), 'w') as outfile:
+            json.dump(dict(self.old, tour=dict(self.old['tour'], naam=name)), outfile)
+
+    def test_upgrade(self):
+        self.assertTrue(travel_migrate.needs_upgrade(self.old['tour']))
+        self.assertEqual(['2.3'], travel_migrate.upgrade(self.old))
+        tour = self.old['tour']
+        self.assertEqual(travel.__version__, travel_migrate.current())
+        self.assertEqual(travel.__version__, tour['version'])
+        self.assertEqual(datetime.date(2015, 1, 10), tour['eind_datum'])
+        self.assertIsNone(tour['nieuw_record'])
+        self.assertEqual(50, tour['totalen']['afstand'])
+        self.assertFalse(travel_migrate.needs_upgrade(tour))
+        self.assertEqual([], travel_migrate.upgrade(self.old))
+        self.assertLess(travel_migrate.parse_version('2.9'),
+                        travel_migrate.parse_version('2.10'))
+
+    def test_keten(self):
+        @travel_migrate.step('2.10')
+        def hernoem(db):
+            db['tour']['titel'] = db['tour'].pop('omschrijving', '')
+
+        @travel_migrate.step('2.9')
+        def omschrijving(db):
+            db['tour']['omschrijving'] = 'x'
+        try:
+            self.assertEqual('2.10', travel_migrate.current())
+            self.assertEqual(['2.3', '2.9', '2.10'], travel_migrate.upgrade(self.old))
+            self.assertEqual('2.10', self.old['tour']['version'])
+            self.assertEqual('x', self.old['tour']['titel'])
+        finally:
+            travel_migrate.STEPS[:] = [s for s in travel_migrate.STEPS
+                                       if s[1] not in (hernoem, omschrijving)]
+
+    def test_open_tour(self):
+        self.write_old()
+        with contextlib.redirect_stdout(io.StringIO()):
+            db = travel.open_tour('oud', self.dir)
+        self.assertEqual(travel_migrate.current(), db['tour']['version'])
+        header = travel_storage.JsonStorage('oud', self.dir).header()
+        self.assertEqual(travel_migrate.current(), header['version'])
+        self.assertEqual(datetime.date(2015, 1, 1), header['start_datum'])
+
+    def test_opslaan(self):
+        # opslaan zet de versie van travel in de header, behalve bij een tour
+        # die nog bijgewerkt moet worden
+        db = dict(self.old, tour=dict(self.old['tour'], version='2.5'))
+        with contextlib.redirect_stdout(io.StringIO()):
+            travel.save_tour(db, self.dir, False)
+        self.assertEqual(travel.__version__, db['tour']['version'])
+        header = travel_storage.JsonStorage('oud', self.dir).header()
+        self.assertEqual(travel.__version__, header['version'])
+        with contextlib.redirect_stdout(io.StringIO()):
+            travel.save_tour(self.old, self.dir, False)
+        self.assertEqual('2.2', self.old['tour']['version'])
+
+    def test_migrate_all(self):
+        self.write_old('oud')
+        self.write_old('ouder')
+        nieuw = dict(self.old, tour=dict(self.old['tour'], naam='nieuw'))
+        travel_migrate.upgrade(nieuw)
+        travel_storage.JsonStorage('nieuw', self.dir).save(nieuw)
+        with contextlib.redirect_stdout(io.StringIO()) as out:
+            done = travel_migrate.migrate_all(self.dir, workers=2)
+        self.assertEqual(['oud', 'ouder'], sorted(name for name, old, new in done))
+        self.assertIn('[3/3]', out.getvalue())
+        for name in ('oud', 'ouder'):
+            db = travel_storage.JsonStorage(name, self.dir).load()
+            self.assertEqual(travel.__version__, db['tour']['version'])
+            self.assertEqual(self.old['2015-01-02'], db['2015-01-02'])
+        self.assertEqual(3, len(travel_catalog.read_catalog(self.dir)))
+
+
+class TestSync(unittest.TestCase):
+    # twee datadirs als telefoon en laptop
+
+    def setUp(self):
+        self.tmpA = tempfile.TemporaryDirectory()
+        self.tmpB = tempfile.TemporaryDirectory()
+        self.a, self.b = self.tmpA.name, self.tmpB.name
+        db = {'tour': {'naam': 'tour', 'version': '2.6',
+                       'start_datum': datetime.date(2015, 1, 1),
+                       'eind_datum': datetime.date(2015, 3, 31),
+                       'nieuw_record': datetime.date(2015, 2, 2)},
+              '2015-01-01': {'naar': 'a', 'afstand': 10},
+              '2015-01-02': {'naar': 'b', 'afstand': 20},
+              '2015-02-01': {'naar': 'c', 'afstand': 30}}
+        travel_stats.get_totals(db)
+        travel.write_tour(db, self.a)
+
+    def tearDown(self):
+        self.tmpA.cleanup()
+        self.tmpB.cleanup()
+
+    def sync(self):
+        return travel_sync.sync(self.a, self.b, travel.write_tour)
+
+    def edit(self, traveldir, key, record):
+        db = travel.open_tour('tour', traveldir)
+        bases = {key: travel_lock.version(db.get(key))}
+        travel_stats.update_totals(db, db.get(key), record)
+        db[key] = record
+        if key >= db['tour']['nieuw_record'].isoformat():
+            db['tour']['nieuw_record'] = datetime.date.fromisoformat(key) + \
+                    datetime.timedelta(days=1)
+        travel.write_tour(db, traveldir, [key], bases=bases)
+
+    def load(self, traveldir):
+        return travel_storage.get_storage('tour', traveldir).load()
+
+    def test_digest(self):
+        self.edit(self.a, '2015-01-02', {'naar': 'x'})
+        self.edit(self.a, '2015-03-01', {'naar': 'y'})
+        self.assertTrue(os.path.exists(travel_sync.log_file(self.a, 'tour')))
+        digest = travel_sync.Digest.read(self.a, 'tour')
+        full = travel_sync.Digest.from_db(self.load(self.a))
+        self.assertEqual(full.months, digest.months)
+        self.assertEqual(full.root(), travel_sync.open_digest('tour', self.a).root())
+        # buiten travel om geschreven: de digest wordt opnieuw opgebouwd
+        db = self.load(self.a)
+        db['2015-01-01']['naar'] = 'z'
+        travel_storage.JsonStorage('tour', self.a).save(db)
+        self.assertNotEqual(full.root(), travel_sync.open_digest('tour', self.a).root())
+        other = travel_sync.Digest.from_db({'2015-01-02': {'naar': 'b', 'afstand': 20},
+                                            '2015-02-01': {'naar': 'c', 'afstand': 30}})
+        self.assertEqual(['2015-01-01', '2015-01-02', '2015-03-01'], full.diff(other))
+
+    def test_sync(self):
+        self.assertEqual([('tour', None, 'nieuw ->')], self.sync())
+        self.assertEqual([], self.sync())
+        # telefoon (a) en laptop (b) los van elkaar gewijzigd
+        self.edit(self.a, '2015-01-01', {'naar': 'a2', 'afstand': 11})
+        self.edit(self.b, '2015-02-02', {'naar': 'd', 'afstand': 40})
+        self.edit(self.a, '2015-01-02', {'naar': 'telefoon'})
+        self.edit(self.b, '2015-01-02', {'naar': 'laptop'})
+        self.assertEqual([('tour', '2015-01-01', '->'), ('tour', '2015-01-02', 'conflict'),
+                          ('tour', '2015-02-02', '<-')], self.sync())
+        a, b = self.load(self.a), self.load(self.b)
+        self.assertEqual('a2', b['2015-01-01']['naar'])
+        self.assertEqual('d', a['2015-02-02']['naar'])
+        self.assertEqual('telefoon', a['2015-01-02']['naar'])
+        self.assertEqual('laptop', b['2015-01-02']['naar'])
+        self.assertEqual(datetime.date(2015, 2, 3), a['tour']['nieuw_record'])
+        self.assertEqual(81, travel_stats.get_totals(a)['afstand'])
+        # het conflict blijft tot een kant het oplost
+        self.assertEqual([('tour', '2015-01-02', 'conflict')], self.sync())
+        self.edit(self.b, '2015-01-02', {'naar': 'telefoon'})
+        self.assertEqual([], self.sync())
+        self.edit(self.b, '2015-01-02', {'naar': 'laptop'})
+        self.assertEqual([('tour', '2015-01-02', '<-')], self.sync())
+        root = travel_sync.open_digest('tour', self.a).root()
+        self.assertEqual(root, travel_sync.open_digest('tour', self.b).root())
+        self.assertEqual(root, travel_sync.read_synced(self.a, 'tour')[0])
+
+    def test_kopie_basis(self):
+        # na het kopieren van de hele tour is een wijziging aan een kant
+        # geen conflict
+        self.assertEqual([('tour', None, 'nieuw ->')], self.sync())
+        self.edit(self.a, '2015-01-01', {'naar': 'a2', 'afstand': 11})
+        self.assertEqual([('tour', '2015-01-01', '->')], self.sync())
+        self.assertEqual('a2', self.load(self.b)['2015-01-01']['naar'])
+
+
 if __name__ == '__main__':
     unittest.main()
 
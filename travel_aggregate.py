@@ -0,0 +1,141 @@
+#!/bin/python
+# travel_aggregate.py
+# Kolom gebaseerde aggregatie van tour records.
+# De records worden in een enkele doorloop omgezet naar getypeerde
+# array kolommen, in dezelfde doorloop worden de totalen en het aantal
+# fietsdagen opgeteld. Min/max en gemiddelden komen daarna uit de kolommen
+# (min en max in C). De datum ordinals worden pas berekend als ze nodig zijn.
+
+import datetime
+from array import array
+
+# numerieke kolommen en hun array typecode
+COLUMNS = (('afstand', 'l'), ('eten', 'd'), ('hotel', 'd'), ('anders', 'd'))
+
+
+class Columns():
+    # Kolommen van een tour: datum ordinals en de numerieke velden.
+
+    def __init__(self):
+        '''Maakt lege kolommen.
+
+        returns None
+        '''
+        self.ordinals = array('l')
+        for field, typecode in COLUMNS:
+            setattr(self, field, array(typecode))
+        # iso datums van from_db, de ordinals worden daar pas bij gebruik
+        # berekend
+        self.keys = None
+        # totalen en fietsdagen uit de doorloop van from_db
+        self.totals = None
+        self.fiets = None
+
+    @classmethod
+    def from_db(cls, db, keys=None):
+        '''Zet de records van een tour in een doorloop om naar kolommen en
+        telt in dezelfde doorloop de totalen en de fietsdagen op.
+
+        keyword arguments:
+        db: dict: de open database
+        keys: iterable: iso datums van de records. None = alle records.
+
+        returns Columns
+        '''
+        cols = cls()
+        if keys is None:
+            keys = [key for key in db if key != 'tour']
+        else:
+            keys = list(keys)
+        afstand, eten, hotel, anders = [], [], [], []
+        totaalAfstand, totaalEten, totaalHotel, totaalAnders = 0, 0, 0, 0
+        fiets = 0
+        for rec in map(db.__getitem__, keys):
+            get = rec.get
+            a = int(get('afstand', 0))
+            e = get('eten', 0)
+            h = get('hotel', 0)
+            o = get('anders', 0)
+            afstand.append(a)
+            eten.append(e)
+            hotel.append(h)
+            anders.append(o)
+            totaalAfstand += a
+            totaalEten += e
+            totaalHotel += h
+            totaalAnders += o
+            if a:
+                fiets += 1
+        cols.keys = keys
+        cols.ordinals = None
+        cols.afstand = array('l', afstand)
+        cols.eten = array('d', eten)
+        cols.hotel = array('d', hotel)
+        cols.anders = array('d', anders)
+        cols.totals = {'afstand': totaalAfstand, 'eten': totaalEten,
+                       'hotel': totaalHotel, 'anders': totaalAnders}
+        cols.fiets = fiets
+        return cols
+
+    @property
+    def datum(self):
+        # datum ordinals, van from_db pas bij het eerste gebruik berekend
+        if self.ordinals is None:
+            fromiso = datetime.date.fromisoformat
+            self.ordinals = array('l', [fromiso(key).toordinal() for key in self.keys])
+        return self.ordinals
+
+    def __len__(self):
+        return len(self.afstand)
+
+    def total(self, field):
+        '''Totaal van een kolom.
+
+        keyword arguments:
+        field: string: veld naam
+
+        returns int of float
+        '''
+        if self.totals is not None:
+            return self.totals[field]
+        return sum(getattr(self, field))
+
+    def fietsdagen(self):
+        '''Aantal dagen met een afstand.
+
+        returns int
+        '''
+        if self.fiets is not None:
+            return self.fiets
+        return len(self.afstand) - self.afstand.count(0)
+
+    def summary(self):
+        '''Totalen, min/max en gemiddelden van alle kolommen.
+
+        returns dict:
+            records, fietsdagen, eerste, laatste (date of None),
+            per veld: totaal, min, max, gemiddelde per dag
+            en afstand per fietsdag.
+        '''
+        records = len(self)
+        fietsdagen = self.fietsdagen()
+        result = {'records': records, 'fietsdagen': fietsdagen,
+                  'eerste': None, 'laatste': None}
+        if records and self.ordinals is None:
+            # iso datums sorteren als datums
+            fromiso = datetime.date.fromisoformat
+            result['eerste'] = fromiso(min(self.keys))
+            result['laatste'] = fromiso(max(self.keys))
+        elif records:
+            result['eerste'] = datetime.date.fromordinal(min(self.datum))
+            result['laatste'] = datetime.date.fromordinal(max(self.datum))
+        for field, typecode in COLUMNS:
+            col = getattr(self, field)
+            total = self.total(field)
+            result[field] = {'totaal': total,
+                             'min': min(col) if records else 0,
+                             'max': max(col) if records else 0,
+                             'per_dag': total / records if records else 0}
+        result['afstand']['per_fietsdag'] = \
+            result['afstand']['totaal'] / fietsdagen if fietsdagen else 0
+        return result
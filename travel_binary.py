@@ -0,0 +1,301 @@
+#!/bin/python
+# travel_binary.py
+# Binaire opslag van een tour in <naam>.tour, gelezen via mmap.
+#
+# Indeling (little endian):
+#   kop      HEAD: magic, formaat versie, eerste datum ordinal, aantal dagen,
+#            lengte van de json header, aantal strings, offset string heap.
+#            Vanaf formaat 2 gevolgd door COUNT: het aantal records, zodat
+#            tellen de tabel niet hoeft te lezen.
+#   header   de tour header als json (to_iso)
+#   tabel    een RECORD van vaste grootte per dag vanaf de eerste datum.
+#            Dag d staat op tabel offset + (ordinal(d) - eerste) * RECORD.size
+#   heap     offsets (n + 1 keer Q) en daarna de utf-8 bytes van de strings.
+#            Elke string staat er een keer in (interning). Id 0 = geen string.
+#
+# Een dag zonder record heeft flags 0. De andere flags geven aan welke velden
+# in het record staan, zodat een record precies zo terugkomt als het er in ging.
+# Velden buiten RECORD_FIELDS gaan als json string in 'extra'.
+
+import os
+import json
+import mmap
+import struct
+import datetime
+import travel_io
+import travel_stats
+import travel_trace
+import json_serializer
+import travel_aggregate
+
+MAGIC = b'TRVB'
+FORMAT = 2
+HEAD = struct.Struct('<4sHHiIIIQ')
+COUNT = struct.Struct('<Q')
+# flags, afstand, eten, hotel, anders, naar, opmerkingen, extra
+RECORD = struct.Struct('<BxxxidddIII')
+
+PRESENT = 1
+# veld: flag bit
+FLAGS = {'afstand': 2, 'eten': 4, 'hotel': 8, 'anders': 16}
+STRINGS = ('naar', 'opmerkingen')
+
+
+def align(n):
+    # tabel op 8 bytes uitlijnen
+    return (n + 7) & ~7
+
+
+class BinaryStorage():
+    # Tour als binair bestand met een tabel per datum ordinal.
+    suffix = '.tour'
+
+    def __init__(self, name, traveldir):
+        self.name = name
+        self.traveldir = traveldir
+        self.path = os.path.join(traveldir, name + self.suffix)
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def files(self):
+        # bestanden waarin de tour staat
+        return (self.path,)
+
+    def open(self):
+        '''Opent het bestand met mmap en leest de kop.
+
+        returns BinaryTour
+        raises FileNotFoundError als de tour niet bestaat.
+        '''
+        return BinaryTour(self.path)
+
+    def header(self):
+        '''Leest alleen de tour header.
+
+        returns dict
+        '''
+        with self.open() as tour:
+            return tour.header()
+
+    def load(self):
+        '''Leest de hele tour.
+
+        returns dict: de tour database
+        '''
+        with self.open() as tour:
+            db = {'tour': tour.header()}
+            db.update(tour.records())
+        return db
+
+    def load_days(self, days=()):
+        '''Leest de header en alleen de records van days en nieuw_record.
+
+        returns travel_storage.RangeTour
+        '''
+        from travel_storage import RangeTour
+        return RangeTour.days(self, days)
+
+    def load_range(self, van=None, tot=None):
+        '''Leest de header en alleen de records van een periode.
+
+        returns travel_storage.RangeTour
+        '''
+        from travel_storage import RangeTour
+        return RangeTour.period(self, van, tot)
+
+    def save(self, db, changed=None):
+        '''Schrijft de hele tour. Een vaste indeling kan niet per record
+        groeien, dus changed wordt genegeerd.
+
+        keyword arguments:
+        db: dict: de tour database
+        changed: list: niet gebruikt
+
+        returns None
+        '''
+        # een gedeeltelijk geladen tour eerst aanvullen
+        travel_stats.whole(db)
+        fromiso = datetime.date.fromisoformat
+        keys = sorted(key for key in db if key != 'tour')
+        ordinals = [fromiso(key).toordinal() for key in keys]
+        base = ordinals[0] if ordinals else 0
+        slots = ordinals[-1] - base + 1 if ordinals else 0
+        header = json.dumps(db['tour'], default=json_serializer.to_iso).encode('utf-8')
+        strings = {}
+        heap = []
+
+        def intern(value):
+            if value is None:
+                return 0
+            if value not in strings:
+                heap.append(value.encode('utf-8'))
+                strings[value] = len(heap)
+            return strings[value]
+
+        table = bytearray(RECORD.size * slots)
+        for key, ordinal in zip(keys, ordinals):
+            rec = db[key]
+            flags = PRESENT
+            for field, bit in FLAGS.items():
+                if field in rec:
+                    flags |= bit
+            extra = {k: v for k, v in rec.items()
+                     if k not in FLAGS and k not in STRINGS}
+            RECORD.pack_into(table, (ordinal - base) * RECORD.size, flags,
+                             int(rec.get('afstand', 0)), rec.get('eten', 0),
+                             rec.get('hotel', 0), rec.get('anders', 0),
+                             intern(rec.get('naar')), intern(rec.get('opmerkingen')),
+                             intern(json.dumps(extra) if extra else None))
+        start = HEAD.size + COUNT.size
+        tableOffset = align(start + len(header))
+        heapOffset = align(tableOffset + len(table))
+        offsets = [0]
+        for value in heap:
+            offsets.append(offsets[-1] + len(value))
+        with travel_io.AtomicFile(self.path, 'wb') as outfile:
+            outfile.write(HEAD.pack(MAGIC, FORMAT, 0, base, slots, len(header),
+                                    len(heap), heapOffset))
+            outfile.write(COUNT.pack(len(keys)))
+            outfile.write(header)
+            outfile.write(b'\0' * (tableOffset - start - len(header)))
+            outfile.write(table)
+            outfile.write(b'\0' * (heapOffset - tableOffset - len(table)))
+            outfile.write(struct.pack('<{}Q'.format(len(offsets)), *offsets))
+            outfile.write(b''.join(heap))
+            travel_trace.count('bytes geschreven', outfile.tell())
+
+    def records(self, van=None, tot=None):
+        '''Records in datum volgorde, optioneel beperkt tot een periode.
+        Alleen de pagina's van de periode worden gelezen.
+
+        keyword arguments:
+        van: date: eerste datum, None = vanaf het begin
+        tot: date: laatste datum, None = tot het eind
+
+        returns iterator van (iso datum, record)
+        '''
+        with self.open() as tour:
+            yield from tour.records(van, tot)
+
+    def totals(self, van=None, tot=None):
+        '''Totalen over een periode, zie travel_aggregate.Columns.summary.
+        Leest alleen de numerieke velden van de tabel.
+
+        returns dict
+        '''
+        with self.open() as tour:
+            return tour.columns(van, tot).summary()
+
+    def record_count(self):
+        '''Aantal records, uit de kop.
+
+        returns int
+        '''
+        with self.open() as tour:
+            return tour.record_count()
+
+
+class BinaryTour():
+    # Een geopend binair tour bestand.
+
+    def __init__(self, path):
+        with open(path, 'rb') as infile:
+            self.map = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, flags, self.base, self.slots, self.headerLength,
+         self.count, self.heapOffset) = HEAD.unpack_from(self.map)
+        if magic != MAGIC or version not in (1, FORMAT):
+            self.close()
+            raise ValueError('{} is geen binaire tour (versie {})'.format(path, FORMAT))
+        # formaat 1 heeft geen COUNT, dan wordt er geteld
+        self.start = HEAD.size
+        self.recordCount = None
+        if version >= 2:
+            (self.recordCount,) = COUNT.unpack_from(self.map, HEAD.size)
+            self.start += COUNT.size
+        self.tableOffset = align(self.start + self.headerLength)
+        self.stringOffset = self.heapOffset + 8 * (self.count + 1)
+        self.cache = {}
+
+    def close(self):
+        self.map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def header(self):
+        raw = self.map[self.start:self.start + self.headerLength]
+        return json_serializer.decode_header(json.loads(raw.decode('utf-8')))
+
+    def string(self, index):
+        '''String uit de heap.
+
+        keyword arguments:
+        index: int: string id, 0 = geen string
+
+        returns str of None
+        '''
+        if not index:
+            return None
+        if index not in self.cache:
+            start, end = struct.unpack_from('<QQ', self.map,
+                                            self.heapOffset + 8 * (index - 1))
+            self.cache[index] = self.map[self.stringOffset + start:
+                                         self.stringOffset + end].decode('utf-8')
+        return self.cache[index]
+
+    def record_count(self):
+        if self.recordCount is None:
+            self.recordCount = sum(1 for row in self.rows())
+        return self.recordCount
+
+    def slot_range(self, van, tot):
+        # eerste en laatste + 1 slot van een periode
+        lo = max(0, van.toordinal() - self.base) if van else 0
+        hi = min(self.slots, tot.toordinal() - self.base + 1) if tot else self.slots
+        return lo, max(lo, hi)
+
+    def rows(self, van=None, tot=None):
+        # (ordinal, RECORD tuple) van de dagen met een record
+        lo, hi = self.slot_range(van, tot)
+        view = memoryview(self.map)[self.tableOffset + lo * RECORD.size:
+                                    self.tableOffset + hi * RECORD.size]
+        try:
+            for i, row in enumerate(RECORD.iter_unpack(view), self.base + lo):
+                if row[0]:
+                    yield i, row
+        finally:
+            view.release()
+
+    def records(self, van=None, tot=None):
+        fromord = datetime.date.fromordinal
+        for ordinal, row in self.rows(van, tot):
+            flags = row[0]
+            rec = {}
+            if row[5]:
+                rec['naar'] = self.string(row[5])
+            for i, (field, bit) in enumerate(FLAGS.items(), 1):
+                if flags & bit:
+                    rec[field] = row[i]
+            if row[6]:
+                rec['opmerkingen'] = self.string(row[6])
+            if row[7]:
+                rec.update(json.loads(self.string(row[7])))
+            yield fromord(ordinal).isoformat(), rec
+
+    def columns(self, van=None, tot=None):
+        '''Numerieke kolommen van een periode.
+
+        returns travel_aggregate.Columns
+        '''
+        cols = travel_aggregate.Columns()
+        for ordinal, row in self.rows(van, tot):
+            cols.datum.append(ordinal)
+            cols.afstand.append(row[1])
+            cols.eten.append(row[2])
+            cols.hotel.append(row[3])
+            cols.anders.append(row[4])
+        return cols
@@ -0,0 +1,175 @@
+#!/bin/python
+# travel_catalog.py
+# Catalogus van alle tours in de datadir.
+# In <datadir>/.catalog.json staat per tour de header (met de lopende
+# totalen) en de mtime en grootte van de bestanden van de tour. Alleen
+# tours waarvan een bestand veranderd is worden opnieuw gelezen.
+# Opslaan van een tour zet alleen een regel met de nieuwe entry achter
+# <datadir>/.catalog.log. refresh vouwt de log in de catalogus.
+# saved is de signature direct na het laatste opslaan door travel, die
+# blijft bij refresh staan. Wijkt de signature daarvan af, dan is de tour
+# buiten travel om veranderd en kloppen de totalen in de header niet meer.
+
+import os
+import json
+import travel_io
+import json_serializer
+import travel_storage
+import travel_stats
+
+CATALOG = '.catalog.json'
+LOG = '.catalog.log'
+# grootte in bytes waarboven update de log in de catalogus vouwt
+MAX_LOG = 1 << 16
+
+
+def catalog_file(traveldir):
+    return os.path.join(traveldir, CATALOG)
+
+
+def log_file(traveldir):
+    return os.path.join(traveldir, LOG)
+
+
+def signature(storage):
+    ''' Mtime en grootte van de bestanden van een tour.
+
+    keyword arguments:
+    storage: backend object van de tour
+
+    returns list
+    '''
+    sig = []
+    for fn in storage.files():
+        try:
+            st = os.stat(fn)
+            sig.append([st.st_mtime_ns, st.st_size])
+        except FileNotFoundError:
+            sig.append(None)
+    return sig
+
+
+def read_catalog(traveldir):
+    try:
+        with open(catalog_file(traveldir), 'r', encoding='utf-8') as infile:
+            catalog = json.load(infile)
+    except (FileNotFoundError, ValueError):
+        catalog = {}
+    try:
+        with open(log_file(traveldir), 'r', encoding='utf-8') as infile:
+            for line in infile:
+                name, item = json.loads(line)
+                catalog[name] = item
+    except FileNotFoundError:
+        pass
+    except ValueError:
+        # afgebroken regel: de rest vindt refresh via de signature
+        pass
+    for item in catalog.values():
+        json_serializer.decode_header(item['header'])
+    return catalog
+
+
+def write_catalog(catalog, traveldir):
+    with travel_io.AtomicFile(catalog_file(traveldir)) as outfile:
+        json.dump(catalog, outfile, default=json_serializer.to_iso)
+    # de log zit nu in de catalogus
+    try:
+        os.remove(log_file(traveldir))
+    except FileNotFoundError:
+        pass
+
+
+def entry(storage, header):
+    return {'signature': signature(storage), 'header': header}
+
+
+def refresh(traveldir):
+    ''' Werkt de catalogus bij voor tours die veranderd zijn.
+
+    keyword arguments:
+    traveldir: string: datadir
+
+    returns dict: naam vd tour: header
+    '''
+    catalog = read_catalog(traveldir)
+    # een log van update wordt in de catalogus gevouwen
+    changed = os.path.exists(log_file(traveldir))
+    names = travel_storage.tour_names(traveldir)
+    for name in set(catalog) - set(names):
+        del catalog[name]
+        changed = True
+    for name in names:
+        storage = travel_storage.get_storage(name, traveldir)
+        sig = signature(storage)
+        if name in catalog and catalog[name]['signature'] == sig:
+            continue
+        saved = catalog[name].get('saved') if name in catalog else None
+        try:
+            header = None
+            if not isinstance(storage, travel_storage.JsonStorage):
+                # sqlite en binary kunnen de header los lezen
+                header = storage.header()
+            if header is None or 'totalen' not in header or \
+                    saved not in (None, sig):
+                db = storage.load()
+                if saved not in (None, sig):
+                    # buiten travel om veranderd
+                    db['tour'].pop('totalen', None)
+                travel_stats.get_totals(db)
+                header = db['tour']
+        except (ValueError, KeyError) as e:
+            print(':: Tour {} kan niet gelezen worden: {}'.format(name, e))
+            continue
+        catalog[name] = entry(storage, header)
+        if saved is not None:
+            catalog[name]['saved'] = saved
+        changed = True
+    if changed:
+        write_catalog(catalog, traveldir)
+    return {name: catalog[name]['header'] for name in sorted(catalog)}
+
+
+def update(db, traveldir):
+    ''' Zet de header van een net opgeslagen tour in de catalogus,
+        zodat hij niet opnieuw gelezen hoeft te worden. Alleen deze
+        entry gaat achter de log, de catalogus zelf wordt pas herschreven
+        als de log groter is dan MAX_LOG.
+
+    keyword arguments:
+    db: dict: de tour database
+    traveldir: string: datadir
+
+    returns None
+    '''
+    name = db['tour']['naam']
+    storage = travel_storage.get_storage(name, traveldir)
+    travel_stats.get_totals(db)
+    item = entry(storage, db['tour'])
+    item['saved'] = item['signature']
+    line = json.dumps([name, item], default=json_serializer.to_iso)
+    with open(log_file(traveldir), 'a', encoding='utf-8') as outfile:
+        outfile.write(line + '\n')
+        if outfile.tell() < MAX_LOG:
+            return
+    write_catalog(read_catalog(traveldir), traveldir)
+
+
+def check_totals(storage, db):
+    ''' Haalt de totalen uit de header van een net geladen tour als die
+    buiten travel om is veranderd sinds travel hem het laatst opsloeg
+    (saved in de catalogus). get_totals berekent ze dan opnieuw.
+
+    keyword arguments:
+    storage: backend object van de tour
+    db: dict: de geladen tour
+
+    returns bool: True als de totalen verouderd waren.
+    '''
+    item = read_catalog(storage.traveldir).get(storage.name)
+    saved = item.get('saved') if item else None
+    if saved is None or saved == signature(storage):
+        return False
+    if 'totalen' in db['tour']:
+        del db['tour']['totalen']
+    return True
@@ -0,0 +1,374 @@
+#!/bin/python
+# travel_daemon.py
+# Tour daemon: travel --serve houdt geopende tours en hun index in het
+# geheugen en beantwoordt verzoeken over een Unix socket (asyncio).
+# Zo hoeft een CLI aanroep de tour niet elke keer te lezen en te schrijven.
+# Wijzigingen worden na DEBOUNCE seconden zonder nieuwe wijziging opgeslagen.
+#
+# Het protocol is een json object per regel, in beide richtingen:
+#   {"cmd": "header", "tour": naam}            -> {"ok": true, "header": {...}}
+#   {"cmd": "get", "tour": naam, "key": datum} -> {"ok": true, "record": {...}}
+#   {"cmd": "put", "tour": naam, "key": datum, "record": {...},
+#    ["nieuw_record": datum]}                  -> {"ok": true, "output": stats}
+#   {"cmd": "print", "tour": naam, "van", "tot", "last"}
+#                                              -> {"ok": true, "output": tekst}
+#   {"cmd": "stats", "tour": naam}             -> {"ok": true, "output": tekst}
+#   {"cmd": "release", "tour": naam}  slaat op en vergeet de tour
+#   {"cmd": "flush"}                  slaat alle tours op
+#   {"cmd": "shutdown"}               slaat alle tours op en stopt
+# Bij een fout: {"ok": false, "error": tekst}, bij een onbekende tour ook
+# "missing": true. De CLI valt dan terug op de bestanden.
+# Een export (--print --format) gaat niet via de daemon: die zou de hele
+# uitvoer in een antwoord zetten. De CLI laat de daemon de tour wegschrijven
+# (release) en streamt de export uit de bestanden.
+
+import io
+import os
+import sys
+import json
+import socket
+import datetime
+import contextlib
+import json_serializer
+
+SOCKET = '.travel.sock'
+# seconden na de laatste wijziging waarna een tour wordt opgeslagen
+DEBOUNCE = 2.0
+
+
+def socket_path(conf):
+    ''' Pad van de socket: config 'socket', anders <data_dir>/.travel.sock
+
+    keyword arguments:
+    conf: dict: configuratie
+
+    returns string
+    '''
+    return conf.get('socket') or os.path.join(conf['data_dir'], SOCKET)
+
+
+def encode(message):
+    return json.dumps(message, default=json_serializer.to_iso).encode('utf-8') + b'\n'
+
+
+class Client():
+    # Verbinding van de CLI met de daemon.
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.file = sock.makefile('rwb')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.file.close()
+        self.sock.close()
+
+    def request(self, cmd, **args):
+        ''' Stuurt een verzoek en wacht op het antwoord.
+
+        keyword arguments:
+        cmd: string: commando, zie het protocol hierboven
+        args: velden van het verzoek
+
+        returns dict: het antwoord
+        raises ConnectionError als de daemon de verbinding verbreekt.
+        '''
+        args['cmd'] = cmd
+        self.file.write(encode(args))
+        self.file.flush()
+        line = self.file.readline()
+        if not line:
+            raise ConnectionError('de daemon heeft de verbinding verbroken')
+        return json.loads(line)
+
+
+def connect(path):
+    ''' Maakt verbinding met een draaiende daemon.
+
+    keyword arguments:
+    path: string: pad van de socket
+
+    returns Client, of None als er geen daemon draait.
+    '''
+    if not hasattr(socket, 'AF_UNIX'):
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except OSError:
+        sock.close()
+        return None
+    return Client(sock)
+
+
+class LoadedTour():
+    # Een tour in het geheugen van de daemon. De dagen zijn compacte
+    # travel_model.Day objecten, de database is de view van Tour.to_db.
+
+    def __init__(self, db):
+        import travel_index
+        self.db = db
+        self.index = travel_index.DatumIndex.from_db(db)
+        # keys die nog niet zijn opgeslagen
+        self.changed = set()
+        # key: versie op disk voor de eerste nog niet opgeslagen wijziging,
+        # om bij opslaan samen te voegen met wat een ander intussen schreef
+        self.bases = {}
+        self.timer = None
+
+
+class Server():
+    # De daemon. De tours worden alleen vanuit de event loop aangeraakt.
+
+    def __init__(self, traveldir, view, stats, write, debounce=DEBOUNCE):
+        ''' keyword arguments:
+        traveldir: string: datadir
+        view: functie(db, keys=None): print records (travel.view_record)
+        stats: functie(db): print statistieken (travel.print_stats)
+        write: functie(db, traveldir, changed): schrijft een tour
+               (travel.write_tour)
+        debounce: float: seconden tussen de laatste wijziging en opslaan
+        '''
+        self.traveldir = traveldir
+        self.view = view
+        self.stats = stats
+        self.write = write
+        self.debounce = debounce
+        self.tours = {}
+        self.loop = None
+        self.stopped = None
+        # open verbindingen: writer: task
+        self.clients = {}
+
+    def tour(self, name):
+        # geladen tour, leest hem de eerste keer van disk
+        if name not in self.tours:
+            import gc
+            import travel_model
+            import travel_migrate
+            import travel_lock
+            import travel_storage
+            import travel_catalog
+            # een oude tour eerst op disk bijwerken
+            travel_migrate.migrate_tour(name, self.traveldir)
+            db = travel_model.Tour.load(name, self.traveldir).to_db()
+            storage = travel_storage.get_storage(name, self.traveldir)
+            # voor travel_lock.changed_on_disk bij opslaan
+            travel_lock.remember(storage, db)
+            # buiten travel om veranderd: de totalen opnieuw tellen
+            travel_catalog.check_totals(storage, db)
+            self.tours[name] = LoadedTour(db)
+            # de dagen blijven lang in het geheugen: niet bij elke gc
+            # opnieuw doorlopen (bij release worden ze gewoon opgeruimd)
+            gc.freeze()
+        return self.tours[name]
+
+    def persist(self, name):
+        ''' Slaat de wijzigingen van een tour op.
+
+        returns None
+        '''
+        tour = self.tours.get(name)
+        if tour is None:
+            return
+        if tour.timer is not None:
+            tour.timer.cancel()
+            tour.timer = None
+        if tour.changed:
+            changed = sorted(tour.changed)
+            bases = {key: tour.bases[key] for key in changed}
+            tour.changed.clear()
+            tour.bases.clear()
+            try:
+                # write_tour meldt conflicten zelf
+                self.write(tour.db, self.traveldir, changed, bases=bases)
+            except OSError as e:
+                # later opnieuw proberen
+                tour.changed.update(changed)
+                tour.bases.update(bases)
+                print(':: Tour {} kan niet opgeslagen worden: {}'.format(name, e),
+                      file=sys.stderr)
+                return
+            if len(tour.index) != len(tour.db) - 1:
+                # samengevoegd met dagen van een ander
+                import travel_index
+                tour.index = travel_index.DatumIndex.from_db(tour.db)
+
+    def flush(self):
+        for name in list(self.tours):
+            self.persist(name)
+
+    def schedule(self, name):
+        # opslaan na debounce seconden zonder nieuwe wijziging
+        tour = self.tours[name]
+        if tour.timer is not None:
+            tour.timer.cancel()
+        tour.timer = self.loop.call_later(self.debounce, self.persist, name)
+
+    def capture(self, func, *args):
+        # stdout van func als tekst
+        with io.StringIO() as out, contextlib.redirect_stdout(out):
+            func(*args)
+            return out.getvalue()
+
+    def handle(self, request):
+        ''' Beantwoordt een verzoek.
+
+        keyword arguments:
+        request: dict: het verzoek
+
+        returns dict: het antwoord
+        '''
+        cmd = request.get('cmd')
+        if cmd == 'flush':
+            self.flush()
+            return {'ok': True}
+        if cmd == 'shutdown':
+            self.stopped.set()
+            return {'ok': True}
+        name = request.get('tour')
+        if cmd == 'release':
+            self.persist(name)
+            self.tours.pop(name, None)
+            return {'ok': True}
+        try:
+            tour = self.tour(name)
+        except FileNotFoundError:
+            return {'ok': False, 'missing': True,
+                    'error': 'tour {} bestaat niet'.format(name)}
+        db = tour.db
+        if cmd == 'header':
+            return {'ok': True, 'header': db['tour']}
+        if cmd == 'get':
+            return {'ok': True, 'record': db.get(request['key'])}
+        if cmd == 'put':
+            import travel_lock
+            import travel_model
+            import travel_stats
+            key = request['key']
+            old = db.get(key)
+            tour.bases.setdefault(key, travel_lock.version(old))
+            db[key] = travel_model.Day(request['record'])
+            travel_lock.stamp(db, [key], {key: travel_lock.version(old)})
+            travel_stats.update_totals(db, old, db[key])
+            tour.index.add(datetime.date.fromisoformat(key).toordinal())
+            if 'nieuw_record' in request:
+                db['tour']['nieuw_record'] = request['nieuw_record'] and \
+                        datetime.date.fromisoformat(request['nieuw_record'])
+            tour.changed.add(key)
+            self.schedule(name)
+            return {'ok': True, 'output': self.capture(self.stats, db)}
+        if cmd == 'stats':
+            return {'ok': True, 'output': self.capture(self.stats, db)}
+        if cmd == 'print':
+            return {'ok': True, 'output': self.print_records(tour, request)}
+        return {'ok': False, 'error': 'onbekend commando {}'.format(cmd)}
+
+    def print_records(self, tour, request):
+        # uitvoer van --print, met de index uit het geheugen
+        db = tour.db
+        fromiso = datetime.date.fromisoformat
+        keys = None
+        if request.get('last') is not None:
+            keys = tour.index.last(request['last'])
+        elif request.get('van') or request.get('tot'):
+            keys = tour.index.keys(request.get('van') and fromiso(request['van']),
+                                   request.get('tot') and fromiso(request['tot']))
+        def view():
+            print('* {} *'.format(db['tour']['omschrijving']))
+            print()
+            self.view(db, keys=keys)
+            self.stats(db)
+
+        return self.capture(view)
+
+    async def connection(self, reader, writer):
+        # een client, verzoeken een voor een
+        import asyncio
+        self.clients[writer] = asyncio.current_task()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    reply = self.handle(json.loads(line))
+                except (ValueError, KeyError, TypeError) as e:
+                    reply = {'ok': False, 'error': str(e)}
+                writer.write(encode(reply))
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            del self.clients[writer]
+            writer.close()
+
+    async def run(self, path):
+        ''' Beantwoordt verzoeken op de socket tot shutdown of een signaal.
+
+        keyword arguments:
+        path: string: pad van de socket
+
+        returns None
+        '''
+        import signal
+        import asyncio
+        self.loop = asyncio.get_running_loop()
+        self.stopped = asyncio.Event()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                self.loop.add_signal_handler(sig, self.stopped.set)
+            except (ValueError, RuntimeError, NotImplementedError):
+                # niet in de main thread (tests)
+                pass
+        server = await asyncio.start_unix_server(self.connection, path)
+        os.chmod(path, 0o600)
+        try:
+            async with server:
+                await self.stopped.wait()
+                # open verbindingen sluiten, de clients zien dan EOF
+                tasks = list(self.clients.values())
+                for writer in list(self.clients):
+                    writer.close()
+                await asyncio.gather(*tasks, return_exceptions=True)
+        finally:
+            self.flush()
+
+
+def serve(conf, view, stats, write):
+    ''' Start de daemon en blijft draaien tot Ctrl-C, SIGTERM of shutdown.
+
+    keyword arguments:
+    conf: dict: configuratie (data_dir, socket, debounce)
+    view: functie(db, keys=None): print records
+    stats: functie(db): print statistieken
+    write: functie(db, traveldir, changed): schrijft een tour
+
+    returns None
+    '''
+    import asyncio
+    path = socket_path(conf)
+    client = connect(path)
+    if client is not None:
+        client.close()
+        print(':: Er draait al een daemon op {}'.format(path))
+        return
+    if not os.path.exists(conf['data_dir']):
+        os.mkdir(conf['data_dir'])
+    # socket van een daemon die niet netjes gestopt is
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(path)
+    server = Server(conf['data_dir'], view, stats, write,
+                    conf.get('debounce', DEBOUNCE))
+    print(':: Daemon luistert op {}'.format(path))
+    try:
+        asyncio.run(server.run(path))
+    finally:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(path)
+    print(':: Daemon gestopt.')
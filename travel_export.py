@@ -0,0 +1,123 @@
+#!/bin/python
+# travel_export.py
+# Export van records als csv, tsv of JSON Lines.
+# De records worden in datum volgorde via een generator naar een gebufferde
+# writer gestuurd. De uitvoer wordt nooit in zijn geheel in het geheugen
+# opgebouwd. Het totaal wordt tijdens het schrijven bijgehouden en kan als
+# laatste record meegestuurd worden.
+
+import io
+import os
+import csv
+import sys
+import json
+
+FORMATS = ('csv', 'tsv', 'jsonl')
+COLUMNS = ('datum', 'naar', 'afstand', 'eten', 'hotel', 'anders', 'opmerkingen')
+# velden van een record in de export, zonder interne velden (versie, valuta)
+FIELDS = COLUMNS[1:]
+# velden die opgeteld worden in het totaal record
+SUM_FIELDS = ('afstand', 'eten', 'hotel', 'anders')
+
+
+def iter_rows(db, keys, totals=False):
+    ''' Rijen van de records, in de volgorde van keys.
+
+    keyword arguments:
+    db: dict: de open database
+    keys: iterable: iso datums van de records
+    totals: bool: stuur als laatste een rij met datum 'totaal'.
+
+    returns iterator van tuples in de volgorde van COLUMNS
+    '''
+    sums = [0, 0, 0, 0]
+    for key in keys:
+        get = db[key].get
+        row = (key, get('naar', ''), get('afstand', 0), get('eten', 0),
+               get('hotel', 0), get('anders', 0), get('opmerkingen', ''))
+        if totals:
+            sums[0] += row[2]
+            sums[1] += row[3]
+            sums[2] += row[4]
+            sums[3] += row[5]
+        yield row
+    if totals:
+        yield ('totaal', '', sums[0], round(sums[1], 2), round(sums[2], 2),
+               round(sums[3], 2), '')
+
+
+def iter_lines(db, keys, totals=False):
+    ''' JSON Lines van de records, in de volgorde van keys.
+    Alleen de velden van FIELDS worden in een keer gecodeerd, met de datum
+    ervoor, net als de kolommen van csv en tsv.
+
+    keyword arguments:
+    db: dict: de open database
+    keys: iterable: iso datums van de records
+    totals: bool: stuur als laatste een regel met datum 'totaal'.
+
+    returns iterator van strings (met newline)
+    '''
+    encode = json.JSONEncoder(ensure_ascii=False).encode
+    sums = dict.fromkeys(SUM_FIELDS, 0)
+    for key in keys:
+        rec = {field: db[key][field] for field in FIELDS if field in db[key]}
+        if totals:
+            for field in SUM_FIELDS:
+                sums[field] += rec.get(field, 0)
+        if rec:
+            yield '{"datum": "' + key + '", ' + encode(rec)[1:] + '\n'
+        else:
+            yield '{"datum": "' + key + '"}\n'
+    if totals:
+        for field in SUM_FIELDS[1:]:
+            sums[field] = round(sums[field], 2)
+        yield '{"datum": "totaal", ' + encode(sums)[1:] + '\n'
+
+
+def write(db, keys, fmt, totals, out):
+    ''' Schrijft de records naar out.
+
+    keyword arguments:
+    db: dict: de open database
+    keys: iterable: iso datums van de records, in volgorde
+    fmt: string: csv, tsv of jsonl
+    totals: bool: voeg een totaal record toe.
+    out: tekst bestand
+
+    returns None
+    '''
+    if fmt == 'jsonl':
+        out.writelines(iter_lines(db, keys, totals))
+    else:
+        writer = csv.writer(out, delimiter='\t' if fmt == 'tsv' else ',',
+                            lineterminator='\n')
+        writer.writerow(COLUMNS)
+        writer.writerows(iter_rows(db, keys, totals))
+
+
+def export(db, keys, fmt, totals=False, out=None):
+    ''' Exporteert records naar stdout (of out).
+
+    keyword arguments:
+    db: dict: de open database
+    keys: iterable: iso datums van de records, in volgorde
+    fmt: string: csv, tsv of jsonl
+    totals: bool: voeg een totaal record toe.
+    out: tekst bestand. None = gebufferde stdout.
+
+    returns None
+    '''
+    if out is not None:
+        write(db, keys, fmt, totals, out)
+        return
+    sys.stdout.flush()
+    out = io.TextIOWrapper(io.open(sys.stdout.fileno(), 'wb', buffering=1 << 16,
+                                   closefd=False), encoding='utf-8', newline='')
+    try:
+        write(db, keys, fmt, totals, out)
+        out.flush()
+    except BrokenPipeError:
+        # de lezer is gestopt (bijv. head). stdout naar devnull, zodat het
+        # afsluiten van python geen fout meer geeft.
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
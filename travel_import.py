@@ -0,0 +1,157 @@
+#!/bin/python
+# travel_import.py
+# Importeert dagen uit een CSV, TSV of JSON Lines bestand in een tour.
+# Elke rij heeft een datum en de velden van een record. De rijen worden
+# gelezen terwijl het bestand gelezen wordt en met dezelfde functies
+# gevalideerd als de invoer van new_record. Een foute rij wordt gemeld en
+# overgeslagen, de rest van het bestand wordt wel geimporteerd.
+
+import os
+import csv
+import json
+import datetime
+import travel_stats
+import travel_rates
+
+
+def read_rows(path):
+    ''' Leest de rijen van een import bestand, het type volgt uit de extensie.
+    .csv: eerste regel zijn de kolom namen, scheidingsteken , ; of tab.
+    .tsv: eerste regel zijn de kolom namen, scheidingsteken tab.
+    .jsonl: JSON Lines, een object per regel.
+
+    keyword arguments:
+    path: string: pad van het bestand
+
+    returns iterator van (dict, None) met kleine letters als veld namen,
+            of (None, foutmelding) voor een onleesbare regel.
+    raises ValueError als het bestand geen van deze typen is of als het
+           scheidingsteken van een CSV bestand niet te bepalen is.
+    '''
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in ('.csv', '.tsv', '.jsonl'):
+        raise ValueError('onbekend bestandstype: {} (.csv, .tsv of .jsonl)' \
+                .format(path))
+    with open(path, 'r', encoding='utf-8', newline='') as infile:
+        if ext == '.jsonl':
+            yield from read_jsonl(infile)
+            return
+        if ext == '.tsv':
+            dialect = csv.excel_tab
+        else:
+            try:
+                dialect = csv.Sniffer().sniff(infile.readline(), delimiters=',;\t')
+            except csv.Error as e:
+                raise ValueError('{}: {}'.format(path, e)) from None
+            infile.seek(0)
+        reader = csv.DictReader(infile, dialect=dialect)
+        while True:
+            try:
+                row = next(reader)
+            except StopIteration:
+                return
+            except csv.Error as e:
+                yield None, str(e)
+                continue
+            yield {k.strip().lower(): v for k, v in row.items() if k}, None
+
+
+def read_jsonl(infile):
+    # rijen van een JSON Lines bestand, zie read_rows
+    for line in infile:
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield None, str(e)
+            continue
+        if not isinstance(row, dict):
+            yield None, 'geen object'
+            continue
+        yield {k.strip().lower(): v for k, v in row.items()}, None
+
+
+def convert_row(row, fields, validate_datum):
+    ''' Zet een rij om naar een datum en een record.
+
+    keyword arguments:
+    row: dict: veld naam: waarde (tekst of getal)
+    fields: tuple: (veld, functie) zoals travel.RECORD_FIELDS
+    validate_datum: functie: zet de datum tekst om naar een date
+
+    returns tuple: (date, dict)
+    raises ValueError of KeyError bij een foute rij.
+    '''
+    datum = row.get('datum')
+    if not datum:
+        raise KeyError('datum ontbreekt')
+    datum = validate_datum(str(datum).strip())
+    record = {}
+    for label, validate in fields:
+        value = row.get(label)
+        if value is None or value == '':
+            continue
+        if label in travel_stats.GELD_FIELDS:
+            # koers van de dag, het originele bedrag blijft bewaard
+            try:
+                travel_rates.set_amount(record, label, str(value).strip(),
+                                        datum.isoformat())
+            except KeyError as e:
+                raise ValueError('onbekende valuta: {}'.format(e.args[0])) from None
+        else:
+            record[label] = validate(str(value).strip())
+    return datum, record
+
+
+def import_file(db, path, fields, validate_datum):
+    ''' Voegt alle rijen van een bestand aan de tour toe.
+    Bestaande dagen worden vervangen. De totalen en nieuw_record worden
+    bijgewerkt.
+
+    keyword arguments:
+    db: dict: de open database
+    path: string: CSV of JSON Lines bestand
+    fields: tuple: (veld, functie) zoals travel.RECORD_FIELDS
+    validate_datum: functie: zet de datum tekst om naar een date
+
+    returns tuple: (list: keys van de geimporteerde dagen,
+                    list: (rij nummer, foutmelding))
+    raises ValueError of OSError als het bestand niet gelezen kan worden,
+           zie read_rows.
+    '''
+    tour = db['tour']
+    keys = []
+    errors = []
+    last = None
+    for rowNr, (row, error) in enumerate(read_rows(path), 1):
+        if error:
+            errors.append((rowNr, error))
+            continue
+        try:
+            datum, record = convert_row(row, fields, validate_datum)
+            if datum < tour['start_datum'] or \
+                    (tour.get('eind_datum') and datum > tour['eind_datum']):
+                raise ValueError('{} valt buiten de tour'.format(datum))
+        except KeyError as e:
+            # veld of valuta ontbreekt, zonder de quotes van repr
+            errors.append((rowNr, str(e.args[0]) if e.args else 'KeyError'))
+            continue
+        except (ValueError, TypeError) as e:
+            # ook DatumError van validate_datum, de rij wordt overgeslagen
+            errors.append((rowNr, str(e) or e.__class__.__name__))
+            continue
+        key = datum.isoformat()
+        old = db.get(key)
+        db[key] = record
+        travel_stats.update_totals(db, old, record)
+        keys.append(key)
+        if last is None or datum > last:
+            last = datum
+    # nieuw_record na de laatste geimporteerde dag
+    if last and tour.get('nieuw_record') and last >= tour['nieuw_record']:
+        if tour.get('eind_datum') and last >= tour['eind_datum']:
+            tour['nieuw_record'] = None
+        else:
+            tour['nieuw_record'] = last + datetime.timedelta(days=1)
+    return keys, errors
@@ -0,0 +1,175 @@
+#!/bin/python
+# travel_index.py
+# Gesorteerde index van de datum ordinals van een tour.
+# De index staat als array in <naam>.idx naast de tour. Een nieuwe dag na
+# de laatste dag (de gewone toevoeging) wordt achteraan het bestand
+# geschreven. Periodes worden met bisect opgezocht, zodat alleen de
+# records in die periode aangeraakt worden.
+
+import os
+import bisect
+import datetime
+from array import array
+import travel_io
+
+
+def index_file(traveldir, name):
+    ''' Pad van de index van een tour.
+
+    keyword arguments:
+    traveldir: string: datadir
+    name: string: naam vd tour
+
+    returns string
+    '''
+    return os.path.join(traveldir, name + '.idx')
+
+
+class DatumIndex():
+    # Gesorteerde datum ordinals van de records.
+
+    def __init__(self, ordinals=()):
+        self.ordinals = array('l', sorted(ordinals))
+
+    @classmethod
+    def from_db(cls, db):
+        '''Bouwt de index uit de records.
+
+        keyword arguments:
+        db: dict: de open database
+
+        returns DatumIndex
+        '''
+        fromiso = datetime.date.fromisoformat
+        return cls(fromiso(key).toordinal() for key in db if key != 'tour')
+
+    @classmethod
+    def read(cls, traveldir, name):
+        '''Leest de index van disk.
+
+        keyword arguments:
+        traveldir: string: datadir
+        name: string: naam vd tour
+
+        returns DatumIndex of None als er geen (bruikbare) index is.
+        '''
+        index = cls()
+        try:
+            with open(index_file(traveldir, name), 'rb') as infile:
+                index.ordinals.frombytes(infile.read())
+        except (FileNotFoundError, ValueError):
+            return None
+        return index
+
+    @classmethod
+    def open(cls, db, traveldir):
+        '''Leest de index van disk, of bouwt en schrijft hem als hij
+        ontbreekt of niet bij de tour past.
+
+        keyword arguments:
+        db: dict: de open database
+        traveldir: string: datadir
+
+        returns DatumIndex
+        '''
+        import travel_stats
+        index = cls.read(traveldir, db['tour']['naam'])
+        if index is None or len(index) != travel_stats.record_count(db):
+            index = cls.from_db(travel_stats.whole(db))
+            index.save(traveldir, db['tour']['naam'])
+        return index
+
+    def __len__(self):
+        return len(self.ordinals)
+
+    def __contains__(self, ordinal):
+        i = bisect.bisect_left(self.ordinals, ordinal)
+        return i < len(self.ordinals) and self.ordinals[i] == ordinal
+
+    def add(self, ordinal):
+        '''Voegt een datum toe.
+
+        keyword arguments:
+        ordinal: int: datum ordinal
+
+        returns bool: True als de datum achteraan is toegevoegd.
+        '''
+        if not self.ordinals or ordinal > self.ordinals[-1]:
+            self.ordinals.append(ordinal)
+            return True
+        if ordinal not in self:
+            self.ordinals.insert(bisect.bisect_left(self.ordinals, ordinal), ordinal)
+        return False
+
+    def save(self, traveldir, name):
+        '''Schrijft de hele index.
+
+        returns None
+        '''
+        with travel_io.AtomicFile(index_file(traveldir, name), 'wb') as outfile:
+            self.ordinals.tofile(outfile)
+
+    def keys(self, van=None, tot=None):
+        '''Iso datums van de records binnen een periode, in volgorde.
+
+        keyword arguments:
+        van: date: eerste datum, None = vanaf het begin
+        tot: date: laatste datum, None = tot het eind
+
+        returns list
+        '''
+        lo = bisect.bisect_left(self.ordinals, van.toordinal()) if van else 0
+        hi = bisect.bisect_right(self.ordinals, tot.toordinal()) if tot \
+            else len(self.ordinals)
+        return self.to_keys(self.ordinals[lo:hi])
+
+    def last(self, n):
+        '''Iso datums van de laatste n records.
+
+        returns list
+        '''
+        return self.to_keys(self.ordinals[-n:] if n > 0 else [])
+
+    @staticmethod
+    def to_keys(ordinals):
+        fromord = datetime.date.fromordinal
+        return [fromord(o).isoformat() for o in ordinals]
+
+
+def update_index(db, traveldir, changed=None):
+    '''Werkt de index bij na het opslaan van een tour.
+
+    keyword arguments:
+    db: dict: de open database
+    traveldir: string: datadir
+    changed: list: keys van gewijzigde records. None = hele index schrijven.
+
+    returns None
+    '''
+    import travel_stats
+    name = db['tour']['naam']
+    if changed is None:
+        DatumIndex.from_db(travel_stats.whole(db)).save(traveldir, name)
+        return
+    index = DatumIndex.read(traveldir, name)
+    new = set()
+    if index is not None:
+        fromiso = datetime.date.fromisoformat
+        new = {fromiso(key).toordinal() for key in changed}
+        new = {o for o in new if o not in index}
+    if index is None or len(index) + len(new) != travel_stats.record_count(db):
+        # index ontbreekt of liep al achter: opnieuw opbouwen
+        DatumIndex.from_db(travel_stats.whole(db)).save(traveldir, name)
+        return
+    appended = array('l')
+    rewrite = False
+    for ordinal in sorted(new):
+        if index.add(ordinal):
+            appended.append(ordinal)
+        else:
+            rewrite = True
+    if rewrite:
+        index.save(traveldir, name)
+    elif appended:
+        with open(index_file(traveldir, name), 'ab') as outfile:
+            appended.tofile(outfile)
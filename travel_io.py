@@ -0,0 +1,178 @@
+#!/bin/python
+# travel_io.py
+# Veilig schrijven van bestanden.
+# AtomicFile schrijft naar een tijdelijk bestand in dezelfde directory en zet
+# het met os.replace op zijn plaats. Een crash of Ctrl-C tijdens het schrijven
+# laat het oude bestand dus heel. Met FSYNC worden het bestand en de directory
+# ook naar de schijf geforceerd.
+#
+# Writer is een worker thread voor write-behind: save_tour geeft het schrijven
+# aan de worker en de prompt gaat meteen verder. Bij het afsluiten wordt
+# gewacht tot alle schrijfacties klaar zijn. De worker schrijft alleen een
+# kopie, het resultaat gaat pas in wait() (in de thread die wacht) terug in
+# de tour zelf.
+#
+# Beide staan standaard uit, in de config aan te zetten:
+#   "fsync": true, "write_behind": true
+
+import os
+
+# fsync na het schrijven van een bestand
+FSYNC = False
+# save_tour schrijft op de achtergrond
+WRITE_BEHIND = False
+
+_writer = None
+
+
+def configure(conf):
+    ''' Neemt fsync en write_behind over uit de configuratie.
+
+    keyword arguments:
+    conf: dict: configuratie
+
+    returns None
+    '''
+    global FSYNC, WRITE_BEHIND
+    FSYNC = bool(conf.get('fsync', False))
+    WRITE_BEHIND = bool(conf.get('write_behind', False))
+
+
+def sync_dir(path):
+    ''' Forceert de directory entry (na os.replace) naar de schijf.
+
+    keyword arguments:
+    path: string: directory
+
+    returns None
+    '''
+    try:
+        fd = os.open(path or '.', os.O_RDONLY)
+    except OSError:
+        # bijv. windows, directories kunnen daar niet geopend worden
+        return
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class AtomicFile():
+    # Schrijf een bestand in een keer, gebruik:
+    #   with AtomicFile(path) as outfile: ...
+    # Bij een exception blijft het oude bestand staan.
+
+    def __init__(self, path, mode='w', encoding='utf-8'):
+        self.path = path
+        self.mode = mode
+        self.encoding = None if 'b' in mode else encoding
+        # pid in de naam: twee processen schrijven nooit in hetzelfde bestand
+        self.tmp = '{}.{}.tmp'.format(path, os.getpid())
+        self.file = None
+
+    def __enter__(self):
+        self.file = open(self.tmp, self.mode, encoding=self.encoding)
+        return self.file
+
+    def __exit__(self, excType, exc, tb):
+        if excType is not None:
+            self.file.close()
+            os.remove(self.tmp)
+            return False
+        try:
+            self.file.flush()
+            if FSYNC:
+                os.fsync(self.file.fileno())
+        finally:
+            self.file.close()
+        os.replace(self.tmp, self.path)
+        if FSYNC:
+            sync_dir(os.path.dirname(self.path))
+        return False
+
+
+class Writer():
+    # Worker thread die schrijfacties in volgorde uitvoert.
+
+    def __init__(self):
+        import queue
+        import atexit
+        import threading
+        self.queue = queue.Queue()
+        self.errors = []
+        # afronding van geslaagde schrijfacties, voor wait()
+        self.done = []
+        self.thread = threading.Thread(target=self.run, name='travel-writer',
+                                       daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def run(self):
+        while True:
+            job = self.queue.get()
+            try:
+                if job is None:
+                    return
+                func, args, done = job
+                func(*args)
+                if done is not None:
+                    self.done.append(done)
+            except Exception as e:
+                self.errors.append(e)
+            finally:
+                self.queue.task_done()
+
+    def submit(self, func, *args, done=None):
+        ''' Zet een schrijfactie in de rij.
+
+        keyword arguments:
+        func: functie die het schrijven doet
+        args: argumenten voor func
+        done: functie zonder argumenten, wordt na het schrijven door wait()
+              aangeroepen, niet door de worker. None = niets.
+
+        returns None
+        '''
+        self.queue.put((func, args, done))
+
+    def wait(self):
+        ''' Wacht tot alle schrijfacties klaar zijn, rondt ze af (done van
+        submit) en meldt fouten.
+
+        returns bool: True als alles is geschreven.
+        '''
+        self.queue.join()
+        done, self.done = self.done, []
+        for func in done:
+            func()
+        errors, self.errors = self.errors, []
+        for e in errors:
+            print(':: Fout bij opslaan: {}'.format(e))
+        return not errors
+
+    def close(self):
+        if self.thread.is_alive():
+            self.wait()
+            self.queue.put(None)
+            self.thread.join()
+
+
+def writer():
+    ''' De write-behind worker, wordt bij de eerste aanroep gestart.
+
+    returns Writer
+    '''
+    global _writer
+    if _writer is None:
+        _writer = Writer()
+    return _writer
+
+
+def wait():
+    ''' Wacht op schrijfacties van de worker, als die er is.
+
+    returns bool: True als alles is geschreven.
+    '''
+    if _writer is None:
+        return True
+    return _writer.wait()
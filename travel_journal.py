@@ -0,0 +1,129 @@
+#!/bin/python
+# travel_journal.py
+# Append-only journal naast <naam>.json.
+# Bij toevoegen of bewerken van een dag worden alleen het gewijzigde record
+# en de tour header als regel achter het journal geschreven. Open_tour speelt
+# het journal af over de snapshot. Als het journal te groot wordt, wordt het
+# in de snapshot gevouwen (compactie).
+#
+# Elke regel is een json lijst: [generatie, key, record]
+# De generatie staat ook in de header ('journal'). Bij compactie wordt de
+# generatie opgehoogd, zodat regels van een oud journal nooit over een
+# nieuwere snapshot worden afgespeeld.
+
+import os
+import json
+import travel_io
+import travel_trace
+import json_serializer
+
+# Grootte in bytes waarboven het journal in de snapshot wordt gevouwen.
+MAX_JOURNAL = 1024 * 1024
+
+
+def journal_file(traveldir, name):
+    ''' Pad van het journal van een tour.
+
+    keyword arguments:
+    traveldir: string: datadir
+    name: string: naam vd tour
+
+    returns string
+    '''
+    return os.path.join(traveldir, name + '.journal')
+
+
+def generation(db):
+    ''' Huidige journal generatie van de tour.
+
+    keyword arguments:
+    db: dict: de tour database
+
+    returns int
+    '''
+    return db['tour'].get('journal', 0)
+
+
+def append(db, keys, traveldir):
+    ''' Schrijft de gewijzigde records en de header achter het journal.
+
+    keyword arguments:
+    db: dict: de tour database
+    keys: iterable: keys van de gewijzigde records
+    traveldir: string: datadir
+
+    returns int: grootte van het journal in bytes na het schrijven
+    '''
+    gen = generation(db)
+    lines = [json.dumps([gen, key, db[key]], default=json_serializer.to_iso)
+             for key in keys]
+    # de header (nieuw_record) verandert bij elke toevoeging
+    lines.append(json.dumps([gen, 'tour', db['tour']],
+                            default=json_serializer.to_iso))
+    fn = journal_file(traveldir, db['tour']['naam'])
+    with open(fn, 'a', encoding='utf-8') as outfile:
+        start = outfile.tell()
+        outfile.write('\n'.join(lines) + '\n')
+        travel_trace.count('bytes geschreven', outfile.tell() - start)
+        if travel_io.FSYNC:
+            outfile.flush()
+            os.fsync(outfile.fileno())
+        return outfile.tell()
+
+
+def replay(db, traveldir):
+    ''' Speelt het journal af over de snapshot.
+
+    keyword arguments:
+    db: dict: de tour database zoals geladen uit de snapshot
+    traveldir: string: datadir
+
+    returns int: aantal afgespeelde regels
+    '''
+    gen = generation(db)
+    count = 0
+    try:
+        infile = open(journal_file(traveldir, db['tour']['naam']), 'r',
+                      encoding='utf-8')
+    except FileNotFoundError:
+        return 0
+    with infile:
+        for line in infile:
+            try:
+                lineGen, key, record = json.loads(line)
+            except ValueError:
+                # afgebroken laatste regel (crash tijdens schrijven)
+                break
+            if lineGen != gen:
+                continue
+            if key == 'tour':
+                json_serializer.decode_header(record)
+            db[key] = record
+            count += 1
+    return count
+
+
+def start_generation(db):
+    ''' Hoogt de generatie op voordat een nieuwe snapshot wordt geschreven.
+
+    keyword arguments:
+    db: dict: de tour database
+
+    returns None
+    '''
+    db['tour']['journal'] = generation(db) + 1
+
+
+def clear(traveldir, name):
+    ''' Verwijdert het journal nadat het in de snapshot is gevouwen.
+
+    keyword arguments:
+    traveldir: string: datadir
+    name: string: naam vd tour
+
+    returns None
+    '''
+    try:
+        os.remove(journal_file(traveldir, name))
+    except FileNotFoundError:
+        pass
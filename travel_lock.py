@@ -0,0 +1,145 @@
+#!/bin/python
+# travel_lock.py
+# Meerdere schrijvers op dezelfde tour.
+# TourLock is een fcntl lock op <naam>.lock: exclusief tijdens het opslaan,
+# gedeeld tijdens het laden. De interactieve sessie zelf houdt geen lock vast.
+#
+# Elk record heeft een versie ('versie'). Bij het opslaan wordt onder de lock
+# gekeken of de tour op disk veranderd is sinds hij geladen werd. Zo ja, dan
+# wordt de tour opnieuw gelezen en samengevoegd: records die een ander proces
+# heeft toegevoegd of gewijzigd worden overgenomen. Een eigen wijziging op
+# een dag die intussen ook door een ander is gewijzigd (andere versie dan
+# waarop de wijziging gebaseerd is) is een conflict en wordt niet opgeslagen.
+
+import os
+import travel_stats
+import travel_catalog
+
+try:
+    import fcntl
+except ImportError:
+    # bijv. windows: geen locking
+    fcntl = None
+
+# (id van de tour, traveldir, naam): signature van de bestanden bij laden of
+# opslaan. Per geladen tour, want twee sessies kunnen in hetzelfde proces zitten.
+_signatures = {}
+
+
+def lock_file(traveldir, name):
+    return os.path.join(traveldir, name + '.lock')
+
+
+class TourLock():
+    # Lock op een tour, gebruik: with TourLock(traveldir, naam): ...
+
+    def __init__(self, traveldir, name, shared=False):
+        self.path = lock_file(traveldir, name)
+        self.shared = shared
+        self.fd = None
+
+    def __enter__(self):
+        if fcntl is not None and os.path.isdir(os.path.dirname(self.path) or '.'):
+            self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            fcntl.flock(self.fd, fcntl.LOCK_SH if self.shared else fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if self.fd is not None:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+            os.close(self.fd)
+            self.fd = None
+
+
+def version(record):
+    ''' Versie van een record.
+
+    keyword arguments:
+    record: dict: het record, None als de dag er niet is.
+
+    returns int, of None als er geen record is.
+    '''
+    if record is None:
+        return None
+    return record.get('versie', 0)
+
+
+def remember(storage, db):
+    ''' Onthoudt de staat van de bestanden van een tour na laden of opslaan.
+
+    keyword arguments:
+    storage: backend object van de tour
+    db: dict: de geladen tour
+
+    returns None
+    '''
+    _signatures[id(db), storage.traveldir, storage.name] = \
+            travel_catalog.signature(storage)
+
+
+def changed_on_disk(storage, db):
+    ''' Is de tour door een ander geschreven sinds remember?
+
+    keyword arguments:
+    storage: backend object van de tour
+    db: dict: de geladen tour
+
+    returns bool
+    '''
+    return _signatures.get((id(db), storage.traveldir, storage.name)) != \
+            travel_catalog.signature(storage)
+
+
+def later(a, b):
+    # de laatste van twee nieuw_record datums, None = tour is klaar
+    if a is None or b is None:
+        return None
+    return max(a, b)
+
+
+def merge(db, disk, changed, bases):
+    ''' Voegt de tour op disk samen met de eigen wijzigingen.
+
+    keyword arguments:
+    db: dict: de eigen tour, met de wijzigingen
+    disk: dict: de tour zoals hij nu op disk staat
+    changed: list: keys van de eigen wijzigingen
+    bases: dict: key: versie waarop de wijziging gebaseerd is (version)
+
+    returns list: keys met een conflict, die zijn niet overgenomen.
+    '''
+    changed = set(changed)
+    conflicts = []
+    for key, record in disk.items():
+        if key == 'tour':
+            continue
+        if key not in changed:
+            db[key] = record
+        elif version(record) != bases.get(key):
+            # ook door een ander gewijzigd: die versie blijft staan
+            db[key] = record
+            conflicts.append(key)
+    for key in changed:
+        if key not in disk and bases.get(key) is not None:
+            # de dag bestond bij laden en nu niet meer
+            conflicts.append(key)
+    header = dict(disk['tour'])
+    header['nieuw_record'] = later(db['tour'].get('nieuw_record'),
+                                   header.get('nieuw_record'))
+    db['tour'] = header
+    travel_stats.rebuild_totals(db)
+    return sorted(conflicts)
+
+
+def stamp(db, changed, bases):
+    ''' Hoogt de versie op van de opgeslagen wijzigingen.
+
+    keyword arguments:
+    db: dict: de tour database
+    changed: list: keys van de wijzigingen
+    bases: dict: key: versie waarop de wijziging gebaseerd is
+
+    returns None
+    '''
+    for key in changed:
+        db[key]['versie'] = (bases.get(key) or 0) + 1
@@ -0,0 +1,149 @@
+#!/bin/python
+# travel_migrate.py
+# Schema migraties van tours.
+# Elke stap brengt een tour naar een versie en staat in STEPS (decorator
+# step), alleen versies die het formaat veranderen hebben een stap.
+# upgrade voert achter elkaar alle stappen uit naar een hogere versie dan
+# die van de tour, zo wordt een tour van elke oude versie bijgewerkt. Een
+# bijgewerkte tour krijgt de versie van travel (current).
+# Open_tour en de daemon werken een oude tour bij het openen bij,
+# travel --migrate-all doet alle tours in de datadir tegelijk (process pool).
+
+import struct
+import concurrent.futures
+import json_serializer
+import travel_stats
+import travel_storage
+
+# (versie, functie(db)) oplopend op versie
+STEPS = []
+
+
+def step(version):
+    ''' Decorator: registreert een migratie naar version.
+
+    keyword arguments:
+    version: string: versie van de tour na deze stap
+
+    returns decorator
+    '''
+    def register(func):
+        STEPS.append((version, func))
+        STEPS.sort(key=lambda item: parse_version(item[0]))
+        return func
+    return register
+
+
+def parse_version(version):
+    # '2.10' na '2.9': als tuple van getallen vergelijken
+    try:
+        return tuple(int(x) for x in str(version).split('.'))
+    except ValueError:
+        return (0,)
+
+
+@step('2.3')
+def dates_23(db):
+    # voor 2.3 stonden de datums in de header als ordinal. Vanaf 2.3 is het
+    # formaat verenigbaar: de totalen in de header (2.6) worden bij gebruik
+    # opnieuw berekend als ze ontbreken, daar is geen stap voor nodig.
+    json_serializer.decode_header(db['tour'])
+    travel_stats.rebuild_totals(db)
+
+
+def current():
+    ''' De versie van een bijgewerkte tour: die van travel, of die van de
+    laatste migratie als die nieuwer is.
+
+    returns string
+    '''
+    from travel import __version__
+    return max(__version__, STEPS[-1][0], key=parse_version)
+
+
+def needs_upgrade(header):
+    ''' Is de tour ouder dan de laatste migratie?
+
+    keyword arguments:
+    header: dict: de tour header
+
+    returns bool
+    '''
+    return parse_version(header.get('version', '0')) < parse_version(STEPS[-1][0])
+
+
+def upgrade(db):
+    ''' Voert de migraties uit die nog niet gedaan zijn, in volgorde.
+
+    keyword arguments:
+    db: dict: de tour database
+
+    returns list: de versies waar de tour langs is gegaan
+    '''
+    done = []
+    for version, func in STEPS:
+        if parse_version(db['tour'].get('version', '0')) < parse_version(version):
+            func(db)
+            db['tour']['version'] = version
+            done.append(version)
+    if done:
+        db['tour']['version'] = current()
+    return done
+
+
+def migrate_tour(name, traveldir):
+    ''' Werkt een tour op disk bij, onder de lock van de tour. Draait ook
+    in een worker proces van migrate_all.
+
+    keyword arguments:
+    name: string: naam vd tour
+    traveldir: string: datadir
+
+    returns tuple: (naam, oude versie, nieuwe versie of None als er niets
+                    te doen was)
+    '''
+    import travel_lock
+    with travel_lock.TourLock(traveldir, name):
+        storage = travel_storage.get_storage(name, traveldir)
+        old = storage.header().get('version')
+        if not needs_upgrade({'version': old}):
+            return name, old, None
+        db = storage.load()
+        upgrade(db)
+        # hele tour schrijven, via een tijdelijk bestand (travel_io.AtomicFile)
+        storage.save(db)
+    return name, old, db['tour']['version']
+
+
+def migrate_all(traveldir, workers=None):
+    ''' Werkt alle tours in de datadir parallel bij en meldt de voortgang.
+
+    keyword arguments:
+    traveldir: string: datadir
+    workers: int: aantal processen. None = aantal cores.
+
+    returns list: (naam, oude versie, nieuwe versie) van de bijgewerkte tours
+    '''
+    import travel_catalog
+    names = travel_storage.tour_names(traveldir)
+    done = []
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(migrate_tour, name, traveldir): name
+                   for name in names}
+        for i, future in enumerate(concurrent.futures.as_completed(futures), 1):
+            try:
+                name, old, new = future.result()
+            except (ValueError, KeyError, OSError, struct.error) as e:
+                print(':: [{}/{}] Tour {} kan niet bijgewerkt worden: {}'.format(
+                    i, len(names), futures[future], e))
+                continue
+            if new is None:
+                print(':: [{}/{}] {}: versie {}, is al bijgewerkt.'.format(
+                    i, len(names), name, old))
+            else:
+                print(':: [{}/{}] {}: versie {} -> {}.'.format(
+                    i, len(names), name, old, new))
+                done.append((name, old, new))
+    # een keer, de workers schrijven de catalogus niet tegelijk
+    travel_catalog.refresh(traveldir)
+    return done
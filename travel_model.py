@@ -0,0 +1,203 @@
+#!/bin/python
+# travel_model.py
+# Compact model van een tour in het geheugen.
+# Tour heeft een header (Header) en de dagen (Day) op datum volgorde. Een Day
+# heeft __slots__ in plaats van een dict per record: ongeveer de helft van het
+# geheugen, en de plaatsnaam (naar) wordt ge-intern-d zodat een plaats die
+# vaak voorkomt maar een keer in het geheugen staat.
+# Json (dicts) blijft het formaat op disk en over de socket. Een Day gedraagt
+# zich bij lezen en schrijven als een record dict (get, [], items), zodat
+# de bestaande functies (stats, export, journal, ...) er ook mee werken.
+# Alleen de daemon (travel_daemon) en TravelDB houden een tour zo in het
+# geheugen, allebei via Tour.load(...).to_db(): de stats, de opslag en het
+# samenvoegen (travel_lock.merge) werken op die dict view, niet op Tour. travel.open_tour laadt record dicts: de CLI leeft kort en leest
+# vaak maar een deel van de tour (load_days, load_range).
+
+import sys
+import bisect
+
+# velden van een dag met een eigen slot, andere velden gaan in extra
+DAY_FIELDS = ('naar', 'afstand', 'eten', 'hotel', 'anders', 'opmerkingen',
+              'versie')
+HEADER_FIELDS = ('naam', 'version', 'omschrijving', 'start_datum', 'eind_datum',
+                 'nieuw_record', 'budget', 'totalen', 'journal')
+
+
+class Record():
+    # Basis voor Day en Header: velden in slots, een niet gezet slot is een
+    # veld dat in de dict ontbreekt. Onbekende velden staan in extra.
+    __slots__ = ('extra',)
+    fields = ()
+
+    def __init__(self, data=None):
+        self.extra = None
+        for key, value in (data or {}).items():
+            self[key] = value
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data)
+
+    def to_dict(self):
+        ''' Het record als dict, zoals het in json staat.
+
+        returns dict
+        '''
+        return dict(self.items())
+
+    def items(self):
+        for field in self.fields:
+            try:
+                yield field, getattr(self, field)
+            except AttributeError:
+                pass
+        if self.extra:
+            yield from self.extra.items()
+
+    def keys(self):
+        return [key for key, value in self.items()]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def get(self, key, default=None):
+        if key in self.fields:
+            return getattr(self, key, default)
+        return self.extra.get(key, default) if self.extra else default
+
+    def __getitem__(self, key):
+        if key in self.fields:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        if self.extra and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key in self.fields:
+            setattr(self, key, value)
+        else:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+
+    def __delitem__(self, key):
+        if key in self.fields:
+            try:
+                delattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        elif self.extra and key in self.extra:
+            del self.extra[key]
+        else:
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        return self.get(key, self) is not self
+
+    def __eq__(self, other):
+        if isinstance(other, (Record, dict)):
+            return self.to_dict() == dict(other.items())
+        return NotImplemented
+
+    def __repr__(self):
+        return '{}({!r})'.format(type(self).__name__, self.to_dict())
+
+
+class Day(Record):
+    # Een dag van een tour.
+    __slots__ = DAY_FIELDS
+    fields = DAY_FIELDS
+
+    def __setitem__(self, key, value):
+        if key == 'naar' and type(value) is str:
+            # dezelfde plaats maar een keer in het geheugen
+            value = sys.intern(value)
+        Record.__setitem__(self, key, value)
+
+
+class Header(Record):
+    # De tour header ('tour' in de json).
+    __slots__ = HEADER_FIELDS
+    fields = HEADER_FIELDS
+
+
+class Tour():
+    # Een tour: header en dagen op datum volgorde. De header is geen dag,
+    # tour['tour'] bestaat dus niet.
+
+    def __init__(self, header, days=None):
+        ''' keyword arguments:
+        header: Header of dict: de tour header
+        days: dict: iso datum: Day of record dict
+        '''
+        self.header = header if isinstance(header, Header) else Header(header)
+        self.days = {}
+        self.order = []
+        for key in sorted(days or ()):
+            self[key] = days[key]
+
+    @classmethod
+    def from_db(cls, db):
+        '''Maakt een Tour van de tour database (dict).
+
+        returns Tour
+        '''
+        return cls(db['tour'], {key: db[key] for key in db if key != 'tour'})
+
+    @classmethod
+    def load(cls, name, traveldir):
+        '''Leest een tour via zijn opslag backend.
+
+        returns Tour
+        raises FileNotFoundError als de tour niet bestaat.
+        '''
+        import travel_storage
+        db = travel_storage.get_storage(name, traveldir).load()
+        tour = cls(db.pop('tour'))
+        # de record dicts een voor een loslaten
+        for key in sorted(db):
+            tour[key] = db.pop(key)
+        return tour
+
+    def to_db(self):
+        '''De tour database voor de bestaande functies en de opslag.
+        De header en de dagen zijn de objecten zelf (geen kopie), wijzigingen
+        via de database zijn dus ook wijzigingen van de Tour.
+
+        returns dict
+        '''
+        db = {'tour': self.header}
+        db.update(self.days)
+        return db
+
+    def __len__(self):
+        return len(self.days)
+
+    def __iter__(self):
+        # iso datums op volgorde
+        return iter(self.order)
+
+    def __contains__(self, key):
+        return key in self.days
+
+    def __getitem__(self, key):
+        return self.days[key]
+
+    def get(self, key, default=None):
+        return self.days.get(key, default)
+
+    def __setitem__(self, key, record):
+        if not isinstance(record, Day):
+            record = Day(record)
+        if key not in self.days:
+            if not self.order or self.order[-1] < key:
+                self.order.append(key)
+            else:
+                bisect.insort(self.order, key)
+        self.days[key] = record
@@ -0,0 +1,230 @@
+#!/bin/python
+# travel_rates.py
+# Wisselkoersen per datum.
+# In de config staat per valuta een tabel met koersen en de datum vanaf
+# wanneer ze gelden: "koersen": {"USD": [["", 0.9], ["2015-06-01", 0.92]]}.
+# Datum "" geldt vanaf het begin. Een oude vaste factor ("USD": 0.9) telt
+# als zo'n koers vanaf het begin.
+#
+# Een geld veld dat in een andere valuta is ingevoerd bewaart ook het
+# originele bedrag: record['valuta'] = {veld: [[bedrag, valuta], ...]}
+# (meer delen als er met + is opgeteld). Het veld zelf bevat het bedrag in
+# euro, --reprice rekent het opnieuw uit als de koersen veranderd zijn.
+
+import bisect
+from array import array
+
+EURO = 'EUR'
+
+
+def parse(waarde):
+    ''' Splitst een ingevoerd bedrag in bedrag en valuta.
+
+    keyword arguments:
+    waarde: string: bijv. '12.50' of '12.50usd'
+
+    returns tuple: (float, string valuta of None voor euro)
+    '''
+    waarde = waarde.strip()
+    if waarde[-1].isalpha():
+        return float(waarde[:-3]), waarde[-3:].upper()
+    return float(waarde), None
+
+
+class Rates():
+    # Koers tabellen per valuta, opzoeken met bisect op datum.
+
+    def __init__(self, table=None):
+        ''' keyword arguments:
+        table: dict: valuta: [[iso datum, koers], ...] zoals in de config
+        '''
+        self.dates = {}
+        self.rates = {}
+        # (valuta, iso datum): koers
+        self.cache = {}
+        for valuta, rows in (table or {}).items():
+            for datum, rate in rows:
+                self.add(valuta, datum, rate)
+
+    @classmethod
+    def from_conf(cls, conf):
+        '''Koersen uit de config, met de oude vaste factoren.
+
+        returns Rates
+        '''
+        rates = cls(conf.get('koersen'))
+        for key, value in conf.items():
+            if len(key) == 3 and key.isalpha() and key.isupper() and \
+                    key not in rates.dates and isinstance(value, (int, float)):
+                rates.add(key, '', value)
+        return rates
+
+    def add(self, valuta, datum, rate):
+        '''Zet de koers vanaf een datum, een koers op dezelfde datum wordt
+        vervangen.
+
+        keyword arguments:
+        valuta: string: 3 letter afkorting
+        datum: string: iso datum, '' = vanaf het begin
+        rate: float: euro per eenheid
+
+        returns None
+        '''
+        dates = self.dates.setdefault(valuta, [])
+        rates = self.rates.setdefault(valuta, [])
+        i = bisect.bisect_left(dates, datum)
+        if i < len(dates) and dates[i] == datum:
+            rates[i] = rate
+        else:
+            dates.insert(i, datum)
+            rates.insert(i, rate)
+        self.cache.clear()
+
+    def rate(self, valuta, datum=None):
+        '''De koers op een datum: de laatste koers die op of voor die datum
+        ingaat, anders de eerste.
+
+        keyword arguments:
+        valuta: string: 3 letter afkorting
+        datum: string: iso datum, None = de laatste koers
+
+        returns float
+        raises KeyError als de valuta onbekend is.
+        '''
+        key = (valuta, datum)
+        if key not in self.cache:
+            dates = self.dates[valuta]
+            i = len(dates) if datum is None else bisect.bisect_right(dates, datum)
+            self.cache[key] = self.rates[valuta][max(i - 1, 0)]
+        return self.cache[key]
+
+    def euro(self, bedrag, valuta=None, datum=None):
+        '''Bedrag omgerekend naar euro.
+
+        returns float
+        '''
+        if valuta is None or valuta == EURO:
+            return bedrag
+        return self.rate(valuta, datum) * bedrag
+
+    def table(self):
+        # de koersen in het formaat van de config
+        return {valuta: [[d, r] for d, r in zip(self.dates[valuta], self.rates[valuta])]
+                for valuta in sorted(self.dates)}
+
+
+# koersen van de huidige config, zie configure
+RATES = Rates()
+
+
+def configure(conf):
+    ''' Neemt de koersen uit de config over.
+
+    keyword arguments:
+    conf: dict: configuratie
+
+    returns None
+    '''
+    global RATES
+    RATES = Rates.from_conf(conf)
+
+
+def add_rate(conf, valuta, datum, rate):
+    ''' Voegt een koers aan de config toe (--add-currency). Een oude vaste
+    factor van deze valuta gaat de tabel in als koers vanaf het begin.
+
+    keyword arguments:
+    conf: dict: configuratie
+    valuta: string: 3 letter afkorting, hoofdletters
+    datum: string: iso datum vanaf wanneer de koers geldt, '' = altijd
+    rate: float: euro per eenheid
+
+    returns None
+    '''
+    rates = Rates.from_conf(conf)
+    rates.add(valuta, datum, rate)
+    conf.pop(valuta, None)
+    conf['koersen'] = rates.table()
+    configure(conf)
+
+
+def geld(waarde, datum=None):
+    ''' Rekent een ingevoerd bedrag om naar euro als het eindigt met een
+    3 letter valuta, met de koers op datum.
+
+    keyword arguments:
+    waarde: string: geld hoeveelheid
+    datum: string: iso datum van het record, None = de laatste koers
+
+    returns float: de waarde in euro's
+    '''
+    return RATES.euro(*parse(waarde), datum)
+
+
+def set_amount(record, field, waarde, datum=None, default=None):
+    ''' Zet een geld veld in een record, met het originele bedrag.
+    Begint waarde met een +, dan wordt het opgeteld bij het veld van default.
+
+    keyword arguments:
+    record: dict: het nieuwe record
+    field: string: eten, hotel of anders
+    waarde: string: ingevoerd bedrag, bijv. '12.50usd' of '+3'
+    datum: string: iso datum van het record
+    default: dict: het oude record
+
+    returns None
+    '''
+    default = default or {}
+    bedrag, valuta = parse(waarde.lstrip('+'))
+    parts = [[bedrag, valuta or EURO]]
+    if waarde.startswith('+'):
+        old = (default.get('valuta') or {}).get(field) or \
+                [[default.get(field, 0.0), EURO]]
+        parts = old + parts
+    originals = dict(record.get('valuta') or {})
+    if any(valuta != EURO for bedrag, valuta in parts):
+        originals[field] = parts
+    else:
+        originals.pop(field, None)
+    if originals:
+        record['valuta'] = originals
+    else:
+        record.pop('valuta', None)
+    record[field] = sum(RATES.euro(bedrag, valuta, datum) for bedrag, valuta in parts)
+
+
+def reprice(db, rates=None):
+    ''' Rekent de geld velden met een origineel bedrag opnieuw om naar euro,
+    in een doorloop over alle delen van de hele tour.
+
+    keyword arguments:
+    db: dict: de tour database
+    rates: Rates: None = de koersen uit de config
+
+    returns list: keys van de gewijzigde records, gesorteerd
+    '''
+    rates = rates or RATES
+    keys, fields, valutas = [], [], []
+    amounts = array('d')
+    for key in db:
+        if key == 'tour':
+            continue
+        for field, parts in (db[key].get('valuta') or {}).items():
+            for bedrag, valuta in parts:
+                keys.append(key)
+                fields.append(field)
+                valutas.append(valuta)
+                amounts.append(bedrag)
+    # een koers per deel; rate onthoudt ze per valuta en dag
+    factors = array('d', [1.0 if valuta == EURO else rates.rate(valuta, key)
+                          for key, valuta in zip(keys, valutas)])
+    euros = [bedrag * factor for bedrag, factor in zip(amounts, factors)]
+    values = {}
+    for key, field, value in zip(keys, fields, euros):
+        values[key, field] = values.get((key, field), 0.0) + value
+    changed = set()
+    for (key, field), value in values.items():
+        if db[key].get(field) != value:
+            db[key][field] = value
+            changed.add(key)
+    return sorted(changed)
@@ -0,0 +1,126 @@
+#!/bin/python
+# travel_report.py
+# Rapport over alle tours in de datadir.
+# Elke tour wordt in een apart proces geopend en samengevat. De kleine
+# samenvattingen worden samengevoegd tot een tabel per tour, jaar of maand.
+
+import struct
+import datetime
+import concurrent.futures
+import travel_storage
+import travel_aggregate
+
+# kolommen van een samenvatting
+FIELDS = ('records', 'fietsdagen', 'afstand', 'eten', 'hotel', 'anders')
+
+
+def period_key(ordinal, group):
+    # periode van een datum: jaar 'YYYY', maand 'YYYY-MM' of week 'YYYY-Www'
+    datum = datetime.date.fromordinal(ordinal)
+    if group == 'year':
+        return '{:04}'.format(datum.year)
+    if group == 'week':
+        year, week, weekday = datum.isocalendar()
+        return '{:04}-W{:02}'.format(year, week)
+    return '{:04}-{:02}'.format(datum.year, datum.month)
+
+
+def summarize(name, traveldir, group=None):
+    ''' Vat een tour samen. Draait in een worker proces.
+
+    keyword arguments:
+    name: string: naam vd tour
+    traveldir: string: datadir
+    group: string: None, 'year', 'month' of 'week'
+
+    returns dict: naam, budget en per periode de FIELDS.
+                  Zonder group is er een periode met de naam van de tour.
+    '''
+    db = travel_storage.get_storage(name, traveldir).load()
+    cols = travel_aggregate.Columns.from_db(db)
+    groups = {}
+    if group is None:
+        groups[name] = {'records': len(cols), 'fietsdagen': cols.fietsdagen()}
+        for field, typecode in travel_aggregate.COLUMNS:
+            groups[name][field] = cols.total(field)
+    else:
+        for row in zip(cols.datum, cols.afstand, cols.eten, cols.hotel, cols.anders):
+            key = period_key(row[0], group)
+            if key not in groups:
+                groups[key] = dict.fromkeys(FIELDS, 0)
+            totals = groups[key]
+            totals['records'] += 1
+            totals['fietsdagen'] += bool(row[1])
+            totals['afstand'] += row[1]
+            totals['eten'] += row[2]
+            totals['hotel'] += row[3]
+            totals['anders'] += row[4]
+    return {'naam': name, 'budget': db['tour'].get('budget', 0.0), 'groups': groups}
+
+
+def collect(traveldir, group=None, workers=None):
+    ''' Vat alle tours parallel samen en voegt de resultaten samen.
+
+    keyword arguments:
+    traveldir: string: datadir
+    group: string: None, 'year' of 'month'
+    workers: int: aantal processen. None = aantal cores.
+
+    returns tuple: (dict periode: totalen, float: totaal budget)
+    '''
+    names = travel_storage.tour_names(traveldir)
+    rows = {}
+    budget = 0.0
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(summarize, name, traveldir, group): name
+                   for name in names}
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                summary = future.result()
+            except (ValueError, KeyError, OSError, struct.error) as e:
+                print(':: Tour {} kan niet gelezen worden: {}'.format(futures[future], e))
+                continue
+            budget += summary['budget']
+            for key, totals in summary['groups'].items():
+                if key not in rows:
+                    rows[key] = dict.fromkeys(FIELDS, 0)
+                for field in FIELDS:
+                    rows[key][field] += totals[field]
+    return rows, budget
+
+
+def print_report(traveldir, group=None, workers=None):
+    ''' Print het rapport over alle tours.
+
+    keyword arguments:
+    traveldir: string: datadir
+    group: string: None (per tour), 'year' of 'month'
+    workers: int: aantal processen. None = aantal cores.
+
+    returns None
+    '''
+    rows, budget = collect(traveldir, group, workers)
+    line = '{:20} {:>6} {:>6} {:>6} {:>9} {:>10} {:>10} {:>10} {:>11}'
+    print(line.format({None: 'Tour', 'year': 'Jaar', 'month': 'Maand',
+                       'week': 'Week'}[group],
+                      'Dagen', 'Fiets', 'Rust', 'Km', 'Eten €', 'Hotel €',
+                      'Anders €', 'Totaal €'))
+    total = dict.fromkeys(FIELDS, 0)
+    numbers = '{:20} {:6} {:6} {:6} {:9} {:10.2f} {:10.2f} {:10.2f} {:11.2f}'
+    for key in sorted(rows):
+        row = rows[key]
+        for field in FIELDS:
+            total[field] += row[field]
+        print(numbers.format(key, row['records'], row['fietsdagen'],
+                             row['records'] - row['fietsdagen'], row['afstand'],
+                             row['eten'], row['hotel'], row['anders'],
+                             row['eten'] + row['hotel'] + row['anders']))
+    kosten = total['eten'] + total['hotel'] + total['anders']
+    print('{0:-<20} {0:-<6} {0:-<6} {0:-<6} {0:-<9} {0:-<10} {0:-<10} {0:-<10} {0:-<11}'
+          .format(''))
+    print(numbers.format('totaal', total['records'], total['fietsdagen'],
+                         total['records'] - total['fietsdagen'], total['afstand'],
+                         total['eten'], total['hotel'], total['anders'], kosten))
+    if budget:
+        print('Budget € {:.2f} uitgegeven € {:.2f} ({:.0%})'.format(
+            budget, kosten, kosten / budget))
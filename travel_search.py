@@ -0,0 +1,268 @@
+#!/bin/python
+# travel_search.py
+# Zoeken in de tekstvelden (naar en opmerkingen) van tours.
+# Per tour staat in <naam>.words een inverted index: per woord de datums
+# waarop het voorkomt, en per datum de tekst van naar en opmerkingen om de
+# resultaten te tonen en om bij bewerken de oude woorden te verwijderen.
+# Zoeken leest alleen deze index, niet de tour zelf.
+#
+# Bij toevoegen en bewerken wordt de tekst van de gewijzigde dagen alleen
+# achter <naam>.words.log geschreven (een json lijst per regel: datum, naar,
+# opmerkingen); lezen speelt de log af. Boven MAX_LOG wordt de log in de
+# index gevouwen. Zo kost opslaan niet meer naarmate de tour groeit.
+#
+# Woorden zijn kleine letters zonder accenten. Elk woord van de zoekvraag
+# moet voorkomen, als begin van een woord (prefix).
+
+import os
+import re
+import json
+import bisect
+import unicodedata
+import travel_io
+
+TEXT_FIELDS = ('naar', 'opmerkingen')
+# grootte in bytes waarboven de log in de index wordt gevouwen
+MAX_LOG = 256 * 1024
+WORD = re.compile(r'\w+')
+
+
+def words_file(traveldir, name):
+    ''' Pad van de zoek index van een tour.
+
+    keyword arguments:
+    traveldir: string: datadir
+    name: string: naam vd tour
+
+    returns string
+    '''
+    return os.path.join(traveldir, name + '.words')
+
+
+def log_file(traveldir, name):
+    return os.path.join(traveldir, name + '.words.log')
+
+
+def tokenize(text):
+    ''' De woorden van een tekst, klein en zonder accenten.
+
+    keyword arguments:
+    text: string
+
+    returns set
+    '''
+    if not text:
+        return set()
+    text = unicodedata.normalize('NFKD', text.lower())
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    return set(WORD.findall(text))
+
+
+class WordIndex():
+    # Inverted index van de tekstvelden van een tour.
+
+    def __init__(self, days=None, words=None):
+        # iso datum: [naar, opmerkingen]
+        self.days = days or {}
+        # woord: gesorteerde iso datums
+        self.words = words or {}
+        self.sorted = None
+
+    def __len__(self):
+        return len(self.days)
+
+    @classmethod
+    def from_db(cls, db):
+        '''Bouwt de index van een hele tour.
+
+        returns WordIndex
+        '''
+        index = cls()
+        for key in sorted(k for k in db if k != 'tour'):
+            index.set(key, db[key])
+        return index
+
+    @classmethod
+    def read(cls, traveldir, name):
+        '''Leest de index van een tour.
+
+        returns WordIndex, of None als er geen (leesbare) index is.
+        '''
+        try:
+            with open(words_file(traveldir, name), 'r', encoding='utf-8') as infile:
+                data = json.load(infile)
+            index = cls(data['days'], data['words'])
+        except (FileNotFoundError, ValueError, KeyError):
+            return None
+        try:
+            with open(log_file(traveldir, name), 'r', encoding='utf-8') as infile:
+                for line in infile:
+                    key, *text = json.loads(line)
+                    index.set(key, dict(zip(TEXT_FIELDS, text)))
+        except FileNotFoundError:
+            pass
+        except ValueError:
+            # afgebroken regel: opnieuw opbouwen
+            return None
+        return index
+
+    def save(self, traveldir, name):
+        with travel_io.AtomicFile(words_file(traveldir, name)) as outfile:
+            json.dump({'days': self.days, 'words': self.words}, outfile,
+                      ensure_ascii=False)
+        # de log zit nu in de index
+        try:
+            os.remove(log_file(traveldir, name))
+        except FileNotFoundError:
+            pass
+
+    def set(self, key, record):
+        '''Zet de tekst van een dag in de index, oude woorden gaan eruit.
+
+        keyword arguments:
+        key: string: iso datum
+        record: dict: het record
+
+        returns None
+        '''
+        old = self.days.get(key)
+        if old is not None:
+            for word in tokenize(' '.join(filter(None, old))):
+                postings = self.words.get(word)
+                if postings:
+                    i = bisect.bisect_left(postings, key)
+                    if i < len(postings) and postings[i] == key:
+                        del postings[i]
+                    if not postings:
+                        del self.words[word]
+        text = [record.get(field) for field in TEXT_FIELDS]
+        self.days[key] = text
+        for word in tokenize(' '.join(filter(None, text))):
+            postings = self.words.setdefault(word, [])
+            if not postings or postings[-1] < key:
+                postings.append(key)
+            else:
+                bisect.insort(postings, key)
+        self.sorted = None
+
+    def match(self, term):
+        '''Datums met een woord dat met term begint.
+
+        returns set van iso datums
+        '''
+        if self.sorted is None:
+            self.sorted = sorted(self.words)
+        result = set()
+        i = bisect.bisect_left(self.sorted, term)
+        while i < len(self.sorted) and self.sorted[i].startswith(term):
+            result.update(self.words[self.sorted[i]])
+            i += 1
+        return result
+
+    def search(self, query, van=None, tot=None):
+        '''Zoekt de dagen waarop alle woorden van query voorkomen.
+
+        keyword arguments:
+        query: string: zoekvraag
+        van: date: eerste datum, None = vanaf het begin
+        tot: date: laatste datum, None = tot het eind
+
+        returns list van iso datums, gesorteerd
+        '''
+        terms = sorted(tokenize(query), key=len, reverse=True)
+        if not terms:
+            return []
+        found = self.match(terms[0])
+        for term in terms[1:]:
+            if not found:
+                break
+            found &= self.match(term)
+        van = van.isoformat() if van else ''
+        tot = tot.isoformat() if tot else '9999-12-31'
+        return sorted(key for key in found if van <= key <= tot)
+
+
+def update_words(db, traveldir, changed=None):
+    '''Werkt de zoek index bij na het opslaan van een tour.
+
+    keyword arguments:
+    db: dict: de tour database
+    traveldir: string: datadir
+    changed: list: keys van gewijzigde records. None = opnieuw opbouwen.
+
+    returns None
+    '''
+    import travel_stats
+    name = db['tour']['naam']
+    if changed is not None and os.path.exists(words_file(traveldir, name)):
+        lines = [json.dumps([key] + [db[key].get(field) for field in TEXT_FIELDS],
+                            ensure_ascii=False) for key in changed]
+        with open(log_file(traveldir, name), 'a', encoding='utf-8') as outfile:
+            outfile.write(''.join(line + '\n' for line in lines))
+            if outfile.tell() < MAX_LOG:
+                return
+    index = None
+    if changed is not None:
+        # log vouwen
+        index = WordIndex.read(traveldir, name)
+    if index is None or len(index) != travel_stats.record_count(db):
+        index = WordIndex.from_db(travel_stats.whole(db))
+    index.save(traveldir, name)
+
+
+def open_index(name, traveldir, records):
+    '''Index van een tour, opnieuw opgebouwd als hij ontbreekt of niet klopt.
+
+    keyword arguments:
+    name: string: naam vd tour
+    traveldir: string: datadir
+    records: int: aantal records van de tour (uit de catalogus)
+
+    returns WordIndex
+    '''
+    index = WordIndex.read(traveldir, name)
+    if index is None or len(index) != records:
+        import travel_storage
+        index = WordIndex.from_db(travel_storage.get_storage(name, traveldir).load())
+        index.save(traveldir, name)
+    return index
+
+
+def search(traveldir, query, names=None, van=None, tot=None):
+    '''Zoekt in een of alle tours.
+
+    keyword arguments:
+    traveldir: string: datadir
+    query: string: zoekvraag
+    names: list: namen van de tours, None = alle tours
+    van: date: eerste datum
+    tot: date: laatste datum
+
+    returns list van (naam, iso datum, naar, opmerkingen)
+    '''
+    import travel_catalog
+    catalog = travel_catalog.refresh(traveldir)
+    results = []
+    for name in names if names is not None else sorted(catalog):
+        if name not in catalog:
+            continue
+        index = open_index(name, traveldir, catalog[name]['totalen']['records'])
+        for key in index.search(query, van, tot):
+            naar, opmerkingen = index.days[key]
+            results.append((name, key, naar or '', opmerkingen or ''))
+    return results
+
+
+def print_results(results, tours=False):
+    ''' Print de gevonden dagen.
+
+    keyword arguments:
+    results: list: uitkomst van search
+    tours: bool: print ook de naam van de tour
+
+    returns None
+    '''
+    for name, key, naar, opmerkingen in results:
+        line = '{:10} {:28} {}'.format(key, naar, opmerkingen)
+        print('{:20} {}'.format(name, line) if tours else line)
+    print(':: {} dagen gevonden.'.format(len(results)))
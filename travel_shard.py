@@ -0,0 +1,273 @@
+#!/bin/python
+# travel_shard.py
+# Opslag van een tour in shards, voor tours zonder eind die jaren doorgaan.
+# In <datadir>/<naam>/ staat:
+#   tour.json  de header, de shard periode en per shard een samenvatting
+#              (records, fietsdagen, afstand, eten, hotel, anders).
+#   <shard>.json  de records van een jaar (YYYY) of maand (YYYY-MM).
+# Opslaan schrijft alleen de shards met een gewijzigde dag en tour.json.
+# Toevoegen en bewerken laden alleen de shards die ze nodig hebben
+# (load_days), zodat de tijd niet groeit met de lengte van de tour. Een
+# --print van een periode leest alleen de shards van die periode (load_range).
+# De totalen in de header zijn de som van de samenvattingen.
+
+import os
+import glob
+import json
+import travel_io
+import travel_trace
+import json_serializer
+import travel_aggregate
+
+HEADER = 'tour.json'
+# periode van een nieuwe tour: 'year' of 'month' (config 'shard')
+PERIOD = 'year'
+SUMMARY_FIELDS = ('records', 'fietsdagen', 'afstand', 'eten', 'hotel', 'anders')
+
+
+def shard_of(key, period):
+    ''' Shard van een dag.
+
+    keyword arguments:
+    key: string: iso datum
+    period: string: 'year' of 'month'
+
+    returns string: YYYY of YYYY-MM
+    '''
+    return key[:4] if period == 'year' else key[:7]
+
+
+def summary(records):
+    ''' Samenvatting van de records van een shard.
+
+    keyword arguments:
+    records: dict: iso datum: record
+
+    returns dict: SUMMARY_FIELDS
+    '''
+    cols = travel_aggregate.Columns.from_db(records, list(records))
+    result = {'records': len(cols), 'fietsdagen': cols.fietsdagen()}
+    for field, typecode in travel_aggregate.COLUMNS:
+        result[field] = round(cols.total(field), 2) if typecode == 'd' \
+                else cols.total(field)
+    return result
+
+
+class PartialTour(dict):
+    # Tour database waarvan alleen een deel van de shards geladen is.
+    # travel_stats.record_count en travel_stats.whole houden er rekening mee.
+
+    def __init__(self, storage, header, period, summaries):
+        dict.__init__(self, tour=header)
+        self.storage = storage
+        self.period = period
+        # shards die nog niet geladen zijn
+        self.missing = set(summaries)
+        self.summaries = summaries
+
+    def add_shard(self, shard):
+        if shard in self.missing:
+            self.missing.discard(shard)
+            for key, rec in self.storage.read_shard(shard).items():
+                self.setdefault(key, rec)
+
+    def record_count(self):
+        # records in het geheugen plus die in de niet geladen shards
+        return len(self) - 1 + sum(self.summaries[s]['records'] for s in self.missing)
+
+    def complete(self):
+        '''Laadt de rest van de shards, daarna is het een hele tour.
+
+        returns None
+        '''
+        for shard in sorted(self.missing):
+            self.add_shard(shard)
+
+
+class ShardedStorage():
+    # Tour als directory met een header en een bestand per jaar of maand.
+    suffix = os.sep + HEADER
+
+    def __init__(self, name, traveldir):
+        self.name = name
+        self.traveldir = traveldir
+        self.dir = os.path.join(traveldir, name)
+        self.path = os.path.join(self.dir, HEADER)
+
+    def exists(self):
+        return os.path.isfile(self.path)
+
+    def shard_file(self, shard):
+        return os.path.join(self.dir, shard + '.json')
+
+    def shards(self):
+        # namen van de shard bestanden op disk
+        return sorted(os.path.basename(fn)[:-len('.json')] for fn in
+                      glob.glob(os.path.join(glob.escape(self.dir), '[0-9]*.json')))
+
+    def files(self):
+        # tour.json wordt bij elk opslaan geschreven, dus zijn mtime en
+        # grootte laten zien of de tour veranderd is (travel_catalog)
+        return (self.path,)
+
+    def all_files(self):
+        # alle bestanden van de tour, voor de grootte op disk
+        return self.files() + tuple(self.shard_file(s) for s in self.shards())
+
+    def read_header(self):
+        '''Leest tour.json.
+
+        returns dict: tour (header), period, shards (samenvattingen)
+        raises FileNotFoundError als de tour niet bestaat.
+        '''
+        with open(self.path, 'r', encoding='utf-8') as infile:
+            data = json.load(infile)
+        json_serializer.decode_header(data['tour'])
+        return data
+
+    def read_shard(self, shard):
+        try:
+            with open(self.shard_file(shard), 'r', encoding='utf-8') as infile:
+                return json.load(infile)
+        except FileNotFoundError:
+            return {}
+
+    def header(self):
+        return self.read_header()['tour']
+
+    def load(self):
+        '''Leest de hele tour.
+
+        returns dict: de tour database
+        '''
+        data = self.read_header()
+        db = {'tour': data['tour']}
+        with travel_trace.span('shards'):
+            for shard in sorted(data['shards']):
+                db.update(self.read_shard(shard))
+        return db
+
+    def load_days(self, days=()):
+        '''Leest de header en alleen de shards die nodig zijn: die van days,
+        die van nieuw_record (toevoegen) en de nieuwste.
+
+        keyword arguments:
+        days: iterable: iso datums
+
+        returns PartialTour
+        '''
+        data = self.read_header()
+        period = data['period']
+        wanted = {shard_of(key, period) for key in days}
+        if data['tour'].get('nieuw_record'):
+            wanted.add(shard_of(data['tour']['nieuw_record'].isoformat(), period))
+        if data['shards']:
+            wanted.add(max(data['shards']))
+        return self.load_shards(data, wanted)
+
+    def load_range(self, van=None, tot=None):
+        '''Leest de header en alleen de shards van een periode.
+
+        keyword arguments:
+        van: date: eerste datum, None = vanaf het begin
+        tot: date: laatste datum, None = tot het eind
+
+        returns PartialTour
+        '''
+        data = self.read_header()
+        period = data['period']
+        first = shard_of(van.isoformat(), period) if van else ''
+        last = shard_of(tot.isoformat(), period) if tot else '9999'
+        return self.load_shards(data, {shard for shard in data['shards']
+                                       if first <= shard <= last})
+
+    def load_shards(self, data, wanted):
+        # PartialTour met de header en de shards uit wanted
+        db = PartialTour(self, data['tour'], data['period'], data['shards'])
+        with travel_trace.span('shards'):
+            for shard in sorted(wanted):
+                db.add_shard(shard)
+        return db
+
+    def save(self, db, changed=None):
+        '''Schrijft de shards met een gewijzigde dag en de header.
+
+        keyword arguments:
+        db: dict: de tour database (of PartialTour met de gewijzigde shards)
+        changed: list: keys van gewijzigde records. None = alles schrijven.
+
+        returns None
+        '''
+        import travel_stats
+        try:
+            if isinstance(db, PartialTour):
+                period, summaries = db.period, dict(db.summaries)
+            else:
+                data = self.read_header()
+                period, summaries = data['period'], data['shards']
+        except (FileNotFoundError, ValueError, KeyError):
+            period, summaries, changed = PERIOD, {}, None
+        if changed is None:
+            travel_stats.whole(db)
+            summaries = {}
+            stale = set(self.shards())
+            touched = {shard_of(key, period) for key in db if key != 'tour'}
+        else:
+            stale = set()
+            touched = {shard_of(key, period) for key in changed}
+        groups = {shard: {} for shard in touched}
+        for key in sorted(k for k in db if k != 'tour'):
+            if shard_of(key, period) in groups:
+                groups[shard_of(key, period)][key] = db[key]
+        os.makedirs(self.dir, exist_ok=True)
+        for shard, records in sorted(groups.items()):
+            # json.dumps gebruikt de C encoder, json.dump niet
+            with travel_io.AtomicFile(self.shard_file(shard)) as outfile:
+                outfile.write(json.dumps(records, default=json_serializer.to_iso))
+                travel_trace.count('bytes geschreven', outfile.tell())
+            summaries[shard] = summary(records)
+            stale.discard(shard)
+        for shard in stale:
+            os.remove(self.shard_file(shard))
+        totals = dict.fromkeys(SUMMARY_FIELDS, 0)
+        for item in summaries.values():
+            for field in SUMMARY_FIELDS:
+                totals[field] += item[field]
+        for field in ('eten', 'hotel', 'anders'):
+            totals[field] = round(totals[field], 2)
+        db['tour']['totalen'] = totals
+        if isinstance(db, PartialTour):
+            db.summaries = summaries
+        # als laatste: tot hier ziet een lezer de oude header
+        with travel_io.AtomicFile(self.path) as outfile:
+            outfile.write(json.dumps({'tour': db['tour'], 'period': period,
+                                      'shards': summaries},
+                                     default=json_serializer.to_iso))
+
+    def records(self, van=None, tot=None):
+        '''Records in datum volgorde, alleen de shards in de periode worden
+        gelezen.
+
+        keyword arguments:
+        van: date: eerste datum, None = vanaf het begin
+        tot: date: laatste datum, None = tot het eind
+
+        returns iterator van (iso datum, record)
+        '''
+        data = self.read_header()
+        van = van.isoformat() if van else ''
+        tot = tot.isoformat() if tot else '9999-12-31'
+        for shard in sorted(data['shards']):
+            if shard_of(van, data['period']) <= shard <= shard_of(tot, data['period']):
+                records = self.read_shard(shard)
+                for key in sorted(records):
+                    if van <= key <= tot:
+                        yield key, records[key]
+
+    def totals(self, van=None, tot=None):
+        '''Totalen over een periode, zie travel_aggregate.Columns.summary.
+
+        returns dict
+        '''
+        records = dict(self.records(van, tot))
+        return travel_aggregate.Columns.from_db(records, list(records)).summary()
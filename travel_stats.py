@@ -0,0 +1,103 @@
+#!/bin/python
+# travel_stats.py
+# Lopende totalen van een tour.
+# De totalen staan in de tour header onder 'totalen' en worden bij
+# toevoegen en bewerken met het verschil bijgewerkt. Alleen als ze
+# ontbreken of niet meer kloppen worden ze opnieuw berekend.
+
+import travel_aggregate
+
+# numerieke velden van een record
+FIELDS = ('afstand', 'eten', 'hotel', 'anders')
+# geld velden worden op centen afgerond om afrondingsfouten te voorkomen.
+GELD_FIELDS = ('eten', 'hotel', 'anders')
+
+
+def record_count(db):
+    ''' Aantal records van de tour.
+
+    keyword arguments:
+    db: dict: de open database, ook een gedeeltelijk geladen tour
+        (travel_shard.PartialTour)
+
+    returns int
+    '''
+    if hasattr(db, 'record_count'):
+        return db.record_count()
+    return len(db) - 1
+
+
+def whole(db):
+    ''' Zorgt dat alle records in db staan. Een gedeeltelijk geladen tour
+    laadt de rest, voor berekeningen over de hele tour.
+
+    keyword arguments:
+    db: dict: de open database
+
+    returns dict: db
+    '''
+    if hasattr(db, 'complete'):
+        db.complete()
+    return db
+
+
+def rebuild_totals(db):
+    ''' Berekent de totalen opnieuw over alle records.
+
+    keyword arguments:
+    db: dict: de open database
+
+    returns dict: de totalen (ook opgeslagen in de header)
+    '''
+    cols = travel_aggregate.Columns.from_db(whole(db))
+    totals = {field: cols.total(field) for field in FIELDS}
+    for field in GELD_FIELDS:
+        totals[field] = round(totals[field], 2)
+    totals['fietsdagen'] = cols.fietsdagen()
+    totals['records'] = len(cols)
+    db['tour']['totalen'] = totals
+    return totals
+
+
+def get_totals(db):
+    ''' Geeft de lopende totalen, herberekend als ze ontbreken of verouderd zijn.
+    Verouderd is hier een ander aantal records; een tour die buiten travel om
+    is veranderd heeft bij het laden al geen totalen meer
+    (travel_catalog.check_totals).
+
+    keyword arguments:
+    db: dict: de open database
+
+    returns dict: afstand, eten, hotel, anders, fietsdagen, records
+    '''
+    totals = db['tour'].get('totalen')
+    if not totals or totals.get('records') != record_count(db):
+        totals = rebuild_totals(db)
+    return totals
+
+
+def update_totals(db, old, new, totals=None):
+    ''' Werkt de totalen bij met het verschil tussen een oud en nieuw record.
+
+    keyword arguments:
+    db: dict: de open database
+    old: dict: record voor de wijziging, None bij een nieuw record
+    new: dict: record na de wijziging
+    totals: dict: totalen om bij te werken. None = totalen uit de header.
+
+    returns None
+    '''
+    if totals is None:
+        # als de totalen al niet klopten, eerst herberekenen (bevat new al)
+        totals = db['tour'].get('totalen')
+        if not totals or totals.get('records') != record_count(db) - (old is None):
+            rebuild_totals(db)
+            return
+    if old is None:
+        old = {}
+        totals['records'] += 1
+    for field in FIELDS:
+        totals[field] += new.get(field, 0) - old.get(field, 0)
+        if field in GELD_FIELDS:
+            totals[field] = round(totals[field], 2)
+    totals['fietsdagen'] += bool(new.get('afstand')) - bool(old.get('afstand'))
@@ -0,0 +1,551 @@
+#!/bin/python
+# travel_storage.py
+# Opslag backends voor tours.
+# Elke backend slaat een tour op als een bestand <naam><suffix> in de datadir
+# en kent dezelfde methodes: exists, load, save, records en totals.
+#   json:   het bestaande json document, met journal (travel_journal).
+#   gzip:   json gecomprimeerd met gzip (<naam>.json.gz), met journal.
+#   xz:     json gecomprimeerd met lzma (<naam>.json.xz), met journal.
+#           Voor afgeronde tours, zie archive.
+#   sharded: directory <naam>/ met een bestand per jaar of maand
+#           (travel_shard), voor tours die jaren doorgaan.
+#   sqlite: een sqlite3 database met een rij per dag, key is de datum ordinal.
+#   binary: vaste binaire tabel per datum ordinal, gelezen via mmap
+#           (travel_binary).
+
+import os
+import glob
+import shutil
+import gzip
+import json
+import lzma
+import datetime
+import json_serializer
+import travel_io
+import travel_stats
+import travel_trace
+import travel_journal
+import travel_aggregate
+from travel_binary import BinaryStorage
+from travel_shard import ShardedStorage
+
+# velden van een record die een eigen kolom hebben in sqlite
+RECORD_FIELDS = ('naar', 'afstand', 'eten', 'hotel', 'anders', 'opmerkingen')
+
+
+class RangeTour(dict):
+    # Tour database met alleen de records van een periode of van enkele dagen,
+    # voor backends die records per periode lezen en los tellen
+    # (record_count: sqlite, binary).
+    # travel_stats.record_count en travel_stats.whole houden er rekening mee,
+    # zoals bij travel_shard.PartialTour.
+
+    def __init__(self, storage, header, records):
+        dict.__init__(self, tour=header)
+        self.update(records)
+        self.storage = storage
+        # aantal records dat van disk gelezen is
+        self.loaded = len(self) - 1
+        # aantal records op disk, pas gelezen als het nodig is
+        self.stored = None
+        self.partial = True
+
+    @classmethod
+    def period(cls, storage, van=None, tot=None):
+        '''Leest de header en de records van een periode.
+
+        keyword arguments:
+        storage: backend met header, records en record_count
+        van: date: eerste datum, None = vanaf het begin
+        tot: date: laatste datum, None = tot het eind
+
+        returns RangeTour
+        '''
+        return cls(storage, storage.header(), storage.records(van, tot))
+
+    @classmethod
+    def days(cls, storage, days=()):
+        '''Leest de header, de records van days en die van nieuw_record
+        (toevoegen).
+
+        keyword arguments:
+        storage: backend met header, records en record_count
+        days: iterable: iso datums
+
+        returns RangeTour
+        '''
+        header = storage.header()
+        wanted = {datetime.date.fromisoformat(key) for key in days}
+        if header.get('nieuw_record'):
+            wanted.add(header['nieuw_record'])
+        records = []
+        for day in sorted(wanted):
+            records.extend(storage.records(day, day))
+        return cls(storage, header, records)
+
+    def record_count(self):
+        # records op disk plus de nieuwe in het geheugen
+        if not self.partial:
+            return len(self) - 1
+        if self.stored is None:
+            self.stored = self.storage.record_count()
+        return self.stored + len(self) - 1 - self.loaded
+
+    def complete(self):
+        '''Laadt de rest van de records, daarna is het een hele tour.
+
+        returns None
+        '''
+        if self.partial:
+            for key, rec in self.storage.records():
+                self.setdefault(key, rec)
+            self.partial = False
+
+
+class JsonStorage():
+    # Tour als json document: {'tour': header, '<iso datum>': record, ...}
+    suffix = '.json'
+
+    def __init__(self, name, traveldir):
+        self.name = name
+        self.traveldir = traveldir
+        self.path = os.path.join(traveldir, name + self.suffix)
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def files(self):
+        # bestanden waarin de tour staat
+        return (self.path, travel_journal.journal_file(self.traveldir, self.name))
+
+    def header(self):
+        '''Leest de tour header. Bij json betekent dat de hele tour.
+
+        returns dict
+        '''
+        return self.load()['tour']
+
+    def load(self):
+        '''Leest de snapshot en speelt het journal af.
+
+        returns dict: de tour database
+        raises FileNotFoundError als de tour niet bestaat.
+        '''
+        with travel_trace.span('json'), self.open_snapshot() as infile:
+            # alleen de header bevat datums, geen object_hook per record
+            db = json_serializer.decode_tour(json.load(infile))
+        # wijzigingen sinds de laatste snapshot staan in het journal
+        with travel_trace.span('journal'):
+            travel_trace.count('journal regels',
+                               travel_journal.replay(db, self.traveldir))
+        return db
+
+    def save(self, db, changed=None):
+        '''Schrijft de tour.
+
+        keyword arguments:
+        db: dict: de tour database
+        changed: list: keys van gewijzigde records. Deze worden aan het
+                 journal toegevoegd. None = hele tour schrijven.
+
+        returns None
+        '''
+        if changed is None or not self.exists() or \
+                travel_journal.append(db, changed, self.traveldir) >= \
+                travel_journal.MAX_JOURNAL:
+            # hele tour schrijven (compactie: journal in de snapshot vouwen)
+            travel_journal.start_generation(db)
+            self.write_snapshot(db)
+            travel_journal.clear(self.traveldir, self.name)
+
+    def open_snapshot(self):
+        # de snapshot als tekst bestand
+        return open(self.path, 'r', encoding='utf-8')
+
+    def write_snapshot(self, db):
+        with travel_io.AtomicFile(self.path) as outfile:
+            json.dump(db, outfile, default=json_serializer.to_iso)
+            travel_trace.count('bytes geschreven', outfile.tell())
+
+    def records(self, van=None, tot=None):
+        '''Records in datum volgorde, optioneel beperkt tot een periode.
+
+        keyword arguments:
+        van: date: eerste datum, None = vanaf het begin
+        tot: date: laatste datum, None = tot het eind
+
+        returns iterator van (iso datum, record)
+        '''
+        return self.select(self.load(), van, tot)
+
+    def totals(self, van=None, tot=None):
+        '''Totalen over een periode, zie travel_aggregate.Columns.summary.
+
+        returns dict
+        '''
+        db = self.load()
+        keys = [key for key, rec in self.select(db, van, tot)]
+        return travel_aggregate.Columns.from_db(db, keys).summary()
+
+    @staticmethod
+    def select(db, van=None, tot=None):
+        # records van een geladen tour binnen een periode, in datum volgorde
+        van = van.isoformat() if van else ''
+        tot = tot.isoformat() if tot else '9999-12-31'
+        for key in sorted(k for k in db if k != 'tour' and van <= k <= tot):
+            yield key, db[key]
+
+
+class GzipStorage(JsonStorage):
+    # Tour als gzip gecomprimeerd json document. Lezen en schrijven
+    # (de)comprimeert tijdens het streamen, zonder ongecomprimeerde kopie.
+    suffix = '.json.gz'
+    compression = gzip
+
+    def open_snapshot(self):
+        return self.compression.open(self.path, 'rt', encoding='utf-8')
+
+    def write_snapshot(self, db):
+        with travel_io.AtomicFile(self.path, 'wb') as raw:
+            with self.compression.open(raw, 'wt', encoding='utf-8') as outfile:
+                json.dump(db, outfile, default=json_serializer.to_iso)
+            travel_trace.count('bytes geschreven', raw.tell())
+
+
+class XzStorage(GzipStorage):
+    # Tour als xz (lzma) gecomprimeerd json document: kleiner dan gzip,
+    # maar langzamer te lezen en te schrijven.
+    suffix = '.json.xz'
+    compression = lzma
+
+
+class SqliteStorage():
+    # Tour als sqlite3 database.
+    # tabel tour: een rij met de header als json.
+    # tabel dag: een rij per dag met de datum ordinal als primary key.
+    suffix = '.sqlite'
+    schema = '''
+        CREATE TABLE IF NOT EXISTS tour (
+            id INTEGER PRIMARY KEY CHECK (id = 0),
+            header TEXT NOT NULL);
+        CREATE TABLE IF NOT EXISTS dag (
+            datum INTEGER PRIMARY KEY,
+            naar TEXT,
+            afstand INTEGER,
+            eten REAL,
+            hotel REAL,
+            anders REAL,
+            opmerkingen TEXT,
+            extra TEXT);
+        '''
+    upsert_dag = '''
+        INSERT INTO dag (datum, naar, afstand, eten, hotel, anders,
+                         opmerkingen, extra)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (datum) DO UPDATE SET
+            naar = excluded.naar, afstand = excluded.afstand,
+            eten = excluded.eten, hotel = excluded.hotel,
+            anders = excluded.anders, opmerkingen = excluded.opmerkingen,
+            extra = excluded.extra
+        '''
+    upsert_tour = '''
+        INSERT INTO tour (id, header) VALUES (0, ?)
+        ON CONFLICT (id) DO UPDATE SET header = excluded.header
+        '''
+
+    def __init__(self, name, traveldir):
+        self.name = name
+        self.traveldir = traveldir
+        self.path = os.path.join(traveldir, name + self.suffix)
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def files(self):
+        # bestanden waarin de tour staat
+        return (self.path,)
+
+    def connect(self, create=False):
+        '''Opent de database.
+
+        keyword arguments:
+        create: bool: maak de database aan als hij niet bestaat.
+
+        returns sqlite3.Connection
+        raises FileNotFoundError als de tour niet bestaat en create False is.
+        '''
+        # sqlite3 pas laden als een sqlite tour gebruikt wordt
+        import sqlite3
+        if not create and not self.exists():
+            raise FileNotFoundError(self.path)
+        con = sqlite3.connect(self.path)
+        con.executescript(self.schema)
+        return con
+
+    @staticmethod
+    def to_row(key, rec):
+        extra = {k: v for k, v in rec.items() if k not in RECORD_FIELDS}
+        return (datetime.date.fromisoformat(key).toordinal(),
+                rec.get('naar'), rec.get('afstand'), rec.get('eten'),
+                rec.get('hotel'), rec.get('anders'), rec.get('opmerkingen'),
+                json.dumps(extra, default=json_serializer.to_json) if extra else None)
+
+    @staticmethod
+    def from_row(row):
+        # lege kolommen horen niet in het record, net als bij json
+        rec = {field: value for field, value in zip(RECORD_FIELDS, row[1:7])
+               if value is not None}
+        if row[7]:
+            rec.update(json.loads(row[7], object_hook=json_serializer.from_json))
+        return datetime.date.fromordinal(row[0]).isoformat(), rec
+
+    def header(self):
+        '''Leest alleen de tour header.
+
+        returns dict
+        '''
+        con = self.connect()
+        try:
+            (header,) = con.execute('SELECT header FROM tour').fetchone()
+        finally:
+            con.close()
+        return json_serializer.decode_header(json.loads(header))
+
+    def load(self):
+        '''Leest de hele tour.
+
+        returns dict: de tour database
+        raises FileNotFoundError als de tour niet bestaat.
+        '''
+        db = {'tour': self.header()}
+        db.update(self.records())
+        return db
+
+    def load_days(self, days=()):
+        '''Leest de header en alleen de records van days en nieuw_record.
+
+        returns RangeTour
+        '''
+        return RangeTour.days(self, days)
+
+    def load_range(self, van=None, tot=None):
+        '''Leest de header en alleen de records van een periode.
+
+        returns RangeTour
+        '''
+        return RangeTour.period(self, van, tot)
+
+    def save(self, db, changed=None):
+        '''Schrijft de tour in een transactie.
+
+        keyword arguments:
+        db: dict: de tour database
+        changed: list: keys van gewijzigde records, elk een UPSERT van een rij.
+                 None = hele tour schrijven.
+
+        returns None
+        '''
+        con = self.connect(create=True)
+        try:
+            with con:
+                if changed is None:
+                    # een gedeeltelijk geladen tour eerst aanvullen
+                    travel_stats.whole(db)
+                    con.execute('DELETE FROM dag')
+                    changed = (key for key in db if key != 'tour')
+                con.executemany(self.upsert_dag,
+                                (self.to_row(key, db[key]) for key in changed))
+                con.execute(self.upsert_tour,
+                            (json.dumps(db['tour'], default=json_serializer.to_iso),))
+        finally:
+            con.close()
+
+    @staticmethod
+    def where(van, tot):
+        # where clause en parameters voor een periode
+        clauses, params = [], []
+        if van:
+            clauses.append('datum >= ?')
+            params.append(van.toordinal())
+        if tot:
+            clauses.append('datum <= ?')
+            params.append(tot.toordinal())
+        return (' WHERE ' + ' AND '.join(clauses) if clauses else ''), params
+
+    def records(self, van=None, tot=None):
+        '''Records in datum volgorde, optioneel beperkt tot een periode.
+
+        keyword arguments:
+        van: date: eerste datum, None = vanaf het begin
+        tot: date: laatste datum, None = tot het eind
+
+        returns iterator van (iso datum, record)
+        '''
+        where, params = self.where(van, tot)
+        con = self.connect()
+        try:
+            for row in con.execute('SELECT * FROM dag' + where +
+                                   ' ORDER BY datum', params):
+                yield self.from_row(row)
+        finally:
+            con.close()
+
+    def record_count(self):
+        '''Aantal records, zonder de totalen.
+
+        returns int
+        '''
+        con = self.connect()
+        try:
+            (count,) = con.execute('SELECT COUNT(*) FROM dag').fetchone()
+        finally:
+            con.close()
+        return count
+
+    def totals(self, van=None, tot=None):
+        '''Totalen over een periode, berekend in sql.
+        Zelfde vorm als travel_aggregate.Columns.summary.
+
+        returns dict
+        '''
+        where, params = self.where(van, tot)
+        select = ['COUNT(*)', 'COUNT(NULLIF(afstand, 0))', 'MIN(datum)', 'MAX(datum)']
+        for field, typecode in travel_aggregate.COLUMNS:
+            select += ['TOTAL({0})'.format(field),
+                       'MIN(IFNULL({0}, 0))'.format(field),
+                       'MAX(IFNULL({0}, 0))'.format(field)]
+        con = self.connect()
+        try:
+            row = con.execute('SELECT ' + ', '.join(select) + ' FROM dag' + where,
+                              params).fetchone()
+        finally:
+            con.close()
+        records, fietsdagen = row[0], row[1]
+        result = {'records': records, 'fietsdagen': fietsdagen,
+                  'eerste': datetime.date.fromordinal(row[2]) if records else None,
+                  'laatste': datetime.date.fromordinal(row[3]) if records else None}
+        for i, (field, typecode) in enumerate(travel_aggregate.COLUMNS):
+            total, low, high = row[4 + 3 * i:7 + 3 * i]
+            if typecode == 'l':
+                total = int(total)
+            result[field] = {'totaal': total,
+                             'min': low or 0,
+                             'max': high or 0,
+                             'per_dag': total / records if records else 0}
+        result['afstand']['per_fietsdag'] = \
+            result['afstand']['totaal'] / fietsdagen if fietsdagen else 0
+        return result
+
+
+# backends op naam, in de volgorde waarin naar een bestaande tour gezocht wordt
+BACKENDS = {'json': JsonStorage, 'gzip': GzipStorage, 'xz': XzStorage,
+            'sqlite': SqliteStorage, 'binary': BinaryStorage,
+            'sharded': ShardedStorage}
+# backends voor archive
+ARCHIVE_BACKENDS = ('gzip', 'xz')
+
+
+def get_storage(name, traveldir, default='json'):
+    '''Geeft de backend van een tour.
+
+    keyword arguments:
+    name: string: naam vd tour
+    traveldir: string: datadir
+    default: string: backend voor een tour die nog niet bestaat.
+
+    returns backend object
+    '''
+    for backend in BACKENDS.values():
+        storage = backend(name, traveldir)
+        if storage.exists():
+            return storage
+    return BACKENDS[default](name, traveldir)
+
+
+def tour_names(traveldir):
+    '''Namen van alle tours in de datadir, van alle backends.
+
+    keyword arguments:
+    traveldir: string: datadir
+
+    returns list: gesorteerde namen
+    '''
+    names = set()
+    for backend in BACKENDS.values():
+        names.update(os.path.relpath(file, traveldir)[:-len(backend.suffix)] for file in
+                     glob.glob(os.path.join(glob.escape(traveldir), '*' + backend.suffix)))
+    return sorted(names)
+
+
+def convert(name, traveldir, target):
+    '''Zet een tour om naar een andere backend.
+    Het oude bestand blijft bewaard als <bestand>.old, een tour in shards
+    als <naam>.sharded.old/.
+
+    keyword arguments:
+    name: string: naam vd tour
+    traveldir: string: datadir
+    target: string: naam van de nieuwe backend (zie BACKENDS)
+
+    returns backend object: de nieuwe opslag
+    '''
+    source = get_storage(name, traveldir)
+    if type(source) is BACKENDS[target]:
+        return source
+    db = source.load()
+    storage = BACKENDS[target](name, traveldir)
+    storage.save(db)
+    if isinstance(source, ShardedStorage):
+        # <naam>.sharded.old met tour.json.old, zodat tour_names hem niet
+        # als tour ziet
+        backup = source.dir + '.sharded.old'
+        if os.path.isdir(backup):
+            shutil.rmtree(backup)
+        os.replace(source.path, source.path + '.old')
+        os.replace(source.dir, backup)
+    else:
+        os.replace(source.path, source.path + '.old')
+    if isinstance(source, JsonStorage):
+        travel_journal.clear(traveldir, name)
+    return storage
+
+
+def files_size(storage):
+    # bytes van de bestanden van een tour op disk
+    files = storage.all_files() if hasattr(storage, 'all_files') else storage.files()
+    return sum(os.path.getsize(fn) for fn in files if os.path.exists(fn))
+
+
+def archive(traveldir, target='gzip'):
+    '''Comprimeert de tours die klaar zijn (nieuw_record is None).
+    Anders dan bij convert wordt het oude bestand verwijderd.
+
+    keyword arguments:
+    traveldir: string: datadir
+    target: string: gzip of xz (zie ARCHIVE_BACKENDS)
+
+    returns list van (naam, bytes voor, bytes na) van de gearchiveerde tours
+    '''
+    import travel_lock
+    import travel_catalog
+    result = []
+    for name, header in travel_catalog.refresh(traveldir).items():
+        if header.get('nieuw_record') is not None:
+            continue
+        with travel_lock.TourLock(traveldir, name):
+            source = get_storage(name, traveldir)
+            if isinstance(source, GzipStorage):
+                # al gecomprimeerd (gzip of xz)
+                continue
+            before = files_size(source)
+            db = source.load()
+            storage = BACKENDS[target](name, traveldir)
+            # schrijft de hele tour, het journal zit er dan in
+            storage.save(db)
+            if isinstance(source, ShardedStorage):
+                shutil.rmtree(source.dir)
+            elif source.path != storage.path:
+                os.remove(source.path)
+            travel_catalog.update(db, traveldir)
+        result.append((name, before, files_size(storage)))
+    return result
@@ -0,0 +1,480 @@
+#!/bin/python
+# travel_sync.py
+# Twee kopieen van de datadir (bijv. telefoon en laptop) gelijk maken.
+# Per tour staat in <naam>.digest een hash per dag en per maand een hash
+# over de dagen van die maand (een Merkle boom van twee niveaus), plus de
+# mtime en grootte van de tour bestanden (travel_catalog.signature). Klopt
+# die niet meer, dan is de tour buiten travel om veranderd en wordt de
+# digest opnieuw opgebouwd. Opslaan schrijft de hashes van de gewijzigde
+# dagen alleen achter <naam>.digest.log, zoals travel_search.
+#
+# travel --sync ANDERE_DIR vergelijkt eerst de hash van de hele tour, dan
+# die van de maanden en alleen in een maand die verschilt de dagen. Alleen
+# de dagen die verschillen worden overgezet. In <naam>.synced (in beide
+# dirs) staan de hashes van de dagen zoals ze na de vorige sync aan beide
+# kanten waren: is een dag maar aan een kant veranderd, dan gaat die kant
+# naar de andere, aan beide kanten veranderd is een conflict en blijft
+# staan. Dagen worden nooit verwijderd, een tour die maar aan een kant
+# bestaat wordt gekopieerd.
+
+import os
+import json
+import hashlib
+import json_serializer
+import travel_io
+import travel_lock
+import travel_stats
+import travel_storage
+import travel_catalog
+
+# grootte in bytes waarboven de log in de digest wordt gevouwen
+MAX_LOG = 256 * 1024
+# genoeg bytes van het eind van de log voor de laatste regel
+TAIL = 4096
+
+
+def digest_file(traveldir, name):
+    ''' Pad van de digest van een tour.
+
+    keyword arguments:
+    traveldir: string: datadir
+    name: string: naam vd tour
+
+    returns string
+    '''
+    return os.path.join(traveldir, name + '.digest')
+
+
+def log_file(traveldir, name):
+    return os.path.join(traveldir, name + '.digest.log')
+
+
+def synced_file(traveldir, name):
+    return os.path.join(traveldir, name + '.synced')
+
+
+def record_hash(record):
+    ''' Hash van de inhoud van een dag. De versie (travel_lock) telt niet
+    mee, die is aan beide kanten anders.
+
+    keyword arguments:
+    record: dict: het record
+
+    returns string: 16 hex tekens
+    '''
+    content = {field: value for field, value in record.items() if field != 'versie'}
+    data = json.dumps(content, sort_keys=True, default=json_serializer.to_iso)
+    return hashlib.blake2b(data.encode('utf-8'), digest_size=8).hexdigest()
+
+
+def combine(hashes):
+    # hash over (key, hash) paren, in key volgorde
+    h = hashlib.blake2b(digest_size=8)
+    for key in sorted(hashes):
+        h.update((key + hashes[key]).encode('ascii'))
+    return h.hexdigest()
+
+
+class Digest():
+    # Hashes van de dagen van een tour, per maand.
+
+    def __init__(self, months=None, signature=None):
+        # 'YYYY-MM': {'hash': maand hash, 'days': {iso datum: hash}}
+        self.months = months or {}
+        self.signature = signature
+
+    def __len__(self):
+        return sum(len(month['days']) for month in self.months.values())
+
+    @classmethod
+    def from_db(cls, db):
+        '''Digest van een hele tour.
+
+        returns Digest
+        '''
+        return cls.from_hashes({key: record_hash(db[key]) for key in db if key != 'tour'})
+
+    @classmethod
+    def from_hashes(cls, hashes):
+        '''Digest van de hashes van de dagen.
+
+        keyword arguments:
+        hashes: dict: iso datum: hash
+
+        returns Digest
+        '''
+        digest = cls()
+        for key, value in hashes.items():
+            digest.months.setdefault(key[:7], {'hash': '', 'days': {}})['days'][key] = value
+        for month in digest.months.values():
+            month['hash'] = combine(month['days'])
+        return digest
+
+    @classmethod
+    def read(cls, traveldir, name):
+        '''Leest de digest van een tour en speelt de log af.
+
+        returns Digest, of None als er geen (leesbare) digest is.
+        '''
+        try:
+            with open(digest_file(traveldir, name), 'r', encoding='utf-8') as infile:
+                signature = json.loads(infile.readline())
+                digest = cls(json.loads(infile.readline()), signature)
+        except (FileNotFoundError, ValueError):
+            return None
+        touched = set()
+        try:
+            with open(log_file(traveldir, name), 'r', encoding='utf-8') as infile:
+                for line in infile:
+                    key, value = json.loads(line)
+                    if key:
+                        digest.months.setdefault(key[:7], {'hash': '', 'days': {}}) \
+                                ['days'][key] = value
+                        touched.add(key[:7])
+                    else:
+                        digest.signature = value
+        except FileNotFoundError:
+            pass
+        except ValueError:
+            # afgebroken regel: opnieuw opbouwen
+            return None
+        for month in touched:
+            digest.months[month]['hash'] = combine(digest.months[month]['days'])
+        return digest
+
+    def save(self, traveldir, name, signature):
+        # eerste regel de signature, zodat die los te lezen is (last_signature)
+        self.signature = signature
+        with travel_io.AtomicFile(digest_file(traveldir, name)) as outfile:
+            outfile.write(json.dumps(signature) + '\n' + json.dumps(self.months))
+        # de log zit nu in de digest
+        try:
+            os.remove(log_file(traveldir, name))
+        except FileNotFoundError:
+            pass
+
+    def set(self, key, record):
+        '''Zet de hash van een dag en werkt die van zijn maand bij.
+
+        keyword arguments:
+        key: string: iso datum
+        record: dict: het record
+
+        returns None
+        '''
+        self.set_hash(key, record_hash(record))
+
+    def set_hash(self, key, value):
+        month = self.months.setdefault(key[:7], {'hash': '', 'days': {}})
+        month['days'][key] = value
+        month['hash'] = combine(month['days'])
+
+    def days(self):
+        # alle (iso datum, hash) paren
+        for month in self.months.values():
+            yield from month['days'].items()
+
+    def day(self, key):
+        # hash van een dag, None als hij er niet is
+        return self.months.get(key[:7], {'days': {}})['days'].get(key)
+
+    def root(self):
+        '''Hash van de hele tour.
+
+        returns string
+        '''
+        return combine({month: item['hash'] for month, item in self.months.items()})
+
+    def diff(self, other):
+        '''Dagen die anders zijn dan in een andere digest. Alleen de dagen van
+        maanden met een andere hash worden vergeleken.
+
+        returns list van iso datums, gesorteerd
+        '''
+        if self.root() == other.root():
+            return []
+        keys = set()
+        empty = {'hash': None, 'days': {}}
+        for month in set(self.months) | set(other.months):
+            mine = self.months.get(month, empty)
+            theirs = other.months.get(month, empty)
+            if mine['hash'] != theirs['hash']:
+                for key in set(mine['days']) | set(theirs['days']):
+                    if mine['days'].get(key) != theirs['days'].get(key):
+                        keys.add(key)
+        return sorted(keys)
+
+
+def last_signature(traveldir, name):
+    ''' De signature waar de digest bij hoort, zonder hem helemaal te lezen:
+    de laatste regel van de log, anders de eerste regel van de digest.
+
+    returns list, of None als er geen digest is.
+    '''
+    try:
+        with open(log_file(traveldir, name), 'rb') as infile:
+            infile.seek(max(os.fstat(infile.fileno()).st_size - TAIL, 0))
+            key, value = json.loads(infile.read().splitlines()[-1])
+            return None if key else value
+    except FileNotFoundError:
+        pass
+    except (ValueError, IndexError):
+        return None
+    try:
+        with open(digest_file(traveldir, name), 'r', encoding='utf-8') as infile:
+            return json.loads(infile.readline())
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def update_digest(db, traveldir, changed=None, signature=None):
+    '''Werkt de digest bij na het opslaan van een tour. De hashes van de
+    gewijzigde dagen en de nieuwe signature gaan achter <naam>.digest.log,
+    zodat opslaan niet duurder wordt naarmate de tour groeit.
+
+    keyword arguments:
+    db: dict: de tour database
+    traveldir: string: datadir
+    changed: list: keys van gewijzigde records. None = opnieuw opbouwen.
+    signature: list: travel_catalog.signature van de tour voor het opslaan.
+               De digest hoort daarbij, anders wordt hij opnieuw opgebouwd.
+
+    returns None
+    '''
+    name = db['tour']['naam']
+    storage = travel_storage.get_storage(name, traveldir)
+    after = travel_catalog.signature(storage)
+    if changed is not None and last_signature(traveldir, name) == signature:
+        lines = [json.dumps([key, record_hash(db[key])]) for key in changed]
+        lines.append(json.dumps(['', after]))
+        with open(log_file(traveldir, name), 'a', encoding='utf-8') as outfile:
+            outfile.write(''.join(line + '\n' for line in lines))
+            if outfile.tell() < MAX_LOG:
+                return
+        # log vouwen
+        digest = Digest.read(traveldir, name)
+        if digest is not None:
+            digest.save(traveldir, name, after)
+            return
+    Digest.from_db(travel_stats.whole(db)).save(traveldir, name, after)
+
+
+def open_digest(name, traveldir):
+    '''Digest van een tour, opnieuw opgebouwd als de tour intussen buiten
+    travel om veranderd is.
+
+    keyword arguments:
+    name: string: naam vd tour
+    traveldir: string: datadir
+
+    returns Digest
+    '''
+    storage = travel_storage.get_storage(name, traveldir)
+    with travel_lock.TourLock(traveldir, name, True):
+        signature = travel_catalog.signature(storage)
+        digest = Digest.read(traveldir, name)
+        if digest is None or digest.signature != signature:
+            digest = Digest.from_db(storage.load())
+            digest.save(traveldir, name, signature)
+    return digest
+
+
+def read_synced(traveldir, name, days=True):
+    ''' Leest de stand van de vorige sync. De eerste regel is de hash van de
+    hele tour, zodat die los te lezen is.
+
+    keyword arguments:
+    traveldir: string: datadir
+    name: string: naam vd tour
+    days: bool: ook de hashes van de dagen lezen
+
+    returns tuple: (root hash of None, Digest)
+    '''
+    try:
+        with open(synced_file(traveldir, name), 'r', encoding='utf-8') as infile:
+            root = json.loads(infile.readline())
+            return root, Digest(json.loads(infile.readline()) if days else {})
+    except (FileNotFoundError, ValueError):
+        return None, Digest()
+
+
+def write_synced(traveldir, name, base):
+    with travel_io.AtomicFile(synced_file(traveldir, name)) as outfile:
+        outfile.write(json.dumps(base.root()) + '\n' + json.dumps(base.months))
+
+
+def load_days(name, traveldir, keys):
+    # de tour met in ieder geval de dagen keys, zoals travel.open_tour
+    storage = travel_storage.get_storage(name, traveldir)
+    with travel_lock.TourLock(traveldir, name, True):
+        if hasattr(storage, 'load_days'):
+            db = storage.load_days(keys)
+        else:
+            db = storage.load()
+        travel_lock.remember(storage, db)
+    return db
+
+
+def transfer(source, db, traveldir, keys, write):
+    ''' Zet dagen van de ene tour in de andere en slaat die op.
+
+    keyword arguments:
+    source: dict: tour waar de dagen vandaan komen
+    db: dict: tour die ze krijgt
+    traveldir: string: datadir van db
+    keys: list: iso datums
+    write: functie(db, traveldir, changed, bases=...): travel.write_tour
+
+    returns list: keys met een conflict (intussen door een ander gewijzigd)
+    '''
+    bases = {}
+    for key in keys:
+        old = db.get(key)
+        bases[key] = travel_lock.version(old)
+        new = {field: value for field, value in source[key].items() if field != 'versie'}
+        db[key] = new
+        travel_stats.update_totals(db, old, new)
+    db['tour']['nieuw_record'] = travel_lock.later(db['tour'].get('nieuw_record'),
+                                                   source['tour'].get('nieuw_record'))
+    return write(db, traveldir, keys, bases=bases)
+
+
+def sync_tour(name, here, there, write):
+    ''' Maakt een tour in twee datadirs gelijk.
+
+    keyword arguments:
+    name: string: naam vd tour
+    here: string: eigen datadir
+    there: string: andere datadir
+    write: functie: travel.write_tour
+
+    returns list van (iso datum, actie): actie is '->' (naar there),
+            '<-' (naar here) of 'conflict'
+    '''
+    mine = open_digest(name, here)
+    theirs = open_digest(name, there)
+    keys = mine.diff(theirs)
+    if not keys and read_synced(here, name, False)[0] == mine.root() and \
+            read_synced(there, name, False)[0] == mine.root():
+        return []
+    base = read_synced(here, name)[1]
+    if not base.months:
+        base = read_synced(there, name)[1]
+    out, back, conflicts = [], [], []
+    for key in keys:
+        a, b, synced = mine.day(key), theirs.day(key), base.day(key)
+        if b is None or (a is not None and synced == b):
+            out.append(key)
+        elif a is None or synced == a:
+            back.append(key)
+        else:
+            conflicts.append(key)
+    if out or back:
+        local = load_days(name, here, out + back)
+        remote = load_days(name, there, out + back)
+        if out:
+            conflicts += transfer(local, remote, there, out, write)
+        if back:
+            conflicts += transfer(remote, local, here, back, write)
+    # de basis volgt de dagen die nu aan beide kanten gelijk zijn; bij een
+    # conflict blijft de hash van de vorige sync staan
+    empty = {'hash': None, 'days': {}}
+    for month, item in mine.months.items():
+        other = theirs.months.get(month, empty)
+        if other['hash'] == item['hash']:
+            if base.months.get(month, empty)['hash'] != item['hash']:
+                base.months[month] = {'hash': item['hash'], 'days': dict(item['days'])}
+        else:
+            for key, value in item['days'].items():
+                if other['days'].get(key) == value:
+                    base.set_hash(key, value)
+    for key in out:
+        if key not in conflicts:
+            base.set_hash(key, mine.day(key))
+    for key in back:
+        if key not in conflicts:
+            base.set_hash(key, theirs.day(key))
+    write_synced(here, name, base)
+    write_synced(there, name, base)
+    actions = [(key, '->') for key in out if key not in conflicts] + \
+            [(key, '<-') for key in back if key not in conflicts] + \
+            [(key, 'conflict') for key in set(conflicts)]
+    return sorted(actions)
+
+
+def copy_tour(name, source, target):
+    ''' Kopieert een tour die alleen in source bestaat, met dezelfde backend.
+    De index en sommen worden bij gebruik opgebouwd. De kopie is de basis
+    van de volgende sync (<naam>.synced in beide dirs).
+
+    keyword arguments:
+    name: string: naam vd tour
+    source: string: datadir met de tour
+    target: string: datadir zonder de tour
+
+    returns None
+    '''
+    storage = travel_storage.get_storage(name, source)
+    with travel_lock.TourLock(source, name, True):
+        db = storage.load()
+    with travel_lock.TourLock(target, name):
+        copy = type(storage)(name, target)
+        if copy.exists():
+            return
+        copy.save(db)
+    # beide kanten zijn nu gelijk: een dag die daarna aan een kant
+    # verandert gaat bij de volgende sync gewoon over
+    base = Digest.from_db(db)
+    write_synced(source, name, base)
+    write_synced(target, name, base)
+
+
+def sync(here, there, write):
+    ''' Maakt alle tours in twee datadirs gelijk.
+
+    keyword arguments:
+    here: string: eigen datadir
+    there: string: andere datadir
+    write: functie(db, traveldir, changed, bases=...): travel.write_tour
+
+    returns list van (naam, iso datum of None, actie): actie is '->' of '<-'
+            (richting), 'conflict', of bij een hele tour 'nieuw ->' of
+            'nieuw <-'
+    '''
+    mine = set(travel_storage.tour_names(here))
+    theirs = set(travel_storage.tour_names(there))
+    results = []
+    for name in sorted(mine | theirs):
+        if name not in theirs:
+            copy_tour(name, here, there)
+            results.append((name, None, 'nieuw ->'))
+        elif name not in mine:
+            copy_tour(name, there, here)
+            results.append((name, None, 'nieuw <-'))
+        else:
+            results.extend((name, key, action) for key, action in
+                           sync_tour(name, here, there, write))
+    # kopieen staan nog niet in de catalogus
+    travel_catalog.refresh(here)
+    travel_catalog.refresh(there)
+    return results
+
+
+def print_sync(results):
+    ''' Print wat er bij sync is overgezet.
+
+    keyword arguments:
+    results: list: uitkomst van sync
+
+    returns None
+    '''
+    for name, key, action in results:
+        if action == 'conflict':
+            print(':: {} {}: aan beide kanten gewijzigd, niet overgezet.'.format(
+                name, key))
+        elif key is None:
+            print(':: {} {}'.format(action, name))
+        else:
+            print(':: {} {} {}'.format(action, name, key))
+    conflicts = sum(1 for name, key, action in results if action == 'conflict')
+    print(':: {} overgezet, {} conflicten.'.format(len(results) - conflicts, conflicts))
@@ -0,0 +1,172 @@
+#!/bin/python
+# travel_trace.py
+# Meting van de fases van een travel run.
+# Met --profile of de omgevingsvariabele TRAVEL_TRACE worden benoemde fases
+# (config, laden, totalen, weergave, opslaan, ...) getimed en tellers
+# bijgehouden (records gelezen, bytes geschreven). Aan het eind van de run
+# komt een tabel op stderr, en optioneel een cProfile dump van de hele run.
+#
+# Standaard staat alles uit: span() geeft dan een lege context manager terug
+# en count() doet niets, zodat de meting zelf niets kost.
+#
+# TRAVEL_TRACE=1       alleen de tabel
+# TRAVEL_TRACE=bestand tabel en cProfile dump naar bestand
+
+import os
+import sys
+import time
+from _thread import get_ident
+
+_enabled = False
+_start = 0.0
+# fases die nu lopen per thread, het pad van een fase is 'ouder/kind'
+_stacks = {}
+# pad: [aantal, seconden], in de volgorde waarin de fases begonnen
+_spans = {}
+_counters = {}
+# (cProfile.Profile, bestand) of None
+_profile = None
+
+
+class Span():
+    # Een getimede fase, gebruik: with travel_trace.span('laden'): ...
+    __slots__ = ('stack', 'path', 'start')
+
+    def __init__(self, name):
+        self.stack = _stacks.setdefault(get_ident(), [])
+        self.stack.append(name)
+        self.path = '/'.join(self.stack)
+        _spans.setdefault(self.path, [0, 0.0])
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        entry = _spans[self.path]
+        entry[0] += 1
+        entry[1] += time.perf_counter() - self.start
+        self.stack.pop()
+
+
+class NoSpan():
+    # Fase als meten uit staat.
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+_NOSPAN = NoSpan()
+
+
+def span(name):
+    ''' Fase om te timen, als context manager.
+
+    keyword arguments:
+    name: string: naam vd fase
+
+    returns Span, of een lege context manager als meten uit staat.
+    '''
+    if _enabled:
+        return Span(name)
+    return _NOSPAN
+
+
+def count(name, n=1):
+    ''' Hoogt een teller op.
+
+    keyword arguments:
+    name: string: naam vd teller
+    n: int: ophoging
+
+    returns None
+    '''
+    if _enabled:
+        _counters[name] = _counters.get(name, 0) + n
+
+
+def enabled():
+    return _enabled
+
+
+def enable(profile=None):
+    ''' Zet het meten aan. Het rapport komt bij het afsluiten op stderr.
+
+    keyword arguments:
+    profile: string: bestand voor een cProfile dump, None = geen dump.
+
+    returns None
+    '''
+    global _enabled, _start, _profile
+    if _enabled:
+        return
+    import atexit
+    _enabled = True
+    _start = time.perf_counter()
+    if profile:
+        import cProfile
+        _profile = (cProfile.Profile(), profile)
+        _profile[0].enable()
+    atexit.register(report)
+
+
+def from_env():
+    ''' Zet het meten aan als TRAVEL_TRACE gezet is (niet leeg of 0).
+
+    returns bool: True als meten aan staat.
+    '''
+    value = os.environ.get('TRAVEL_TRACE', '')
+    if value not in ('', '0'):
+        enable(None if value == '1' else value)
+    return _enabled
+
+
+def reset():
+    ''' Zet het meten uit en wist alle metingen.
+
+    returns None
+    '''
+    global _enabled, _profile
+    if _profile:
+        _profile[0].disable()
+    _enabled = False
+    _profile = None
+    _stacks.clear()
+    _spans.clear()
+    _counters.clear()
+
+
+def report(out=None):
+    ''' Print de fases en tellers en schrijft de cProfile dump.
+    Daarna staat meten uit, zodat het rapport maar een keer komt.
+
+    keyword arguments:
+    out: tekst bestand, None = stderr
+
+    returns None
+    '''
+    if not _enabled:
+        return
+    total = time.perf_counter() - _start
+    out = out or sys.stderr
+    if _profile:
+        _profile[0].disable()
+        _profile[0].dump_stats(_profile[1])
+    print(':: travel profiel', file=out)
+    print('{:30} {:>7} {:>10} {:>6}'.format('fase', 'aantal', 'ms', '%'), file=out)
+    for path, (calls, seconds) in _spans.items():
+        depth = path.count('/')
+        name = '  ' * depth + path.rsplit('/', 1)[-1]
+        print('{:30} {:7} {:10.2f} {:6.1f}'.format(name, calls, seconds * 1000,
+              100 * seconds / total if total else 0), file=out)
+    print('{:30} {:>7} {:10.2f} {:6.1f}'.format('totaal', '', total * 1000, 100),
+          file=out)
+    for name, value in _counters.items():
+        print('{:30} {:7}'.format(name, value), file=out)
+    if _profile:
+        print(':: cProfile dump in {}'.format(_profile[1]), file=out)
+    reset()
@@ -0,0 +1,302 @@
+#!/bin/python
+# travel_window.py
+# Cumulatieve sommen per dag, voor statistieken over een periode.
+# In <naam>.sums staat na de eerste datum ordinal een rij per dag met de
+# sommen van alle dagen ervoor (records, fietsdagen, afstand, eten, hotel,
+# anders). De som over een periode is het verschil van twee rijen, dus
+# elke periode (laatste 7 dagen, een week, een maand) kost twee leesacties,
+# hoe groot de tour ook is.
+#
+# Indeling (little endian): q eerste datum ordinal, daarna dagen + 1 rijen
+# van 6 doubles. Rij i is de som over de dagen eerste .. eerste + i - 1.
+#
+# Bij toevoegen en bewerken worden alleen de rijen vanaf de gewijzigde dag
+# bijgewerkt; een nieuwe laatste dag wordt achter het bestand geschreven.
+# De laatste rij moet gelijk zijn aan de totalen in de header, anders wordt
+# het bestand opnieuw opgebouwd.
+
+import os
+import struct
+import datetime
+from array import array
+import travel_io
+import travel_stats
+
+FIELDS = ('records', 'fietsdagen', 'afstand', 'eten', 'hotel', 'anders')
+HEAD = struct.Struct('<q')
+ROW = struct.Struct('<6d')
+
+
+def sums_file(traveldir, name):
+    ''' Pad van de cumulatieve sommen van een tour.
+
+    keyword arguments:
+    traveldir: string: datadir
+    name: string: naam vd tour
+
+    returns string
+    '''
+    return os.path.join(traveldir, name + '.sums')
+
+
+def day_values(rec):
+    # de waarden van een dag in de volgorde van FIELDS
+    afstand = rec.get('afstand', 0)
+    return (1, bool(afstand), afstand, rec.get('eten', 0), rec.get('hotel', 0),
+            rec.get('anders', 0))
+
+
+def build(db):
+    ''' Cumulatieve sommen van een tour.
+
+    keyword arguments:
+    db: dict: de tour database
+
+    returns tuple: (eerste datum ordinal, array rijen achter elkaar)
+    '''
+    fromiso = datetime.date.fromisoformat
+    travel_stats.whole(db)
+    days = {fromiso(key).toordinal(): db[key] for key in db if key != 'tour'}
+    if not days:
+        return 0, array('d', [0.0] * len(FIELDS))
+    base = min(days)
+    rows = array('d', [0.0] * len(FIELDS))
+    row = [0.0] * len(FIELDS)
+    for ordinal in range(base, max(days) + 1):
+        if ordinal in days:
+            row = [a + b for a, b in zip(row, day_values(days[ordinal]))]
+        rows.extend(row)
+    return base, rows
+
+
+def write(traveldir, name, base, rows):
+    with travel_io.AtomicFile(sums_file(traveldir, name), 'wb') as outfile:
+        outfile.write(HEAD.pack(base))
+        rows.tofile(outfile)
+
+
+def matches(row, totals):
+    # klopt de laatste rij met de totalen uit de header?
+    return all(abs(row[i] - totals[field]) < 0.01 for i, field in enumerate(FIELDS))
+
+
+class PrefixSums():
+    # Een geopend sommen bestand. Rijen worden pas gelezen als ze nodig zijn.
+
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        self.base, = HEAD.unpack(self.file.read(HEAD.size))
+        size = os.fstat(self.file.fileno()).st_size
+        self.slots = (size - HEAD.size) // ROW.size - 1
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @classmethod
+    def open(cls, db, traveldir):
+        '''Opent de sommen van een tour en bouwt ze opnieuw op als ze
+        ontbreken of niet meer kloppen met de totalen.
+
+        keyword arguments:
+        db: dict: de tour database
+        traveldir: string: datadir
+
+        returns PrefixSums
+        '''
+        name = db['tour']['naam']
+        totals = travel_stats.get_totals(db)
+        try:
+            sums = cls(sums_file(traveldir, name))
+            if sums.slots >= 0 and matches(sums.row(sums.slots), totals):
+                return sums
+            sums.close()
+        except (FileNotFoundError, struct.error):
+            pass
+        write(traveldir, name, *build(db))
+        return cls(sums_file(traveldir, name))
+
+    def row(self, i):
+        '''Sommen over de eerste i dagen.
+
+        returns tuple in de volgorde van FIELDS
+        '''
+        i = min(max(i, 0), self.slots)
+        self.file.seek(HEAD.size + i * ROW.size)
+        return ROW.unpack(self.file.read(ROW.size))
+
+    def first(self):
+        return datetime.date.fromordinal(self.base) if self.slots else None
+
+    def last(self):
+        return datetime.date.fromordinal(self.base + self.slots - 1) if self.slots \
+                else None
+
+    def window(self, van, tot):
+        '''Sommen over een periode.
+
+        keyword arguments:
+        van: date: eerste dag
+        tot: date: laatste dag
+
+        returns dict: FIELDS: som
+        '''
+        start = self.row(van.toordinal() - self.base)
+        end = self.row(tot.toordinal() - self.base + 1)
+        result = {field: b - a for field, a, b in zip(FIELDS, start, end)}
+        for field in ('records', 'fietsdagen', 'afstand'):
+            result[field] = int(round(result[field]))
+        for field in ('eten', 'hotel', 'anders'):
+            result[field] = round(result[field], 2)
+        return result
+
+    def last_days(self, n):
+        '''Sommen over de laatste n dagen tot en met de laatste dag.
+
+        returns tuple: (van, tot, dict FIELDS: som)
+        '''
+        tot = self.last()
+        if tot is None:
+            return None, None, dict.fromkeys(FIELDS, 0)
+        van = tot - datetime.timedelta(days=n - 1)
+        return van, tot, self.window(van, tot)
+
+    def periods(self, group):
+        '''Sommen per week, maand of jaar.
+
+        keyword arguments:
+        group: string: 'week', 'month' of 'year'
+
+        returns list van (label, dict FIELDS: som)
+        '''
+        result = []
+        day = self.first()
+        last = self.last()
+        while day is not None and day <= last:
+            if group == 'week':
+                year, week, weekday = day.isocalendar()
+                label = '{:04}-W{:02}'.format(year, week)
+                end = day + datetime.timedelta(days=7 - weekday)
+            elif group == 'month':
+                label = '{:04}-{:02}'.format(day.year, day.month)
+                end = (day.replace(day=28) + datetime.timedelta(days=4))
+                end -= datetime.timedelta(days=end.day)
+            else:
+                label = '{:04}'.format(day.year)
+                end = day.replace(month=12, day=31)
+            result.append((label, self.window(day, end)))
+            day = end + datetime.timedelta(days=1)
+        return result
+
+
+def update_sums(db, traveldir, changed=None):
+    '''Werkt de sommen bij na het opslaan van een tour.
+
+    keyword arguments:
+    db: dict: de tour database, met bijgewerkte totalen
+    traveldir: string: datadir
+    changed: list: keys van gewijzigde records. None = opnieuw opbouwen.
+
+    returns None
+    '''
+    name = db['tour']['naam']
+    path = sums_file(traveldir, name)
+    fromiso = datetime.date.fromisoformat
+    ordinals = sorted(fromiso(key).toordinal() for key in changed or ())
+    rows = None
+    if ordinals:
+        try:
+            with PrefixSums(path) as sums:
+                base, slots = sums.base, sums.slots
+                if slots > 0 and ordinals[0] >= base:
+                    # rijen vanaf de eerste gewijzigde dag, die rij is het startpunt
+                    start = min(ordinals[0] - base, slots)
+                    sums.file.seek(HEAD.size + start * ROW.size)
+                    rows = array('d')
+                    rows.frombytes(sums.file.read())
+        except (FileNotFoundError, struct.error, ValueError):
+            pass
+    if rows is None:
+        # geen bestand, alles gewijzigd of een dag voor het begin
+        write(traveldir, name, *build(db))
+        return
+    width = len(FIELDS)
+    for ordinal in ordinals:
+        i = (ordinal - base - start) * width
+        # een nieuwe dag na het eind: rijen aanvullen met de laatste rij
+        while len(rows) < i + 2 * width:
+            rows.extend(rows[-width:])
+        old = [b - a for a, b in zip(rows[i:i + width], rows[i + width:i + 2 * width])]
+        new = day_values(db[datetime.date.fromordinal(ordinal).isoformat()])
+        delta = [n - o for n, o in zip(new, old)]
+        for j in range(i + width, len(rows), width):
+            for k in range(width):
+                rows[j + k] += delta[k]
+    if not matches(rows[-width:], travel_stats.get_totals(db)):
+        write(traveldir, name, *build(db))
+        return
+    with open(path, 'r+b') as outfile:
+        # vooruit schrijven: bij een afgebroken schrijfactie klopt de laatste
+        # rij niet en wordt het bestand bij het openen opnieuw opgebouwd
+        outfile.seek(HEAD.size + start * ROW.size)
+        rows.tofile(outfile)
+
+
+def print_window(info, sums, n):
+    ''' Print de sommen over de laatste n dagen en het budget verbruik.
+
+    keyword arguments:
+    info: dict: de tour header
+    sums: PrefixSums
+    n: int: aantal dagen
+
+    returns None
+    '''
+    van, tot, window = sums.last_days(n)
+    if van is None:
+        print(':: Nog geen dagen in deze tour.')
+        return
+    # een tour korter dan n dagen: delen door de dagen die er zijn
+    van = max(van, sums.first())
+    dagen = (tot - van).days + 1
+    kosten = window['eten'] + window['hotel'] + window['anders']
+    print('Laatste {} dagen ({} - {}):'.format(dagen, van, tot))
+    print('  {} dagen, {} fietsdagen, {} km, {} km per fietsdag'.format(
+        window['records'], window['fietsdagen'], window['afstand'],
+        window['afstand'] // window['fietsdagen'] if window['fietsdagen'] else 0))
+    print('  Eten € {:.2f}  Hotel € {:.2f}  Anders € {:.2f}  Totaal € {:.2f}  '
+          '(€ {:.2f} per dag)'.format(window['eten'], window['hotel'],
+                                      window['anders'], kosten, kosten / dagen))
+    if info.get('budget'):
+        total = sums.row(sums.slots)
+        rest = info['budget'] - sum(total[3:])
+        line = '  Budget resterend € {:.2f}'.format(rest)
+        if kosten > 0:
+            line += ', bij dit tempo op na {:.0f} dagen'.format(max(rest, 0) / (kosten / dagen))
+        print(line)
+
+
+def print_periods(sums, group):
+    ''' Print de sommen per week, maand of jaar.
+
+    keyword arguments:
+    sums: PrefixSums
+    group: string: 'week', 'month' of 'year'
+
+    returns None
+    '''
+    line = '{:10} {:>6} {:>6} {:>9} {:>10} {:>10} {:>10} {:>11}'
+    print(line.format({'week': 'Week', 'month': 'Maand', 'year': 'Jaar'}[group],
+                      'Dagen', 'Fiets', 'Km', 'Eten €', 'Hotel €', 'Anders €',
+                      'Totaal €'))
+    numbers = '{:10} {:6} {:6} {:9} {:10.2f} {:10.2f} {:10.2f} {:11.2f}'
+    for label, window in sums.periods(group):
+        print(numbers.format(label, window['records'], window['fietsdagen'],
+                             window['afstand'], window['eten'], window['hotel'],
+                             window['anders'],
+                             window['eten'] + window['hotel'] + window['anders']))
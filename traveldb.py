@@ -2,10 +2,10 @@
 # traveldb.py
 # Database voor travel
 
-import json
 import os
 import datetime
-import json_serializer
+import travel_model
+import travel_storage
 
 
 version = '1.0'
@@ -44,7 +44,7 @@ def validate_datum(datum):
                           month=datumList[1],
                           year=datumList[0])
     else:
-        raise DatumError('DatumError: Verkeerd datumformaat. \ 
+        raise DatumError('DatumError: Verkeerd datumformaat. \
                 Correcte input is: YYYY-[M]M-[D]D, [M]M-[]DD, [D]D')
 
 
@@ -102,42 +102,41 @@ def new_tour(name):
 
 
 class TravelDB():
-    # Database, dict met datum als key.
+    # Database: tour is een travel_model.Tour, data de dict view daarvan
+    # met datum als key.
     
-    def __init__(self, tour, datadir):
+    def __init__(self, tour, datadir, backend='json'):
         '''Initialisatie opent de database en leest config.
 
         keyword arguments:
         tour: string; naam van de tour om te openen.
         datadir: string; directory waar de tours zijn opgeslagen.
+        backend: string; opslag voor een nieuwe tour (zie travel_storage).
 
         returns None
         '''
         self.datadir = datadir
         self.tourname = tour
+        self.storage = travel_storage.get_storage(tour, datadir, backend)
         try:
-            with open(os.path.join(datadir, tour + '.json'), 'r', encoding='utf-8') as infile:
-                self.data = json.load(infile, object_hook=json_serializer.from_json)
+            self.tour = travel_model.Tour.load(tour, datadir)
         except FileNotFoundError:
             # tour bestaat niet
             if not os.path.exists(datadir):
                 os.mkdir(datadir)
-            self.data = new_tour(tour)
+            self.tour = travel_model.Tour(new_tour(tour))
+        self.data = self.tour.to_db()
 
-    def save(self):
-    '''Schrijft de database naar disk.
+    def save(self, changed=None):
+        '''Schrijft de database naar disk.
     
-    keyword arguments:
-
-    returns None
-    '''
-    if input('Wijzigingen opslaan? J/n: ').lower() in ('j',''):
-        with open(os.path.join(self.datadir, self.tourname + '.json'), 'w', encoding='utf-8') as outfile:
-            json.dump(self.data, outfile, default=json_serializer.to_json)
-            print(': Tour: {} is opgeslagen.'.format(db['tour']['naam']))
-    else:
-        print(': Er is niets opgeslagen!')
-    
-
-if __name__ == '__main__':
+        keyword arguments:
+        changed: list: keys van gewijzigde records. None = alles schrijven.
 
+        returns None
+        '''
+        if input('Wijzigingen opslaan? J/n: ').lower() in ('j',''):
+            self.storage.save(self.data, changed)
+            print(': Tour: {} is opgeslagen.'.format(self.data['tour']['naam']))
+        else:
+            print(': Er is niets opgeslagen!')